@@ -0,0 +1,144 @@
+"""
+Bulk import benchmark
+
+Imports generated ridges with peaks, routes, sections and points
+into empty database: one object per commit with slug queries, as
+the add endpoints do, and by BulkImport.
+
+Run from the project root (SQLite in memory by default):
+    python -m app.benchmarks.bulk_import [database url]
+"""
+
+import sys
+import time
+
+from slugify import slugify
+from sqlalchemy import create_engine
+from sqlmodel import Session, SQLModel, select
+
+import app.models.users  # noqa: F401  (api_user table for foreign keys)
+from app.bulk import BulkImport
+from app.models.mountains import GeoPoint, Peak, Ridge, Route, RoutePoint, RouteSection
+
+RIDGES = 5
+PEAKS = 20
+ROUTES = 4
+SECTIONS = 6
+POINTS = 40
+
+
+def build_documents() -> list:
+    """ridge documents with nested peaks, routes, sections and points"""
+    return [
+        {
+            "type": "ridge",
+            "name": f"Ridge {r}",
+            "peaks": [
+                {
+                    "name": f"Peak {r} {p}",
+                    "height": 1500 + p,
+                    "point": {"latitude": 48 + p / 100, "longitude": 24 + r / 100},
+                    "routes": [
+                        {
+                            "name": f"Route {r} {p} {k}",
+                            "difficulty": "2A",
+                            "sections": [
+                                {"num": n, "description": f"Section {n}", "length": 50}
+                                for n in range(SECTIONS)
+                            ],
+                            "points": [
+                                {"latitude": 48 + n / 1e4, "longitude": 24 + n / 1e4}
+                                for n in range(POINTS)
+                            ],
+                        }
+                        for k in range(ROUTES)
+                    ],
+                }
+                for p in range(PEAKS)
+            ],
+        }
+        for r in range(RIDGES)
+    ]
+
+
+def unique_slug(session: Session, model, name: str) -> str:
+    """unique slug found by a query per attempt (like unique_slugify did)"""
+    slug = slugify(name)
+    for k in range(100):
+        _slug = f"{slug}-{k}" if k else slug
+        if not session.exec(select(model).where(model.slug == _slug)).first():
+            return _slug
+    return slug
+
+
+def import_one_by_one(session: Session, documents: list):
+    """import objects one by one with commit after each of them"""
+    for ridge_doc in documents:
+        ridge = Ridge(name=ridge_doc["name"], slug=unique_slug(session, Ridge, ridge_doc["name"]))
+        session.add(ridge)
+        session.commit()
+        for peak_doc in ridge_doc["peaks"]:
+            point = GeoPoint(**peak_doc["point"])
+            session.add(point)
+            session.commit()
+            peak = Peak(
+                name=peak_doc["name"],
+                height=peak_doc["height"],
+                ridge_id=ridge.id,
+                point_id=point.id,
+                slug=unique_slug(session, Peak, peak_doc["name"]),
+            )
+            session.add(peak)
+            session.commit()
+            for route_doc in peak_doc["routes"]:
+                route = Route(
+                    name=route_doc["name"],
+                    difficulty=route_doc["difficulty"],
+                    peak_id=peak.id,
+                    slug=unique_slug(session, Route, route_doc["name"]),
+                )
+                session.add(route)
+                session.commit()
+                for section_doc in route_doc["sections"]:
+                    session.add(RouteSection(route_id=route.id, **section_doc))
+                    session.commit()
+                for point_doc in route_doc["points"]:
+                    point = GeoPoint(**point_doc)
+                    session.add(point)
+                    session.commit()
+                    session.add(RoutePoint(route_id=route.id, point_id=point.id))
+                    session.commit()
+
+
+def measure(title: str, url: str, run, objects: int):
+    """run import into new database and print objects per second"""
+    engine = create_engine(url)
+    SQLModel.metadata.drop_all(engine)
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        started = time.perf_counter()
+        run(session)
+        seconds = time.perf_counter() - started
+    engine.dispose()
+    print(f"{title:<20} {seconds:8.2f} s {objects / seconds:12.0f} objects/s")
+
+
+def main():
+    """run benchmark"""
+    url = sys.argv[1] if len(sys.argv) > 1 else "sqlite://"
+    documents = build_documents()
+    routes = RIDGES * PEAKS * ROUTES
+    objects = RIDGES + RIDGES * PEAKS + routes * (1 + SECTIONS + POINTS)
+    print(f"{objects} objects, {routes} routes")
+
+    measure("one by one", url, lambda session: import_one_by_one(session, documents), objects)
+    measure(
+        "bulk import",
+        url,
+        lambda session: BulkImport(session).run(enumerate(documents, 1)),
+        objects,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Reverse geocoding benchmark
+
+Builds the city index over generated cities (no database is needed)
+and measures its memory and the latency of the nearest city query:
+the KD-tree of CityIndex against numpy scan of all cities and the
+cities as python objects scanned by min().
+
+Run from the project root:
+    python -m app.benchmarks.geocoding [cities]
+"""
+
+import math
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from app.geocoding import CityIndex, unit_vectors
+
+CITIES = 200000
+QUERIES = 1000
+# Carpathians, where the most of peaks are
+SOUTH, NORTH, WEST, EAST = 44.0, 50.0, 17.0, 27.0
+
+
+def build_cities(count: int) -> tuple:
+    """ids, coordinates, names and countries of random cities"""
+    rng = np.random.default_rng(1)
+    latitudes = rng.uniform(SOUTH, NORTH, count)
+    longitudes = rng.uniform(WEST, EAST, count)
+    names = [f"City {k}".encode() for k in range(count)]
+    return list(range(1, count + 1)), latitudes, longitudes, names, [b"UA"] * count
+
+
+def haversine(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """great circle distance in radians"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * math.asin(math.sqrt(a))
+
+
+def measure(title: str, query, points: np.ndarray):
+    """print mean latency of the query"""
+    started = time.perf_counter()
+    for latitude, longitude in points.tolist():
+        query(latitude, longitude)
+    seconds = (time.perf_counter() - started) / len(points)
+    print(f"{title:<20} {seconds * 1e6:10.1f} us/query")
+
+
+def main():
+    """run benchmark"""
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else CITIES
+    columns = build_cities(count)
+    rng = np.random.default_rng(2)
+    points = np.column_stack(
+        (rng.uniform(SOUTH, NORTH, QUERIES), rng.uniform(WEST, EAST, QUERIES))
+    )
+
+    index = CityIndex(None, check_interval=math.inf)
+    started = time.perf_counter()
+    index.build(*columns)
+    print(f"{count} cities, index built in {time.perf_counter() - started:.2f} s")
+    print(f"{'index':<20} {index.nbytes() / 2**20:10.1f} MiB")
+
+    tracemalloc.start()
+    cities = [
+        {"id": city_id, "name": name.decode(), "latitude": latitude, "longitude": longitude}
+        for city_id, latitude, longitude, name in zip(
+            columns[0], columns[1].tolist(), columns[2].tolist(), columns[3]
+        )
+    ]
+    print(f"{'python objects':<20} {tracemalloc.get_traced_memory()[0] / 2**20:10.1f} MiB")
+    tracemalloc.stop()
+
+    vectors = unit_vectors(columns[1], columns[2]).astype(np.float32)
+
+    def numpy_scan(latitude, longitude):
+        target = unit_vectors(latitude, longitude).astype(np.float32)
+        return int(np.argmin(np.sum((vectors - target) ** 2, axis=1)))
+
+    def python_scan(latitude, longitude):
+        return min(
+            cities,
+            key=lambda city: haversine(latitude, longitude, city["latitude"], city["longitude"]),
+        )
+
+    measure("kd-tree", index.nearest, points)
+    measure("numpy scan", numpy_scan, points[:100])
+    measure("python scan", python_scan, points[:5])
+
+
+if __name__ == "__main__":
+    main()
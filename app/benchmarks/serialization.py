@@ -0,0 +1,172 @@
+"""
+Serialization benchmark
+
+Builds the ridge, peaks, routes and photos in memory (no database
+is needed) and measures time of conversion to json: the way of
+response_model (validation of returned model, conversion to python
+data and json.dumps) against single validation by dump_json().
+
+Run from the project root:
+    python -m app.benchmarks.serialization
+"""
+
+import json
+import timeit
+from datetime import datetime
+from typing import List
+
+from app.dependencies import config
+from app.media import media_url
+from app.models.mountains import (
+    GeoPoint,
+    Peak,
+    PeakPhoto,
+    Ridge,
+    Route,
+    RoutePhoto,
+    RoutePoint,
+    RouteSection,
+)
+from app.responses import dump_json, type_adapter
+from app.schema.mountains import PeakListItem, PeakOut, RidgeOut, RouteOut
+
+PEAKS = 200
+PEAK_PHOTOS = 5
+ROUTES = 3
+ROUTE_PHOTOS = 10
+ROUTE_SECTIONS = 30
+ROUTE_POINTS = 200
+
+
+def build_ridge() -> Ridge:
+    """build ridge with peaks, routes and photos"""
+    now = datetime.utcnow()
+    ridge = Ridge(id=1, slug="ridge", name="Ridge", changed=now)
+    for k in range(PEAKS):
+        peak = Peak(
+            id=k + 1,
+            slug=f"peak-{k}",
+            name=f"Peak {k}",
+            height=2000 + k,
+            ridge_id=ridge.id,
+            photo=f"/photos/peak/202501010000/peak-{k}.jpg",
+            changed=now,
+        )
+        peak.photos = [
+            PeakPhoto(id=k * PEAK_PHOTOS + n, photo=f"/photos/peak/202501010000/{k}-{n}.jpg")
+            for n in range(PEAK_PHOTOS)
+        ]
+        for r in range(ROUTES):
+            route = Route(
+                id=k * ROUTES + r + 1,
+                slug=f"route-{k}-{r}",
+                name=f"Route {k} {r}",
+                difficulty="2A",
+                photo=f"/photos/route/202501010000/route-{k}-{r}.jpg",
+                map_image=f"/photos/route/202501010000/map-{k}-{r}.jpg",
+                changed=now,
+            )
+            route.photos = [
+                RoutePhoto(photo=f"/photos/route/202501010000/{k}-{r}-{n}.jpg")
+                for n in range(ROUTE_PHOTOS)
+            ]
+            peak.routes.append(route)
+        ridge.peaks.append(peak)
+    return ridge
+
+
+def build_route() -> Route:
+    """build route with sections, points and photos"""
+    now = datetime.utcnow()
+    peak = Peak(id=1, slug="peak", name="Peak", height=2000, ridge_id=1, changed=now)
+    route = Route(
+        id=1,
+        peak_id=peak.id,
+        peak=peak,
+        slug="route",
+        name="Route",
+        description="Description of the route. " * 40,
+        difficulty="3A",
+        max_difficulty="IV",
+        changed=now,
+    )
+    route.photos = [
+        RoutePhoto(id=n, route_id=route.id, photo=f"/photos/route/202501010000/{n}.jpg")
+        for n in range(ROUTE_PHOTOS)
+    ]
+    route.sections = [
+        RouteSection(
+            id=n,
+            route_id=route.id,
+            num=n,
+            description="Section of the route. " * 5,
+            length=40,
+            difficulty="III",
+        )
+        for n in range(ROUTE_SECTIONS)
+    ]
+    route.routepoints = [
+        RoutePoint(
+            id=n,
+            route_id=route.id,
+            point=GeoPoint(id=n, latitude=48.1 + n / 1e4, longitude=24.5 + n / 1e4),
+        )
+        for n in range(ROUTE_POINTS)
+    ]
+    return route
+
+
+def response_model_json(schema, obj) -> bytes:
+    """json of the handler returning validated model with response_model"""
+    adapter = type_adapter(schema)
+    data = adapter.dump_python(adapter.validate_python(obj, from_attributes=True))
+    return json.dumps(adapter.dump_python(adapter.validate_python(data), mode="json")).encode()
+
+
+def serialize_ridge(ridge: Ridge) -> int:
+    """serialize ridge, every peak and every route"""
+    size = len(RidgeOut.model_validate(ridge).model_dump_json())
+    for peak in ridge.peaks:
+        size += len(PeakOut.model_validate(peak).model_dump_json())
+        for route in peak.routes:
+            size += len(RouteOut.model_validate(route).model_dump_json())
+    return size
+
+
+def report(title: str, number: int, seconds: float):
+    """print result of measurement"""
+    print(f"{title:<40} {seconds / number * 1e6:12.2f} us")
+
+
+def main():
+    """run benchmark"""
+    path = "/photos/peak/202501010000/peak.jpg"
+    number = 100000
+    report(
+        "config('MEDIA_URL') + path",
+        number,
+        timeit.timeit(lambda: f"{config('MEDIA_URL', cast=str)}{path}", number=number),
+    )
+    report("media_url(path)", number, timeit.timeit(lambda: media_url(path), number=number))
+
+    ridge = build_ridge()
+    urls = PEAKS * (1 + PEAK_PHOTOS + ROUTES * (2 + ROUTE_PHOTOS))
+    number = 5
+    seconds = timeit.timeit(lambda: serialize_ridge(ridge), number=number)
+    report(f"ridge, {PEAKS} peaks, {urls} media urls", number, seconds)
+
+    route = build_route()
+    number = 200
+    for title, schema, obj in (
+        (f"ridge, {PEAKS} peaks", RidgeOut, ridge),
+        (f"peaks list, {PEAKS} peaks", List[PeakListItem], ridge.peaks),
+        (f"route, {ROUTE_POINTS} points", RouteOut, route),
+    ):
+        seconds = timeit.timeit(lambda: response_model_json(schema, obj), number=number)
+        report(f"{title}: response_model", number, seconds)
+        seconds = timeit.timeit(lambda: dump_json(schema, obj), number=number)
+        report(f"{title}: dump_json", number, seconds)
+
+
+if __name__ == "__main__":
+    main()
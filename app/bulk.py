@@ -0,0 +1,509 @@
+"""
+Bulk import
+"""
+
+import itertools
+import json
+from datetime import datetime
+from typing import Annotated, Any, Iterable, Iterator, Union
+
+from pydantic import Field, TypeAdapter, ValidationError
+from slugify import slugify
+from sqlalchemy import Table, delete, insert, or_, text, union, update
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import SQLAlchemyError
+from sqlmodel import Session, select
+
+from app.geometry import pack_geometry, pack_levels, simplification_levels, unpack_geometry
+from app.i18n import _
+from app.models.mountains import GeoPoint, Peak, Ridge, Route, RoutePoint, RouteSection, touch
+from app.schema.mountains import (
+    ImportLineError,
+    ImportResult,
+    PeakImport,
+    RidgeImport,
+    RouteBatchResult,
+    RouteImport,
+)
+
+# top level documents per transaction
+IMPORT_CHUNK_SIZE = 200
+# slugs per query looking for existing ones
+SLUG_QUERY_SIZE = 200
+# ids per delete statement
+DELETE_CHUNK_SIZE = 1000
+# route points per insert of batch or track
+POINTS_CHUNK_SIZE = 1000
+# rows per multi-row insert returning ids on MySQL
+INSERT_CHUNK_SIZE = 1000
+
+_DOCUMENT = TypeAdapter(
+    Annotated[Union[RidgeImport, PeakImport, RouteImport], Field(discriminator="type")]
+)
+
+
+def json_documents(data: str | bytes) -> Iterator[tuple[int, Any]]:
+    """numbered documents of json array or single json object"""
+    document = json.loads(data)
+    if not isinstance(document, list):
+        document = [document]
+    yield from enumerate(document, 1)
+
+
+def ndjson_documents(lines: Iterable[str | bytes]) -> Iterator[tuple[int, Any]]:
+    """numbered documents of json lines, the lines are parsed by import"""
+    for number, line in enumerate(lines, 1):
+        if line.strip():
+            yield number, line
+
+
+def insert_ids(connection: Connection, table: Table, rows: list) -> list:
+    """
+    insert rows and return their ids in the same order
+
+    One statement with RETURNING if the dialect guarantees the order
+    of returned rows (SQLite, PostgreSQL, MariaDB). MySQL has no
+    RETURNING: rows are inserted by multi-row statements, the first
+    id of the statement is LAST_INSERT_ID() and InnoDB gives the rows
+    of such a simple insert consecutive ids (by auto_increment_increment)
+    in every autoinc lock mode.
+    """
+    if not rows:
+        return []
+    if connection.dialect.insert_executemany_returning_sort_by_parameter_order:
+        statement = insert(table).returning(table.c.id, sort_by_parameter_order=True)
+        return list(connection.execute(statement, rows).scalars())
+    step = _autoincrement_step(connection)
+    ids = []
+    for start in range(0, len(rows), INSERT_CHUNK_SIZE):
+        end = start + INSERT_CHUNK_SIZE
+        part = rows[start:end]
+        first = connection.execute(insert(table).values(part)).lastrowid
+        ids.extend(range(first, first + len(part) * step, step))
+    return ids
+
+
+def _autoincrement_step(connection: Connection) -> int:
+    """auto_increment_increment of MySQL server, kept in info of the connection"""
+    info = connection.connection.info
+    if "autoincrement_step" not in info:
+        step = connection.execute(text("SELECT @@auto_increment_increment")).scalar()
+        info["autoincrement_step"] = int(step)
+    return info["autoincrement_step"]
+
+
+def insert_route_points(connection: Connection, points: list, returning: bool = False) -> list:
+    """
+    insert geo points and route points for them
+
+    Args:
+        connection (Connection): Connection of the transaction.
+        points (list): Pairs of route id and PointImport.
+        returning (bool): Get ids of the route points, without them
+            route points are inserted by one executemany statement.
+
+    Returns:
+        list: Ids of the route points, empty without returning.
+    """
+    if not points:
+        return []
+    point_ids = insert_ids(
+        connection,
+        GeoPoint.__table__,
+        [{"latitude": point.latitude, "longitude": point.longitude} for _id, point in points],
+    )
+    rows = [
+        {"route_id": route_id, "point_id": point_id, "description": point.description}
+        for (route_id, point), point_id in zip(points, point_ids)
+    ]
+    if returning:
+        return insert_ids(connection, RoutePoint.__table__, rows)
+    connection.execute(insert(RoutePoint.__table__), rows)
+    return []
+
+
+def delete_route_points(connection: Connection, route_id: int) -> int:
+    """
+    delete points of the route with their geo points, return number of points
+
+    Geo points used by peaks or by points of other routes are kept.
+    """
+    point_ids = (
+        connection.execute(select(RoutePoint.point_id).where(RoutePoint.route_id == route_id))
+        .scalars()
+        .all()
+    )
+    connection.execute(delete(RoutePoint).where(RoutePoint.route_id == route_id))
+    geo_ids = list({point_id for point_id in point_ids if point_id is not None})
+    for start in range(0, len(geo_ids), DELETE_CHUNK_SIZE):
+        end = start + DELETE_CHUNK_SIZE
+        part = geo_ids[start:end]
+        used = union(
+            select(Peak.point_id).where(Peak.point_id.in_(part)),
+            select(RoutePoint.point_id).where(RoutePoint.point_id.in_(part)),
+        )
+        connection.execute(
+            delete(GeoPoint).where(GeoPoint.id.in_(part), GeoPoint.id.not_in(used))
+        )
+    return len(point_ids)
+
+
+def add_route_points(
+    session: Session,
+    route_id: int,
+    points: Iterable,
+    replace: bool = False,
+    returning: bool = False,
+    track: bool = False,
+):
+    """
+    add points to the route in one transaction
+
+    Points are inserted by chunks, so they can be read from a stream.
+
+    Args:
+        session (Session): Database session.
+        route_id (int): Id of existing route.
+        points: PointImport objects in the order of the track.
+        replace (bool): Delete existing points of the route first.
+        returning (bool): Get ids of added points.
+        track (bool): The points are the track of the route, its packed
+            geometry is dropped, so it is not read instead of them.
+
+    Returns:
+        RouteBatchResult: Number of deleted and added points, ids of them.
+    """
+    connection = session.connection()
+    deleted = delete_route_points(connection, route_id) if replace else 0
+    if track:
+        connection.execute(
+            update(Route)
+            .where(Route.id == route_id)
+            .values(geometry=None, geometry_levels=None)
+        )
+    ids, added = [], 0
+    points = iter(points)
+    while chunk := list(itertools.islice(points, POINTS_CHUNK_SIZE)):
+        ids += insert_route_points(connection, [(route_id, point) for point in chunk], returning)
+        added += len(chunk)
+    return _route_changed(session, route_id, deleted, added, ids)
+
+
+def set_route_geometry(session: Session, route_id: int, points: Iterable):
+    """
+    save the track as packed geometry of the route, replacing the old one,
+    with Douglas-Peucker levels of its vertices for simplified tracks
+
+    Args:
+        session (Session): Database session.
+        route_id (int): Id of existing route.
+        points: Latitude and longitude pairs in the order of the track.
+
+    Returns:
+        RouteBatchResult: Number of points in the geometry.
+    """
+    geometry = pack_geometry(points)
+    coordinates = unpack_geometry(geometry)
+    levels = pack_levels(simplification_levels(coordinates)) if geometry else None
+    connection = session.connection()
+    connection.execute(
+        update(Route)
+        .where(Route.id == route_id)
+        .values(geometry=geometry, geometry_levels=levels)
+    )
+    return _route_changed(session, route_id, 0, len(coordinates), [])
+
+
+def add_route_sections(session: Session, route_id: int, sections: list, replace: bool = False):
+    """
+    add sections to the route in one transaction
+
+    Args:
+        session (Session): Database session.
+        route_id (int): Id of existing route.
+        sections (list): SectionImport objects.
+        replace (bool): Delete existing sections of the route first.
+
+    Returns:
+        RouteBatchResult: Number of deleted and ids of added sections.
+    """
+    connection = session.connection()
+    deleted = 0
+    if replace:
+        statement = delete(RouteSection).where(RouteSection.route_id == route_id)
+        deleted = connection.execute(statement).rowcount
+    ids = insert_ids(
+        connection,
+        RouteSection.__table__,
+        [{"route_id": route_id, **section.model_dump()} for section in sections],
+    )
+    return _route_changed(session, route_id, deleted, len(ids), ids)
+
+
+def _route_changed(session: Session, route_id: int, deleted: int, added: int, ids: list):
+    """touch the route and its parents once and commit"""
+    changed = touch(session.connection(), Route, route_id)
+    session.info.setdefault("changed_rows", set()).update(changed)
+    session.commit()
+    return RouteBatchResult(route_id=route_id, deleted=deleted, added=added, ids=ids)
+
+
+class _Item:
+    """document of ridge, peak or route in the chunk"""
+
+    __slots__ = ("line", "doc", "parent", "parent_id", "slug", "id", "failed")
+
+    def __init__(self, line: int, doc, parent: "_Item" = None):
+        self.line = line
+        self.doc = doc
+        self.parent = parent
+        self.parent_id = None
+        self.slug = None
+        self.id = None
+        self.failed = False
+
+    @property
+    def ok(self) -> bool:
+        """the item and its parents are valid"""
+        return not self.failed and (self.parent is None or self.parent.ok)
+
+
+class BulkImport:
+    """
+    Import of ridges, peaks and routes with nested sections and points.
+
+    Documents are validated one by one and imported by chunks: every
+    chunk is one transaction with executemany inserts per table, slugs
+    for the whole chunk are found by a few queries. A document with
+    errors is reported with its line and skipped, the rest is imported.
+    In dry run the documents are validated, parents and slugs are
+    resolved, but nothing is written.
+
+    Attributes:
+        session (Session): Database session.
+        editor_id (int | None): Editor of imported objects.
+        dry_run (bool): Validate only.
+        result (ImportResult): Counters and errors.
+    """
+
+    def __init__(self, session: Session, editor_id: int | None = None, dry_run: bool = False):
+        self.session = session
+        self.editor_id = editor_id
+        self.dry_run = dry_run
+        self.result = ImportResult(dry_run=dry_run)
+
+    def run(self, documents: Iterable[tuple[int, Any]], chunk_size: int = IMPORT_CHUNK_SIZE):
+        """
+        import numbered documents
+
+        Args:
+            documents: Pairs of line number and document, as python
+                data or json text.
+            chunk_size (int): Documents per transaction.
+
+        Returns:
+            ImportResult: Counters of imported objects and errors.
+        """
+        chunk = []
+        for line, raw in documents:
+            try:
+                if isinstance(raw, (str, bytes)):
+                    doc = _DOCUMENT.validate_json(raw)
+                else:
+                    doc = _DOCUMENT.validate_python(raw)
+            except ValidationError as error:
+                self.error(line, str(error))
+                continue
+            chunk.append((line, doc))
+            if len(chunk) >= chunk_size:
+                self.import_chunk(chunk)
+                chunk = []
+        if chunk:
+            self.import_chunk(chunk)
+        self.result.errors.sort(key=lambda error: error.line)
+        return self.result
+
+    def error(self, line: int, detail: str):
+        """add error for the document"""
+        self.result.errors.append(ImportLineError(line=line, detail=detail))
+
+    def import_chunk(self, chunk: list):
+        """import documents in one transaction"""
+        ridges, peaks, routes = [], [], []
+        for line, doc in chunk:
+            if isinstance(doc, RidgeImport):
+                ridge = _Item(line, doc)
+                ridges.append(ridge)
+                for peak_doc in doc.peaks:
+                    peak = _Item(line, peak_doc, ridge)
+                    peaks.append(peak)
+                    routes.extend(_Item(line, route_doc, peak) for route_doc in peak_doc.routes)
+            elif isinstance(doc, PeakImport):
+                peak = _Item(line, doc)
+                peaks.append(peak)
+                routes.extend(_Item(line, route_doc, peak) for route_doc in doc.routes)
+            else:
+                routes.append(_Item(line, doc))
+
+        self.resolve_parents(peaks, Ridge, "ridge", _("Ridge not found"))
+        self.resolve_parents(routes, Peak, "peak", _("Peak not found"))
+        ridges, peaks, routes = (
+            [item for item in items if item.ok] for items in (ridges, peaks, routes)
+        )
+        for model, items in ((Ridge, ridges), (Peak, peaks), (Route, routes)):
+            self.allocate_slugs(model, items)
+
+        if not self.dry_run:
+            try:
+                self.write(ridges, peaks, routes)
+                self.session.commit()
+            except SQLAlchemyError as error:
+                self.session.rollback()
+                detail = _("Chunk is not imported: {}").format(error.__class__.__name__)
+                for line in dict.fromkeys(line for line, _doc in chunk):
+                    self.error(line, detail)
+                return
+
+        self.result.ridges += len(ridges)
+        self.result.peaks += len(peaks)
+        self.result.routes += len(routes)
+        self.result.sections += sum(len(item.doc.sections) for item in routes)
+        self.result.points += sum(len(item.doc.points) for item in routes)
+
+    def resolve_parents(self, items: list, model, field: str, detail: str):
+        """find ids of existing parents by slugs given in top level documents"""
+        top = [item for item in items if item.parent is None]
+        slugs = {getattr(item.doc, field) for item in top} - {None}
+        ids = {}
+        if slugs:
+            statement = select(model.slug, model.id).where(model.slug.in_(slugs))
+            ids = dict(self.session.exec(statement).all())
+        for item in top:
+            item.parent_id = ids.get(getattr(item.doc, field))
+            if item.parent_id is None:
+                item.failed = True
+                self.error(item.line, detail)
+
+    def allocate_slugs(self, model, items: list):
+        """
+        unique slugs for the items
+
+        Existing slugs with the same bases are selected by a few
+        queries, the rest is done in memory (like unique_slugify).
+        """
+        bases = [slugify(item.doc.slug or item.doc.name) for item in items]
+        unique = list(dict.fromkeys(bases))
+        taken = set()
+        for start in range(0, len(unique), SLUG_QUERY_SIZE):
+            end = start + SLUG_QUERY_SIZE
+            part = unique[start:end]
+            condition = or_(model.slug.in_(part), *(model.slug.like(f"{base}-%") for base in part))
+            taken.update(self.session.exec(select(model.slug).where(condition)).all())
+        for item, base in zip(items, bases):
+            slug, k = base, 0
+            while slug in taken:
+                k += 1
+                slug = f"{base}-{k}"
+            taken.add(slug)
+            item.slug = slug
+
+    def write(self, ridges: list, peaks: list, routes: list):
+        """insert the items, parents before children"""
+        connection = self.session.connection()
+        now = datetime.utcnow()
+        common = {"editor_id": self.editor_id, "changed": now}
+
+        self.insert_items(
+            connection,
+            Ridge,
+            ridges,
+            [
+                {"name": item.doc.name, "description": item.doc.description, "active": True}
+                for item in ridges
+            ],
+            common,
+        )
+
+        with_point = [item for item in peaks if item.doc.point]
+        point_ids = insert_ids(
+            connection, GeoPoint.__table__, [item.doc.point.model_dump() for item in with_point]
+        )
+        point_of = dict(zip(map(id, with_point), point_ids))
+        self.insert_items(
+            connection,
+            Peak,
+            peaks,
+            [
+                {
+                    "ridge_id": item.parent.id if item.parent else item.parent_id,
+                    "name": item.doc.name,
+                    "description": item.doc.description,
+                    "height": item.doc.height,
+                    "point_id": point_of.get(id(item)),
+                    "active": True,
+                }
+                for item in peaks
+            ],
+            common,
+        )
+
+        route_fields = set(RouteImport.model_fields) - {
+            "type",
+            "peak",
+            "slug",
+            "sections",
+            "points",
+        }
+        self.insert_items(
+            connection,
+            Route,
+            routes,
+            [
+                {
+                    "peak_id": item.parent.id if item.parent else item.parent_id,
+                    **item.doc.model_dump(include=route_fields),
+                }
+                for item in routes
+            ],
+            common,
+        )
+
+        sections = [
+            {"route_id": item.id, **section.model_dump()}
+            for item in routes
+            for section in item.doc.sections
+        ]
+        if sections:
+            connection.execute(insert(RouteSection.__table__), sections)
+
+        insert_route_points(
+            connection,
+            [(item.id, point) for item in routes for point in item.doc.points],
+            returning=False,
+        )
+
+        # existing parents are changed too, caches are invalidated after commit
+        changed = {(Ridge.__tablename__, item.id) for item in ridges}
+        changed.update((Peak.__tablename__, item.id) for item in peaks)
+        changed.update((Route.__tablename__, item.id) for item in routes)
+        for model, items in ((Ridge, peaks), (Peak, routes)):
+            for parent_id in {item.parent_id for item in items if item.parent is None}:
+                changed.update(touch(connection, model, parent_id, now))
+        self.session.info.setdefault("changed_rows", set()).update(changed)
+
+    def insert_items(self, connection: Connection, model, items: list, rows: list, common: dict):
+        """executemany insert of ridges, peaks or routes, ids are found by slugs"""
+        if not items:
+            return
+        connection.execute(
+            insert(model.__table__),
+            [{"slug": item.slug, **common, **row} for item, row in zip(items, rows)],
+        )
+        slugs = [item.slug for item in items]
+        ids = {}
+        for start in range(0, len(slugs), SLUG_QUERY_SIZE):
+            end = start + SLUG_QUERY_SIZE
+            statement = select(model.slug, model.id).where(model.slug.in_(slugs[start:end]))
+            ids.update(connection.execute(statement).all())
+        for item in items:
+            item.id = ids[item.slug]
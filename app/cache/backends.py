@@ -0,0 +1,492 @@
+"""
+Cache backends
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime
+
+from fastapi import Request, Response
+
+from app.conditional import is_not_modified, validator_headers
+
+try:
+    import redis
+except ImportError:  # redis is needed only for RedisBackend
+    redis = None
+
+ALL = "*"
+
+
+class CacheEntry:
+    """
+    Serialized response with its validators and tags.
+
+    Tags name the objects the response was built from, e.g.
+    "route:12" or "ridge" for the list of ridges.
+    """
+
+    __slots__ = ("body", "tags", "etag", "modified")
+
+    def __init__(
+        self,
+        body: bytes,
+        tags=(),
+        etag: str | None = None,
+        modified: datetime | None = None,
+    ):
+        self.body = body
+        self.tags = frozenset(tags)
+        self.etag = etag or f'"{hashlib.sha1(body).hexdigest()}"'
+        self.modified = modified
+
+    def response(self, request: Request) -> Response:
+        """json response or 304 if the client has actual version"""
+        headers = validator_headers(self.etag, self.modified)
+        headers["Vary"] = "Accept-Language"
+        if is_not_modified(request.headers, self.etag, self.modified):
+            return Response(status_code=304, headers=headers)
+        return Response(self.body, media_type="application/json", headers=headers)
+
+    def dumps(self) -> str:
+        """validators and tags as json"""
+        return json.dumps(
+            {
+                "tags": sorted(self.tags),
+                "etag": self.etag,
+                "modified": self.modified.isoformat() if self.modified else None,
+            }
+        )
+
+    @classmethod
+    def loads(cls, body: bytes, meta: str) -> "CacheEntry":
+        """entry from body and json made by dumps()"""
+        data = json.loads(meta)
+        modified = data["modified"]
+        return cls(
+            body,
+            tags=data["tags"],
+            etag=data["etag"],
+            modified=datetime.fromisoformat(modified) if modified else None,
+        )
+
+
+class CacheBackend(ABC):
+    """
+    Storage of cache entries.
+
+    Every invalidation increments generation of the invalidated
+    tags and the common generation ALL. An entry stored when some
+    of its tags had older generation is outdated. A response built
+    while the common generation has changed is not stored, because
+    it may be built from data that is already changed.
+
+    Attributes:
+        blocking (bool): Calls may wait for disk or network, the
+            cache makes them out of the event loop.
+    """
+
+    blocking = True
+
+    @abstractmethod
+    def get(self, key: str) -> CacheEntry | None:
+        """get actual entry"""
+
+    @abstractmethod
+    def set(self, key: str, entry: CacheEntry, generation: int | None = None) -> bool:
+        """store entry if common generation is still equal to generation, True if stored"""
+
+    @abstractmethod
+    def invalidate(self, tags):
+        """make all entries with any of the tags outdated"""
+
+    @abstractmethod
+    def generation(self, tag: str = ALL) -> int:
+        """current generation of the tag"""
+
+    @abstractmethod
+    def clear(self):
+        """drop all entries"""
+
+    @abstractmethod
+    def stats(self) -> dict:
+        """size of the storage"""
+
+
+class MemoryBackend(CacheBackend):
+    """
+    LRU storage in memory of the process.
+
+    Limited by number of entries and by total size of bodies.
+    Invalidated entries are dropped at once.
+    """
+
+    blocking = False
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._tags = {}
+        self._generations = {}
+        self._bytes = 0
+        self._evictions = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> CacheEntry | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, entry: CacheEntry, generation: int | None = None) -> bool:
+        with self._lock:
+            if generation is not None and generation != self._generations.get(ALL, 0):
+                return False
+            if len(entry.body) > self.max_bytes:
+                return False
+            self._remove(key)
+            self._entries[key] = entry
+            self._bytes += len(entry.body)
+            for tag in entry.tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self._evictions += 1
+            return key in self._entries
+
+    def invalidate(self, tags):
+        with self._lock:
+            for tag in (*tags, ALL):
+                self._generations[tag] = self._generations.get(tag, 0) + 1
+                if tag == ALL:
+                    continue
+                for key in self._tags.pop(tag, ()):
+                    self._remove(key)
+
+    def generation(self, tag: str = ALL) -> int:
+        return self._generations.get(tag, 0)
+
+    def clear(self):
+        with self._lock:
+            self._generations[ALL] = self._generations.get(ALL, 0) + 1
+            self._entries.clear()
+            self._tags.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "evictions": self._evictions,
+            }
+
+    def _remove(self, key: str):
+        """remove entry, the lock must be held"""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._bytes -= len(entry.body)
+        for tag in entry.tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+
+class SQLiteBackend(CacheBackend):
+    """
+    Storage in local SQLite file shared by all workers of the node.
+
+    The database is read through memory map and works in WAL mode,
+    so readers of all processes do not block each other and the
+    writer. Generations of tags are kept in the same file and are
+    incremented in one transaction, so invalidation is atomic and
+    visible for all workers at once. When the storage is over the
+    limits, the oldest stored entries are dropped.
+
+    Storing waits for the lock of other writer at most STORE_TIMEOUT
+    seconds and gives up, the entry is built again by next request.
+    """
+
+    MMAP_SIZE = 256 * 1024 * 1024
+    TIMEOUT = 5
+    STORE_TIMEOUT = 0.05
+
+    def __init__(self, path: str, max_entries: int, max_bytes: int):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connection() as connection:
+            connection.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS entry (
+                    key TEXT PRIMARY KEY,
+                    body BLOB NOT NULL,
+                    meta TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    stored REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS entry_stored ON entry (stored);
+                CREATE TABLE IF NOT EXISTS entry_tag (
+                    key TEXT NOT NULL,
+                    tag TEXT NOT NULL,
+                    generation INTEGER NOT NULL,
+                    PRIMARY KEY (key, tag)
+                );
+                CREATE INDEX IF NOT EXISTS entry_tag_tag ON entry_tag (tag);
+                CREATE TABLE IF NOT EXISTS generation (
+                    tag TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL
+                );
+                """
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        """connection of the current thread"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=self.TIMEOUT, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(f"PRAGMA mmap_size={self.MMAP_SIZE}")
+            self._local.connection = connection
+        return connection
+
+    def get(self, key: str) -> CacheEntry | None:
+        row = self._connection().execute(
+            """
+            SELECT e.body, e.meta, EXISTS (
+                SELECT 1 FROM entry_tag t
+                LEFT JOIN generation g ON g.tag = t.tag
+                WHERE t.key = e.key AND COALESCE(g.value, 0) != t.generation
+            )
+            FROM entry e WHERE e.key = ?
+            """,
+            (key,),
+        ).fetchone()
+        if row is None or row[2]:
+            return None
+        return CacheEntry.loads(row[0], row[1])
+
+    def set(self, key: str, entry: CacheEntry, generation: int | None = None) -> bool:
+        if len(entry.body) > self.max_bytes:
+            return False
+        connection = self._connection()
+        connection.execute(f"PRAGMA busy_timeout={int(self.STORE_TIMEOUT * 1000)}")
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+        except sqlite3.OperationalError:
+            # locked by other writer
+            return False
+        finally:
+            connection.execute(f"PRAGMA busy_timeout={self.TIMEOUT * 1000}")
+        try:
+            if generation is not None and generation != self._generation(connection, ALL):
+                connection.execute("ROLLBACK")
+                return False
+            connection.execute("DELETE FROM entry_tag WHERE key = ?", (key,))
+            connection.execute(
+                "INSERT OR REPLACE INTO entry (key, body, meta, size, stored)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (key, entry.body, entry.dumps(), len(entry.body), time.time()),
+            )
+            connection.executemany(
+                "INSERT INTO entry_tag (key, tag, generation) VALUES (?, ?, ?)",
+                [(key, tag, self._generation(connection, tag)) for tag in entry.tags],
+            )
+            self._trim(connection)
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return True
+
+    def invalidate(self, tags):
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.executemany(
+                "INSERT INTO generation (tag, value) VALUES (?, 1)"
+                " ON CONFLICT (tag) DO UPDATE SET value = value + 1",
+                [(tag,) for tag in {*tags, ALL}],
+            )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def generation(self, tag: str = ALL) -> int:
+        return self._generation(self._connection(), tag)
+
+    def clear(self):
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute("DELETE FROM entry")
+            connection.execute("DELETE FROM entry_tag")
+            connection.execute(
+                "INSERT INTO generation (tag, value) VALUES (?, 1)"
+                " ON CONFLICT (tag) DO UPDATE SET value = value + 1",
+                (ALL,),
+            )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def stats(self) -> dict:
+        entries, size = self._connection().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entry"
+        ).fetchone()
+        return {"entries": entries, "bytes": size}
+
+    @staticmethod
+    def _generation(connection: sqlite3.Connection, tag: str) -> int:
+        """generation of the tag"""
+        row = connection.execute(
+            "SELECT value FROM generation WHERE tag = ?", (tag,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def _trim(self, connection: sqlite3.Connection):
+        """drop outdated entries, then the oldest ones, if the storage is over the limits"""
+        entries, size = connection.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entry"
+        ).fetchone()
+        if entries <= self.max_entries and size <= self.max_bytes:
+            return
+        connection.execute(
+            """
+            DELETE FROM entry WHERE key IN (
+                SELECT t.key FROM entry_tag t
+                LEFT JOIN generation g ON g.tag = t.tag
+                WHERE COALESCE(g.value, 0) != t.generation
+            )
+            """
+        )
+        entries, size = connection.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entry"
+        ).fetchone()
+        oldest = []
+        for key, entry_size in connection.execute(
+            "SELECT key, size FROM entry ORDER BY stored"
+        ):
+            if entries <= self.max_entries and size <= self.max_bytes:
+                break
+            oldest.append((key,))
+            entries -= 1
+            size -= entry_size
+        connection.executemany("DELETE FROM entry WHERE key = ?", oldest)
+        connection.execute(
+            "DELETE FROM entry_tag WHERE key NOT IN (SELECT key FROM entry)"
+        )
+
+
+class RedisBackend(CacheBackend):
+    """
+    Storage in Redis or in a Redis compatible server.
+
+    Generations of tags are counters incremented by INCR. Entries
+    expire after ttl seconds, the server evicts them by its own
+    maxmemory policy.
+    """
+
+    PREFIX = "carpaty:cache:"
+
+    def __init__(self, url: str, ttl: int = 24 * 3600):
+        if redis is None:
+            raise RuntimeError("redis package is required for RedisBackend")
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+
+    def _entry_key(self, key: str) -> str:
+        return f"{self.PREFIX}entry:{key}"
+
+    def _generation_key(self, tag: str) -> str:
+        return f"{self.PREFIX}generation:{tag}"
+
+    def get(self, key: str) -> CacheEntry | None:
+        body, meta, generations = self.client.hmget(
+            self._entry_key(key), "body", "meta", "generations"
+        )
+        if body is None:
+            return None
+        generations = json.loads(generations)
+        if generations:
+            current = self.client.mget([self._generation_key(tag) for tag in generations])
+            if [int(value or 0) for value in current] != list(generations.values()):
+                return None
+        return CacheEntry.loads(body, meta)
+
+    def set(self, key: str, entry: CacheEntry, generation: int | None = None) -> bool:
+        tags = sorted(entry.tags)
+        with self.client.pipeline() as pipe:
+            try:
+                pipe.watch(self._generation_key(ALL))
+                if generation is not None and generation != int(
+                    pipe.get(self._generation_key(ALL)) or 0
+                ):
+                    return False
+                current = pipe.mget([self._generation_key(tag) for tag in tags]) if tags else []
+                generations = {tag: int(value or 0) for tag, value in zip(tags, current)}
+                pipe.multi()
+                pipe.hset(
+                    self._entry_key(key),
+                    mapping={
+                        "body": entry.body,
+                        "meta": entry.dumps(),
+                        "generations": json.dumps(generations),
+                    },
+                )
+                pipe.expire(self._entry_key(key), self.ttl)
+                pipe.execute()
+            except redis.WatchError:
+                return False
+        return True
+
+    def invalidate(self, tags):
+        with self.client.pipeline(transaction=True) as pipe:
+            for tag in {*tags, ALL}:
+                pipe.incr(self._generation_key(tag))
+            pipe.execute()
+
+    def generation(self, tag: str = ALL) -> int:
+        return int(self.client.get(self._generation_key(tag)) or 0)
+
+    def clear(self):
+        for key in self.client.scan_iter(f"{self.PREFIX}entry:*"):
+            self.client.delete(key)
+        self.client.incr(self._generation_key(ALL))
+
+    def stats(self) -> dict:
+        return {"entries": sum(1 for _ in self.client.scan_iter(f"{self.PREFIX}entry:*"))}
+
+
+def create_backend(name: str, url: str, max_entries: int, max_bytes: int) -> CacheBackend:
+    """
+    create backend by name
+
+    Args:
+        name (str): "memory", "sqlite" or "redis".
+        url (str): Path to SQLite file or url of Redis server.
+    """
+    if name == "memory":
+        return MemoryBackend(max_entries, max_bytes)
+    if name == "sqlite":
+        return SQLiteBackend(url, max_entries, max_bytes)
+    if name == "redis":
+        return RedisBackend(url)
+    raise ValueError(f"Unknown cache backend: {name}")
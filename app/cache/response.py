@@ -0,0 +1,175 @@
+"""
+Response cache
+"""
+
+import os
+import tempfile
+import threading
+from urllib.parse import urlencode
+
+import anyio
+from fastapi import Request, Response
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.cache.backends import CacheBackend, CacheEntry, create_backend
+from app.cache.singleflight import SingleFlight
+from app.conditional import is_not_modified, validator_headers
+from app.dependencies import config
+from app.i18n import get_language
+
+_BACKEND = config("RESPONSE_CACHE_BACKEND", cast=str, default="memory")
+_URL = config(
+    "RESPONSE_CACHE_URL",
+    cast=str,
+    default=os.path.join(tempfile.gettempdir(), "carpaty-responses.sqlite"),
+)
+_MAX_ENTRIES = config("RESPONSE_CACHE_MAX_ENTRIES", cast=int, default=1000)
+_MAX_BYTES = config("RESPONSE_CACHE_MAX_BYTES", cast=int, default=64 * 1024 * 1024)
+
+
+class ResponseCache:
+    """
+    Cache of serialized responses.
+
+    The entry is found by path, query and language of the request.
+    Every entry is stored with its tags, and writes to the database
+    invalidate all entries with tags of changed rows (see row_tags).
+    Entries are kept by backend: in memory of the process, in SQLite
+    file shared by workers of the node or in Redis.
+    Concurrent identical requests missing the cache are coalesced:
+    the response is built once and shared by all of them.
+
+    Attributes:
+        backend (CacheBackend): Storage of entries.
+        flight (SingleFlight): Builds in progress.
+    """
+
+    def __init__(self, backend: CacheBackend):
+        self.backend = backend
+        self.flight = SingleFlight()
+        self._lock = threading.Lock()
+        self._stats = dict.fromkeys(("hits", "misses", "stores", "invalidations"), 0)
+
+    @staticmethod
+    def key(request: Request) -> str:
+        """cache key for the request"""
+        query = urlencode(sorted(request.query_params.multi_items()))
+        return f"{request.url.path}?{query}#{get_language(request)}"
+
+    def get(self, key: str) -> CacheEntry | None:
+        """get entry"""
+        entry = self.backend.get(key)
+        self._count("misses" if entry is None else "hits")
+        return entry
+
+    def set(self, key: str, entry: CacheEntry, generation: int | None = None):
+        """
+        store entry
+
+        If generation is set and invalidation has happened since,
+        the entry may be outdated and is not stored.
+        """
+        if self.backend.set(key, entry, generation):
+            self._count("stores")
+
+    def invalidate(self, tags):
+        """invalidate all entries with any of the tags"""
+        self.backend.invalidate(tags)
+        self._count("invalidations")
+
+    def clear(self):
+        """drop all entries"""
+        self.backend.clear()
+
+    def stats(self) -> dict:
+        """counters of the cache in this process and size of the storage"""
+        with self._lock:
+            stats = dict(self._stats)
+        return {**stats, **self.flight.stats(), **self.backend.stats()}
+
+    def build_entry(self, key: str, build) -> CacheEntry:
+        """build entry and store it"""
+        generation = self.backend.generation()
+        entry = build()
+        self.set(key, entry, generation)
+        return entry
+
+    async def respond(self, request: Request, build, version=None) -> Response:
+        """
+        get response from cache or build and store it
+
+        The build runs in a worker thread, requests with the same key
+        arriving meanwhile wait for it (see SingleFlight).
+
+        Args:
+            request (Request): The incoming request.
+            build (Callable): Function returning CacheEntry.
+            version (Callable): Optional cheap function returning ETag
+                and time of change. It is used on cache miss to answer
+                conditional request without building the response.
+
+        Returns:
+            Response: Json response or 304.
+        """
+        key = self.key(request)
+        entry = await self._call(self.get, key)
+        if entry is None:
+            if version is not None and (
+                "if-none-match" in request.headers or "if-modified-since" in request.headers
+            ):
+                etag, modified = await self._call(version)
+                if is_not_modified(request.headers, etag, modified):
+                    headers = validator_headers(etag, modified)
+                    headers["Vary"] = "Accept-Language"
+                    return Response(status_code=304, headers=headers)
+            entry = await self.flight.do(key, lambda: self.build_entry(key, build))
+        return entry.response(request)
+
+    async def _call(self, func, *args):
+        """call func out of the event loop if the backend may block"""
+        if self.backend.blocking:
+            return await anyio.to_thread.run_sync(func, *args)
+        return func(*args)
+
+    def _count(self, name: str):
+        """increment counter"""
+        with self._lock:
+            self._stats[name] += 1
+
+
+def row_tags(rows) -> set:
+    """tags of changed rows: "route:12" and "route" for every (table, id)"""
+    tags = set()
+    for table, row_id in rows:
+        tags.add(table)
+        tags.add(f"{table}:{row_id}")
+    return tags
+
+
+response_cache = ResponseCache(
+    create_backend(_BACKEND, _URL, _MAX_ENTRIES, _MAX_BYTES)
+)
+_ROW_LISTENERS = []
+
+
+def listen_changed_rows(listener):
+    """call listener with (table, id) of rows changed by every committed transaction"""
+    _ROW_LISTENERS.append(listener)
+    return listener
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_changed_rows(session):
+    """drop responses built from rows changed in the committed transaction"""
+    rows = session.info.pop("changed_rows", None)
+    if rows:
+        response_cache.invalidate(row_tags(rows))
+        for listener in _ROW_LISTENERS:
+            listener(rows)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _forget_changed_rows(session, previous_transaction):
+    """rows of rolled back transaction are not changed"""
+    session.info.pop("changed_rows", None)
@@ -0,0 +1,69 @@
+"""
+Single-flight
+"""
+
+import asyncio
+from typing import Any, Callable
+
+import anyio
+
+
+class SingleFlight:
+    """
+    Coalescing of identical concurrent calls.
+
+    The first call with the key runs the function in a worker thread,
+    the calls with the same key made while it runs wait for it and
+    get its result (or its exception) instead of running it again.
+
+    Attributes:
+        leaders (int): Number of calls which ran the function.
+        coalesced (int): Number of calls which got the result of
+            the call in flight.
+    """
+
+    def __init__(self):
+        self._calls: dict[str, asyncio.Future] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, func: Callable[[], Any]) -> Any:
+        """
+        run func or wait for the call in flight with the same key
+
+        The function is not cancelled with the first caller: it
+        uses resources of the caller (e.g. the db session), so
+        the caller waits for the end of the function anyway.
+        """
+        future = self._calls.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future)
+
+        self.leaders += 1
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        try:
+            with anyio.CancelScope(shield=True):
+                result = await anyio.to_thread.run_sync(func)
+        except Exception as exc:
+            future.set_exception(exc)
+            # mark as retrieved, there may be no waiters
+            future.exception()
+            raise
+        except BaseException:
+            future.cancel()
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            del self._calls[key]
+        return result
+
+    def stats(self) -> dict:
+        """counters and number of calls in flight"""
+        return {
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._calls),
+        }
@@ -0,0 +1,139 @@
+"""
+Catalogue export
+"""
+
+import zlib
+from typing import Iterator
+
+from pydantic_core import to_json
+from sqlalchemy import Engine, select
+from sqlalchemy.engine import Connection
+
+from app.geometry import encode_polyline, unpack_geometry
+from app.media import media_url
+from app.models.mountains import (
+    GeoPoint,
+    Peak,
+    PeakPhoto,
+    Ridge,
+    RidgeInfoLink,
+    Route,
+    RoutePhoto,
+    RoutePoint,
+    RouteSection,
+)
+
+YIELD_PER = 1000
+CHUNK_SIZE = 64 * 1024
+# columns not exported, simplification levels are derived from geometry
+PRIVATE_COLUMNS = ("editor_id", "point_id", "geometry_levels")
+# columns with path to media file, exported with url
+MEDIA_COLUMNS = ("photo", "map_image")
+# packed track of the route, exported as encoded polyline
+GEOMETRY_COLUMN = "geometry"
+
+
+def _columns(model, *extra) -> list:
+    """public columns of the model table and extra columns"""
+    table = model.__table__
+    return [column for column in table.columns if column.name not in PRIVATE_COLUMNS] + list(
+        extra
+    )
+
+
+def export_statements() -> list:
+    """
+    kinds of records and statements selecting them
+
+    Parents go before children, so the records can be loaded
+    in the same order.
+    """
+    return [
+        ("ridge", select(*_columns(Ridge)).order_by(Ridge.id)),
+        ("ridge_link", select(*_columns(RidgeInfoLink)).order_by(RidgeInfoLink.id)),
+        (
+            "peak",
+            select(*_columns(Peak, GeoPoint.latitude, GeoPoint.longitude))
+            .outerjoin(GeoPoint, Peak.point_id == GeoPoint.id)
+            .order_by(Peak.id),
+        ),
+        ("peak_photo", select(*_columns(PeakPhoto)).order_by(PeakPhoto.id)),
+        ("route", select(*_columns(Route)).order_by(Route.id)),
+        ("route_section", select(*_columns(RouteSection)).order_by(RouteSection.id)),
+        (
+            "route_point",
+            select(*_columns(RoutePoint, GeoPoint.latitude, GeoPoint.longitude))
+            .outerjoin(GeoPoint, RoutePoint.point_id == GeoPoint.id)
+            .order_by(RoutePoint.id),
+        ),
+        ("route_photo", select(*_columns(RoutePhoto)).order_by(RoutePhoto.id)),
+    ]
+
+
+def export_records(connection: Connection) -> Iterator[dict]:
+    """
+    records of the catalogue
+
+    Rows are fetched with server side cursor by YIELD_PER, so the
+    memory does not depend on the size of the catalogue.
+    """
+    for kind, statement in export_statements():
+        result = connection.execute(statement.execution_options(yield_per=YIELD_PER))
+        for row in result.mappings():
+            record = {"type": kind, **row}
+            for column in MEDIA_COLUMNS:
+                if column in record:
+                    record[f"{column}_url"] = media_url(record[column])
+            if record.get(GEOMETRY_COLUMN) is not None:
+                record[GEOMETRY_COLUMN] = encode_polyline(unpack_geometry(record[GEOMETRY_COLUMN]))
+            yield record
+
+
+def ndjson_chunks(records, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """records as json lines joined into chunks of about chunk_size bytes"""
+    lines = []
+    size = 0
+    for record in records:
+        line = to_json(record) + b"\n"
+        lines.append(line)
+        size += len(line)
+        if size >= chunk_size:
+            yield b"".join(lines)
+            lines = []
+            size = 0
+    if lines:
+        yield b"".join(lines)
+
+
+def gzip_chunks(chunks) -> Iterator[bytes]:
+    """compress chunks to gzip stream on the fly"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_catalogue(engine: Engine, gzip: bool = False) -> Iterator[bytes]:
+    """
+    Export ridges, peaks, routes, sections, points and photos as NDJSON.
+
+    Every line is json object with "type" of record (ridge, ridge_link,
+    peak, peak_photo, route, route_section, route_point, route_photo)
+    and columns of the row. Paths of media files go with urls, track
+    of the route is encoded polyline.
+
+    Args:
+        engine (Engine): Database engine, the export has own connection
+            which lives as long as the generator.
+        gzip (bool): Compress the output.
+
+    Returns:
+        Iterator[bytes]: Chunks of the output.
+    """
+    with engine.connect() as connection:
+        chunks = ndjson_chunks(export_records(connection))
+        if gzip:
+            chunks = gzip_chunks(chunks)
+        yield from chunks
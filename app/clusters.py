@@ -0,0 +1,263 @@
+"""
+Peak clusters
+"""
+
+import math
+import threading
+
+import numpy as np
+from sqlalchemy import Engine, select
+
+import app.settings as app_settings
+from app.models.mountains import GeoPoint, Peak
+from app.tiles import mercator
+
+# extent of tile in pixels for CLUSTER_RADIUS, as in supercluster
+CLUSTER_EXTENT = 512
+# ids per query loading changed peaks
+LOAD_CHUNK_SIZE = 500
+# offsets of the cell and its neighbours in the grid keys
+_NEIGHBOURS = [(dx << 32) + dy for dx in (-1, 0, 1) for dy in (-1, 0, 1)]
+
+
+def unmercator(x, y) -> tuple:
+    """latitude and longitude of web mercator positions"""
+    longitude = np.asarray(x) * 360.0 - 180.0
+    latitude = np.degrees(np.arctan(np.sinh(math.pi * (1.0 - 2.0 * np.asarray(y)))))
+    return latitude, longitude
+
+
+class _Level:
+    """clusters of one zoom level: weighted centroids, counts and highest peaks"""
+
+    __slots__ = ("x", "y", "count", "top")
+
+    def __init__(self, x, y, count, top):
+        self.x = x
+        self.y = y
+        self.count = count
+        self.top = top
+
+
+def _grid_keys(x: np.ndarray, y: np.ndarray, radius: float) -> np.ndarray:
+    """keys of grid cells with side of the radius"""
+    return (np.floor(x / radius).astype(np.int64) << 32) + np.floor(y / radius).astype(np.int64)
+
+
+def cluster_level(level: _Level, heights: list, radius: float) -> _Level:
+    """
+    Clusters of the next zoom level out.
+
+    The greedy algorithm of supercluster: every point not yet taken
+    takes all points not taken within the radius, the cluster is placed
+    at the centroid weighted by counts. The neighbours are found in the
+    grid of cells with side of the radius; points without other points
+    in their cell and the neighbouring cells can not join any cluster
+    and are copied without the loop.
+
+    Args:
+        level (_Level): Clusters of the zoom level.
+        heights (list): Heights of peaks, -1 for unknown.
+        radius (float): Cluster radius in mercator units.
+
+    Returns:
+        _Level: Clusters of the zoom level out.
+    """
+    if not level.x.size:
+        return level
+    keys = _grid_keys(level.x, level.y, radius)
+    cells, inverse, sizes = np.unique(keys, return_inverse=True, return_counts=True)
+    crowded = np.zeros(keys.size, dtype=bool)
+    for offset in _NEIGHBOURS:
+        neighbours = np.searchsorted(cells, keys + offset)
+        found = cells[np.minimum(neighbours, cells.size - 1)] == keys + offset
+        if offset:
+            crowded |= found
+    crowded |= sizes[inverse] > 1
+    if not crowded.any():
+        return level
+
+    members = {}
+    for index, key in zip(np.flatnonzero(crowded).tolist(), keys[crowded].tolist()):
+        members.setdefault(key, []).append(index)
+    xs, ys = level.x.tolist(), level.y.tolist()
+    counts, tops = level.count.tolist(), level.top.tolist()
+    taken = set()
+    radius2 = radius * radius
+    x, y, count, top = [], [], [], []
+    for index, key in zip(np.flatnonzero(crowded).tolist(), keys[crowded].tolist()):
+        if index in taken:
+            continue
+        taken.add(index)
+        px, py = xs[index], ys[index]
+        weight = counts[index]
+        wx, wy, highest = px * weight, py * weight, tops[index]
+        for offset in _NEIGHBOURS:
+            for other in members.get(key + offset, ()):
+                if other in taken or (xs[other] - px) ** 2 + (ys[other] - py) ** 2 > radius2:
+                    continue
+                taken.add(other)
+                weight += counts[other]
+                wx += xs[other] * counts[other]
+                wy += ys[other] * counts[other]
+                if heights[tops[other]] > heights[highest]:
+                    highest = tops[other]
+        x.append(wx / weight)
+        y.append(wy / weight)
+        count.append(weight)
+        top.append(highest)
+
+    alone = ~crowded
+    return _Level(
+        np.concatenate((level.x[alone], x)),
+        np.concatenate((level.y[alone], y)),
+        np.concatenate((level.count[alone], np.array(count, dtype=np.int64))),
+        np.concatenate((level.top[alone], np.array(top, dtype=np.int64))),
+    )
+
+
+class ClusterIndex:
+    """
+    Hierarchical clusters of peaks for zoomed-out map views.
+
+    Peaks are kept in memory with mercator positions, clusters of every
+    zoom level from max_zoom to 0 are made from the clusters of the
+    level in, so each level is built over fewer points. The index is
+    loaded with the first request. Changed peaks are reloaded and the
+    levels are rebuilt in a background thread, requests get the
+    previous levels until the new ones are swapped in.
+
+    Attributes:
+        engine (Engine): Database engine.
+        max_zoom (int): Last zoom level with clusters, peaks are single above it.
+    """
+
+    def __init__(self, engine: Engine, max_zoom: int):
+        self.engine = engine
+        self.max_zoom = max_zoom
+        self.loaded = False
+        self.peaks = {}
+        self.pending = set()
+        self._lock = threading.Lock()
+        self._levels = None
+        self._info = None
+        self._builder = None
+
+    def changed(self, rows):
+        """remember changed peaks (table, id) and start rebuilding of the levels"""
+        with self._lock:
+            self.pending.update(row_id for table, row_id in rows if table == "peak")
+            if self.loaded and self.pending and self._builder is None:
+                self._builder = threading.Thread(target=self._rebuild, daemon=True)
+                self._builder.start()
+
+    def join(self, timeout: float | None = None):
+        """wait for the rebuilding in progress"""
+        builder = self._builder
+        if builder is not None:
+            builder.join(timeout)
+
+    def _rebuild(self):
+        """reload changed peaks and build the levels until nothing is pending"""
+        try:
+            while True:
+                with self._lock:
+                    ids = sorted(self.pending)
+                    self.pending.clear()
+                    if not ids:
+                        self._builder = None
+                        return
+                try:
+                    for start in range(0, len(ids), LOAD_CHUNK_SIZE):
+                        end = start + LOAD_CHUNK_SIZE
+                        self._load(ids[start:end])
+                except Exception:
+                    with self._lock:
+                        self.pending.update(ids)
+                    raise
+                levels, info = self._build()
+                with self._lock:
+                    self._levels, self._info = levels, info
+        except Exception:
+            with self._lock:
+                self._builder = None
+            raise
+
+    def _load(self, ids: list | None):
+        """load peaks with positions, all of them or by ids"""
+        statement = select(
+            Peak.id, Peak.slug, Peak.name, Peak.height, GeoPoint.latitude, GeoPoint.longitude
+        ).join(GeoPoint, Peak.point_id == GeoPoint.id)
+        if ids is not None:
+            statement = statement.where(Peak.id.in_(ids))
+        with self.engine.connect() as connection:
+            rows = connection.execute(statement).all()
+        for peak_id in ids or ():
+            self.peaks.pop(peak_id, None)
+        for row in rows:
+            self.peaks[row.id] = (row.latitude, row.longitude, row.slug, row.name, row.height)
+
+    def levels(self) -> tuple:
+        """clusters of zoom levels 0..max_zoom + 1 and peak information by index"""
+        with self._lock:
+            if not self.loaded:
+                self.pending.clear()
+                self._load(None)
+                self._levels, self._info = self._build()
+                self.loaded = True
+            return self._levels, self._info
+
+    def _build(self) -> tuple:
+        """build clusters of all zoom levels"""
+        items = list(self.peaks.items())
+        coordinates = np.array([item[1][:2] for item in items], dtype=np.float64).reshape(-1, 2)
+        positions = mercator(coordinates)
+        heights = [-1 if peak[4] is None else peak[4] for _peak_id, peak in items]
+        info = [(peak_id, *peak[2:]) for peak_id, peak in items]
+        level = _Level(
+            positions[:, 0],
+            positions[:, 1],
+            np.ones(len(items), dtype=np.int64),
+            np.arange(len(items), dtype=np.int64),
+        )
+        levels = [level]
+        for zoom in range(self.max_zoom, -1, -1):
+            radius = app_settings.CLUSTER_RADIUS / (CLUSTER_EXTENT * 2**zoom)
+            level = cluster_level(level, heights, radius)
+            levels.append(level)
+        levels.reverse()
+        return levels, info
+
+    def clusters(self, bounds: tuple, zoom: int) -> list:
+        """
+        clusters of the zoom level within bounds
+
+        Args:
+            bounds (tuple): West, south, east and north in degrees.
+            zoom (int): Zoom level, peaks are single above max_zoom.
+
+        Returns:
+            list: Dicts with centroid, count of peaks and the highest peak.
+        """
+        levels, info = self.levels()
+        level = levels[min(zoom, self.max_zoom + 1)]
+        west, south, east, north = bounds
+        (minx, miny), (maxx, maxy) = mercator([(north, west), (south, east)])
+        inside = np.flatnonzero(
+            (level.x >= minx) & (level.x <= maxx) & (level.y >= miny) & (level.y <= maxy)
+        )
+        latitude, longitude = unmercator(level.x[inside], level.y[inside])
+        return [
+            {
+                "latitude": round(lat, 6),
+                "longitude": round(lon, 6),
+                "count": count,
+                "peak": dict(zip(("id", "slug", "name", "height"), info[top])),
+            }
+            for lat, lon, count, top in zip(
+                latitude.tolist(),
+                longitude.tolist(),
+                level.count[inside].tolist(),
+                level.top[inside].tolist(),
+            )
+        ]
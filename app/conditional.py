@@ -0,0 +1,65 @@
+"""
+Conditional requests
+"""
+
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+from starlette.datastructures import Headers
+
+
+def version_validators(kind: str, version) -> tuple[str, datetime | None]:
+    """
+    get ETag and time of last modification for the version of object
+
+    Args:
+        kind (str): Kind of object, e.g. "route".
+        version (tuple): Id of object and times of change of the object
+            and of objects included in its payload.
+
+    Returns:
+        tuple: ETag and the latest time of change.
+    """
+    key = "|".join([kind, *(str(item) for item in version)])
+    etag = f'"{hashlib.sha1(key.encode()).hexdigest()}"'
+    stamps = [item for item in version if isinstance(item, datetime)]
+    return etag, max(stamps) if stamps else None
+
+
+def http_date(value: datetime) -> str:
+    """format naive utc datetime as http date"""
+    return format_datetime(value.replace(tzinfo=timezone.utc), usegmt=True)
+
+
+def validator_headers(etag: str, modified: datetime | None) -> dict:
+    """headers for the client to validate its copy"""
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if modified:
+        headers["Last-Modified"] = http_date(modified)
+    return headers
+
+
+def is_not_modified(headers: Headers, etag: str, modified: datetime | None) -> bool:
+    """
+    has the client the actual version?
+
+    If-None-Match takes precedence over If-Modified-Since.
+    """
+    if_none_match = headers.get("if-none-match")
+    if if_none_match:
+        if if_none_match.strip() == "*":
+            return True
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return etag in tags
+
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since and modified:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return modified.replace(tzinfo=timezone.utc, microsecond=0) <= since
+    return False
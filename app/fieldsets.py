@@ -0,0 +1,147 @@
+"""
+Sparse fieldsets
+"""
+
+from functools import lru_cache
+from typing import Annotated, List
+
+from fastapi import HTTPException, Query, status
+from pydantic import BaseModel, ConfigDict, create_model
+from sqlalchemy import inspect
+from sqlalchemy.orm import RelationshipProperty, load_only, selectinload
+
+from app.i18n import _
+from app.responses import dump_json
+
+
+@lru_cache(maxsize=256)
+def partial_schema(schema: type[BaseModel], fields: tuple) -> type[BaseModel]:
+    """get model with the fields of schema only"""
+    definitions = {name: (schema.model_fields[name].annotation, None) for name in fields}
+    return create_model(
+        f"{schema.__name__}Fields",
+        __config__=ConfigDict(from_attributes=True),
+        **definitions,
+    )
+
+
+def split_names(value: str | None) -> list:
+    """names from comma separated list"""
+    return [name.strip() for name in (value or "").split(",") if name.strip()]
+
+
+class FieldSet:
+    """
+    Fields of the schema requested by the client.
+
+    fields= selects the fields of the response, include= adds fields
+    to the default ones (e.g. description to the items of a list).
+    Without both parameters the default schema is used as is.
+    The selection shapes the query too (see options()): only columns
+    and relationships needed for the fields are loaded.
+
+    Attributes:
+        schema (type[BaseModel]): Schema with all available fields.
+        default (type[BaseModel]): Schema of the response without
+            fields and include.
+        fields (tuple | None): Selected fields in the order of schema,
+            None for the default schema.
+    """
+
+    def __init__(self, schema, default=None, fields: tuple | None = None):
+        self.schema = schema
+        self.default = default or schema
+        self.fields = fields
+
+    @classmethod
+    def parse(cls, schema, default=None, fields: str = None, include: str = None):
+        """
+        make fieldset from query parameters
+
+        Raises:
+            HTTPException: 400 for unknown field.
+        """
+        requested = split_names(fields)
+        included = split_names(include)
+        if not requested and not included:
+            return cls(schema, default)
+
+        unknown = [name for name in requested + included if name not in schema.model_fields]
+        if unknown:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=_("Unknown fields: {}").format(", ".join(unknown)),
+            )
+        selected = set(requested or (default or schema).model_fields) | set(included)
+        return cls(schema, default, tuple(name for name in schema.model_fields if name in selected))
+
+    @property
+    def output(self) -> type[BaseModel]:
+        """schema of the response"""
+        if self.fields is None:
+            return self.default
+        return partial_schema(self.schema, self.fields)
+
+    def kind(self, name: str) -> str:
+        """name of the object kind for ETag, fieldset included"""
+        if self.fields is None:
+            return name
+        return f"{name}?fields={','.join(self.fields)}"
+
+    def dump(self, content, many: bool = False) -> bytes:
+        """json of the object or list of objects"""
+        return dump_json(List[self.output] if many else self.output, content)
+
+    def options(self, model, needs: dict, nested: dict, always=()) -> list:
+        """
+        loader options for the selected fields
+
+        Args:
+            model: Orm model of the response.
+            needs (dict): Attributes of model needed by the fields which
+                are not attributes themselves, e.g. "photo_url": ("photo",).
+            nested (dict): Loader options for the objects of relationship
+                by its name, e.g. "routepoints": (selectinload(RoutePoint.point),).
+            always (tuple): Attributes loaded in any case.
+
+        Returns:
+            list: load_only for columns and selectinload for relationships.
+        """
+        mapper = inspect(model)
+        columns = {key.key for key in mapper.primary_key} | set(always)
+        relationships = []
+        for field in self.fields:
+            for name in needs.get(field, (field,)):
+                prop = mapper.attrs[name]
+                if isinstance(prop, RelationshipProperty):
+                    relationships.append(name)
+                    columns.update(
+                        mapper.get_property_by_column(column).key
+                        for column in prop.local_columns
+                    )
+                else:
+                    columns.add(name)
+
+        options = [load_only(*(getattr(model, name) for name in sorted(columns)))]
+        for name in dict.fromkeys(relationships):
+            options.append(selectinload(getattr(model, name)).options(*nested.get(name, ())))
+        return options
+
+
+def fieldset(schema, default=None):
+    """
+    dependency reading fields= and include= for the schema
+
+    Args:
+        schema: Schema with all available fields, e.g. RouteOut.
+        default: Schema of the response without parameters,
+            e.g. RouteListItem for lists.
+    """
+
+    async def dependency(
+        fields: Annotated[str | None, Query(max_length=512)] = None,
+        include: Annotated[str | None, Query(max_length=512)] = None,
+    ) -> FieldSet:
+        return FieldSet.parse(schema, default, fields, include)
+
+    return dependency
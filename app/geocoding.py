@@ -0,0 +1,275 @@
+"""
+Reverse geocoding by GeoNames cities
+"""
+
+import math
+import threading
+import time
+
+import numpy as np
+from sqlalchemy import Engine, func, select
+
+import app.settings as app_settings
+from app.cache.response import response_cache
+from app.dependencies import db
+from app.geometry import EARTH_RADIUS
+from app.geonames import CITIES_TAG, DELETED_CITIES_TAG
+from app.models.geoname import GeoCity
+
+# points in the leaves of the tree, scanned by numpy
+LEAF_SIZE = 64
+# rows per fetch loading cities
+LOAD_CHUNK_SIZE = 10000
+
+
+def unit_vectors(latitude, longitude) -> np.ndarray:
+    """points on the unit sphere, chord distance grows with great circle distance"""
+    latitude = np.radians(np.asarray(latitude, dtype=np.float64))
+    longitude = np.radians(np.asarray(longitude, dtype=np.float64))
+    cos = np.cos(latitude)
+    return np.stack((cos * np.cos(longitude), cos * np.sin(longitude), np.sin(latitude)), axis=-1)
+
+
+def chord_meters(chord: float) -> float:
+    """great circle distance in meters of chord on the unit sphere"""
+    return 2 * math.asin(min(1.0, chord / 2)) * EARTH_RADIUS
+
+
+def cities_generation() -> tuple:
+    """generations of changed and deleted cities (see app.geonames.invalidate_cities)"""
+    return (
+        response_cache.backend.generation(CITIES_TAG),
+        response_cache.backend.generation(DELETED_CITIES_TAG),
+    )
+
+
+class CityIndex:
+    """
+    Cities in compact arrays with KD-tree for the nearest city.
+
+    Positions are float32 unit vectors (12 bytes per city) ordered as
+    implicit KD-tree: every range is split by its median along x, y, z
+    in turn, so the tree needs no nodes, only the order of points.
+    Names are one UTF-8 blob with offsets, countries are two bytes.
+
+    The cities are loaded on the first query. The generations of
+    cities are checked every check_interval seconds: cities modified
+    since the loading (by moddate) are reloaded into a small overlay
+    scanned besides the tree and their old positions in the tree are
+    masked, all cities are loaded again only if some were deleted.
+    Queries and updates are serialized by the lock of the index.
+
+    Attributes:
+        engine (Engine): Database engine.
+        check_interval (float): Seconds between checks of generations.
+        size (int): Number of cities in the tree, None before loading.
+    """
+
+    def __init__(self, engine: Engine, check_interval: float = 0):
+        self.engine = engine
+        self.check_interval = check_interval
+        self.size = None
+        self._lock = threading.Lock()
+        self._checked = 0.0
+        self._generation = None
+        self._moddate = None
+
+    def reset(self):
+        """drop the cities, they are loaded again by the next query"""
+        with self._lock:
+            self.size = None
+
+    def _statement(self):
+        """query of cities with coordinates"""
+        return select(
+            GeoCity.id, GeoCity.name, GeoCity.country, GeoCity.latitude, GeoCity.longitude
+        ).where(GeoCity.latitude.is_not(None), GeoCity.longitude.is_not(None))
+
+    def load(self):
+        """load cities with coordinates and build the tree"""
+        generation = cities_generation()
+        ids, latitudes, longitudes, names, countries = [], [], [], [], []
+        with self.engine.connect() as connection:
+            moddate = connection.execute(select(func.max(GeoCity.moddate))).scalar()
+            result = connection.execution_options(yield_per=LOAD_CHUNK_SIZE).execute(
+                self._statement().order_by(GeoCity.id)
+            )
+            for row in result:
+                ids.append(row.id)
+                latitudes.append(row.latitude)
+                longitudes.append(row.longitude)
+                names.append((row.name or "").encode())
+                countries.append((row.country or "").encode())
+        self.build(ids, latitudes, longitudes, names, countries)
+        self._generation = generation
+        self._moddate = moddate
+
+    def build(self, ids, latitudes, longitudes, names, countries):
+        """
+        build the tree over cities given by columns, names and countries as bytes
+
+        The ids are ascending.
+        """
+        points = unit_vectors(latitudes, longitudes).astype(np.float32).reshape(-1, 3)
+        order = np.arange(len(points))
+        stack = [(0, len(points), 0)]
+        while stack:
+            low, high, axis = stack.pop()
+            if high - low <= LEAF_SIZE:
+                continue
+            middle = (low + high) // 2
+            part = np.argpartition(points[low:high, axis], middle - low)
+            points[low:high] = points[low:high][part]
+            order[low:high] = order[low:high][part]
+            stack.append((low, middle, (axis + 1) % 3))
+            stack.append((middle + 1, high, (axis + 1) % 3))
+
+        lengths = np.fromiter((len(name) for name in names), dtype=np.int32, count=len(names))
+        offsets = np.zeros(len(names) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        self._points = points
+        self._order = order.astype(np.int32)
+        self._positions = np.argsort(order).astype(np.int32)
+        self._ids = np.asarray(ids, dtype=np.int32).reshape(-1)
+        self._names = b"".join(names)
+        self._offsets = offsets
+        self._countries = np.array(countries, dtype="S2").reshape(-1)
+        self._deleted = None
+        self._extra = {}
+        self._extra_ids = []
+        self._extra_points = np.empty((0, 3), dtype=np.float32)
+        self.size = len(points)
+
+    def update(self):
+        """move cities modified since the loading to the overlay"""
+        statement = self._statement().add_columns(GeoCity.moddate)
+        if self._moddate is not None:
+            statement = statement.where(GeoCity.moddate >= self._moddate)
+        with self.engine.connect() as connection:
+            rows = connection.execute(statement).all()
+        if not rows:
+            return
+        if self._deleted is None:
+            self._deleted = np.zeros(self.size, dtype=bool)
+        for row in rows:
+            index = np.searchsorted(self._ids, row.id)
+            if index < self._ids.size and self._ids[index] == row.id:
+                self._deleted[self._positions[index]] = True
+            self._extra[row.id] = (row.latitude, row.longitude, row.name or "", row.country)
+            if row.moddate is not None and (self._moddate is None or row.moddate > self._moddate):
+                self._moddate = row.moddate
+        self._extra_ids = list(self._extra)
+        self._extra_points = unit_vectors(
+            [city[0] for city in self._extra.values()], [city[1] for city in self._extra.values()]
+        ).astype(np.float32).reshape(-1, 3)
+
+    def refresh(self):
+        """load the cities, or changed cities if their generation is changed (under the lock)"""
+        if self.size is None:
+            self.load()
+            self._checked = time.monotonic()
+            return
+        if time.monotonic() - self._checked < self.check_interval:
+            return
+        self._checked = time.monotonic()
+        generation = cities_generation()
+        if generation == self._generation:
+            return
+        if self._moddate is None or generation[1] != self._generation[1]:
+            self.load()
+        else:
+            self.update()
+            self._generation = generation
+
+    def nbytes(self) -> int:
+        """memory of the arrays and names"""
+        return (
+            self._points.nbytes
+            + self._order.nbytes
+            + self._positions.nbytes
+            + self._ids.nbytes
+            + len(self._names)
+            + self._offsets.nbytes
+            + self._countries.nbytes
+        )
+
+    def _nearest(self, target: np.ndarray) -> tuple:
+        """position in the tree and squared chord distance of the nearest city"""
+        points, deleted = self._points, self._deleted
+        best, best_distance = -1, np.inf
+        stack = [(0, self.size, 0, 0.0)]
+        while stack:
+            low, high, axis, bound = stack.pop()
+            if bound >= best_distance:
+                continue
+            if high - low <= LEAF_SIZE:
+                if high > low:
+                    distances = np.sum((points[low:high] - target) ** 2, axis=1)
+                    if deleted is not None:
+                        distances[deleted[low:high]] = np.inf
+                    index = int(np.argmin(distances))
+                    if distances[index] < best_distance:
+                        best, best_distance = low + index, float(distances[index])
+                continue
+            middle = (low + high) // 2
+            distance = float(np.sum((points[middle] - target) ** 2))
+            if distance < best_distance and (deleted is None or not deleted[middle]):
+                best, best_distance = middle, distance
+            delta = float(target[axis] - points[middle, axis])
+            near, far = ((low, middle), (middle + 1, high)) if delta < 0 else (
+                (middle + 1, high),
+                (low, middle),
+            )
+            following = (axis + 1) % 3
+            stack.append((*far, following, delta * delta))
+            stack.append((*near, following, bound))
+        return best, best_distance
+
+    def nearest(self, latitude: float, longitude: float) -> dict | None:
+        """
+        the nearest city to the point
+
+        Returns:
+            dict | None: Id, name, country and distance in meters of
+                the city, None without cities.
+        """
+        target = unit_vectors(latitude, longitude).astype(np.float32)
+        with self._lock:
+            self.refresh()
+            position, distance = self._nearest(target)
+            if self._extra_points.size:
+                distances = np.sum((self._extra_points - target) ** 2, axis=1)
+                index = int(np.argmin(distances))
+                if distances[index] < distance:
+                    city_id = self._extra_ids[index]
+                    _latitude, _longitude, name, country = self._extra[city_id]
+                    return {
+                        "id": city_id,
+                        "name": name,
+                        "country": country or None,
+                        "distance": round(chord_meters(math.sqrt(distances[index]))),
+                    }
+            if position < 0:
+                return None
+            return self._city(position, distance)
+
+    def _city(self, position: int, distance: float) -> dict:
+        """city at the position in the tree"""
+        order = int(self._order[position])
+        start, end = self._offsets[order], self._offsets[order + 1]
+        return {
+            "id": int(self._ids[order]),
+            "name": self._names[start:end].decode(),
+            "country": self._countries[order].decode() or None,
+            "distance": round(chord_meters(math.sqrt(distance))),
+        }
+
+
+city_index = CityIndex(db, app_settings.GEOCODING_CHECK_INTERVAL)
+
+
+def nearest_city(latitude: float | None, longitude: float | None) -> dict | None:
+    """the nearest city to the point, None for unknown point"""
+    if latitude is None or longitude is None:
+        return None
+    return city_index.nearest(latitude, longitude)
@@ -0,0 +1,168 @@
+"""
+Route geometry
+"""
+
+import itertools
+import math
+from typing import Iterable
+
+import numpy as np
+
+# latitude and longitude pairs, little endian float32 (about 0.5 m)
+GEOMETRY_DTYPE = np.dtype("<f4")
+# bytes of one vertex in the blob
+GEOMETRY_VERTEX_SIZE = 2 * GEOMETRY_DTYPE.itemsize
+POLYLINE_PRECISION = 5
+# digits of coordinates decoded from float32
+COORDINATE_DIGITS = 6
+EARTH_RADIUS = 6371008.8
+# meters per pixel of 256 px tile at zoom 0 on the equator
+ZOOM0_RESOLUTION = 156543.03392
+
+
+def pack_geometry(points: Iterable[tuple]) -> bytes | None:
+    """
+    pack latitude and longitude pairs into blob, None for no points
+
+    The points are read into float32 array, 8 bytes per point,
+    so a stream of points is not held as python objects.
+    """
+    values = np.fromiter(itertools.chain.from_iterable(points), dtype=GEOMETRY_DTYPE)
+    if not values.size:
+        return None
+    return values.tobytes()
+
+
+def unpack_geometry(blob: bytes | None) -> np.ndarray:
+    """
+    array of latitude and longitude pairs over the blob
+
+    The array is a read-only view of the blob, nothing is copied.
+    """
+    if not blob:
+        return np.empty((0, 2), dtype=GEOMETRY_DTYPE)
+    return np.frombuffer(blob, dtype=GEOMETRY_DTYPE).reshape(-1, 2)
+
+
+def geometry_points(blob: bytes | None) -> list:
+    """latitude and longitude pairs of the blob as python floats"""
+    return unpack_geometry(blob).astype(np.float64).round(COORDINATE_DIGITS).tolist()
+
+
+def encode_polyline(coordinates, precision: int = POLYLINE_PRECISION) -> str:
+    """
+    Encoded polyline of latitude and longitude pairs.
+
+    The algorithm of Google Maps: rounded deltas of the coordinates
+    in zigzag encoding, split into 5 bit chunks with continuation bit.
+    The chunks are made for all values at once by numpy.
+
+    Args:
+        coordinates: Array-like of latitude and longitude pairs.
+        precision (int): Decimal digits, 5 for Google, 6 for OSRM.
+
+    Returns:
+        str: Encoded polyline.
+    """
+    values = np.round(np.asarray(coordinates, dtype=np.float64) * 10**precision)
+    values = values.astype(np.int64).reshape(-1, 2)
+    if not values.size:
+        return ""
+    deltas = np.diff(values, axis=0, prepend=0).ravel()
+    zigzag = (deltas << 1) ^ (deltas >> 63)
+    shifts = np.arange(0, 35, 5, dtype=np.int64)
+    chunks = (zigzag[:, None] >> shifts) & 31
+    lengths = np.maximum(1, np.count_nonzero(zigzag[:, None] >> shifts, axis=1))
+    index = np.arange(shifts.size)
+    chunks |= np.where(index < lengths[:, None] - 1, 0x20, 0)
+    chars = chunks[index < lengths[:, None]] + 63
+    return chars.astype(np.uint8).tobytes().decode("ascii")
+
+
+def project(coordinates) -> np.ndarray:
+    """latitude and longitude pairs projected to plane in meters around the first point"""
+    coordinates = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+    if not coordinates.size:
+        return np.empty((0, 2))
+    radians = np.radians(coordinates - coordinates[0])
+    scale = np.cos(np.radians(coordinates[0, 0]))
+    return np.column_stack((radians[:, 1] * scale, radians[:, 0])) * EARTH_RADIUS
+
+
+def simplification_levels(coordinates) -> np.ndarray:
+    """
+    Tolerance of Douglas-Peucker simplification for every vertex.
+
+    The vertex is kept by simplification with tolerance t if its level
+    is greater than t, so one array gives the track for any tolerance:
+    coordinates[levels > t]. The level of the vertex is its distance
+    to the chord of the segment it splits, but not more than the level
+    of the parent split, the ends of the track are always kept.
+
+    Segments of one depth of the recursion are handled together:
+    distances of all their interior vertices and the farthest vertex
+    of each segment are found by a few array operations.
+
+    Args:
+        coordinates: Array-like of latitude and longitude pairs.
+
+    Returns:
+        np.ndarray: float32 levels in meters, inf for the ends.
+    """
+    xy = project(coordinates)
+    count = len(xy)
+    levels = np.zeros(count, dtype=np.float32)
+    if not count:
+        return levels
+    levels[[0, -1]] = np.inf
+    starts = np.array([0])
+    ends = np.array([count - 1])
+    parents = np.array([np.inf])
+    while starts.size:
+        inner = ends - starts - 1
+        split = inner > 0
+        starts, ends, parents, inner = starts[split], ends[split], parents[split], inner[split]
+        if not starts.size:
+            break
+        segment = np.repeat(np.arange(starts.size), inner)
+        first = np.concatenate(([0], np.cumsum(inner)[:-1]))
+        index = starts[segment] + 1 + np.arange(segment.size) - first[segment]
+
+        a = xy[starts][segment]
+        ab = xy[ends][segment] - a
+        ap = xy[index] - a
+        length = np.einsum("ij,ij->i", ab, ab)
+        t = np.divide(
+            np.einsum("ij,ij->i", ap, ab), length, out=np.zeros_like(length), where=length > 0
+        )
+        distance = np.hypot(*(ap - np.clip(t, 0, 1)[:, None] * ab).T)
+
+        farthest = np.maximum.reduceat(distance, first)
+        candidates = np.flatnonzero(distance == farthest[segment])
+        _, pick = np.unique(segment[candidates], return_index=True)
+        split_at = index[candidates[pick]]
+        level = np.minimum(farthest, parents)
+        levels[split_at] = level
+
+        starts, ends = np.concatenate((starts, split_at)), np.concatenate((split_at, ends))
+        parents = np.concatenate((level, level))
+    return levels
+
+
+def pack_levels(levels: np.ndarray | None) -> bytes | None:
+    """simplification levels as blob, None for no levels"""
+    if levels is None or not levels.size:
+        return None
+    return np.asarray(levels, dtype=GEOMETRY_DTYPE).tobytes()
+
+
+def unpack_levels(blob: bytes | None) -> np.ndarray | None:
+    """simplification levels over the blob, None for no blob"""
+    if not blob:
+        return None
+    return np.frombuffer(blob, dtype=GEOMETRY_DTYPE)
+
+
+def zoom_tolerance(zoom: int, latitude: float, pixels: float = 1.0) -> float:
+    """tolerance in meters invisible on the map at zoom level (size of pixels)"""
+    return ZOOM0_RESOLUTION * math.cos(math.radians(latitude)) / 2**zoom * pixels
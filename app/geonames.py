@@ -0,0 +1,441 @@
+"""
+GeoNames dumps
+"""
+
+import io
+import itertools
+import os
+import re
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from operator import itemgetter
+from typing import Iterable, Iterator
+
+from sqlalchemy import Engine, bindparam, delete, func, insert, select, text, update
+from text_unidecode import unidecode
+
+from app.cache.response import response_cache
+from app.models.geoname import GeoCity, GeoCityName
+
+# lines of the dump parsed and inserted together
+LOAD_CHUNK_SIZE = 20000
+# feature class of populated places
+CITY_FEATURE_CLASS = "P"
+# cache tags of changed cities and of deleted ones (see invalidate_cities)
+CITIES_TAG = "geo_city"
+DELETED_CITIES_TAG = "geo_city:deleted"
+# daily files of GeoNames with changes
+SYNC_FILE = re.compile(r"(modifications|deletes)-(\d{4}-\d{2}-\d{2})\.txt$")
+SEARCH_NAME_LENGTH = 200
+# runs of other characters than latin letters and digits after _LATIN, tabs split names
+_NOT_WORD = re.compile(r"[^0-9a-z]+")
+_NOT_WORD_OR_TAB = re.compile(r"[^0-9a-z\t]+")
+# columns of geoname table in the dump, in order
+DUMP_COLUMNS = (
+    "geonameid",
+    "name",
+    "asciiname",
+    "alternatenames",
+    "latitude",
+    "longitude",
+    "fclass",
+    "fcode",
+    "country",
+    "cc2",
+    "admin1",
+    "admin2",
+    "admin3",
+    "admin4",
+    "population",
+    "elevation",
+    "gtopo30",
+    "timezone",
+    "moddate",
+)
+_INTEGERS = ("geonameid", "population", "elevation", "gtopo30")
+_INTEGER_INDEXES = tuple(DUMP_COLUMNS.index(name) for name in _INTEGERS)
+_STRINGS = tuple(
+    name for name in DUMP_COLUMNS if name not in _INTEGERS + ("latitude", "longitude", "moddate")
+)
+_STRING_INDEXES = tuple(DUMP_COLUMNS.index(name) for name in _STRINGS)
+# string columns without length are VARCHAR(255) on mysql
+_LENGTHS = {name: GeoCity.__table__.c[name].type.length or 255 for name in _STRINGS}
+
+
+def _truncate(name: str, value: str) -> str:
+    """value cut to the length of the column, alternate names by whole names"""
+    length = _LENGTHS[name]
+    if len(value) <= length:
+        return value
+    if name == "alternatenames":
+        return value[: length + 1].rsplit(",", 1)[0]
+    return value[:length]
+
+
+def parse_line(line: str) -> dict:
+    """
+    row of geo_city from tab separated line of the dump
+
+    Raises:
+        ValueError: Wrong number of columns or wrong number.
+    """
+    values = line.rstrip("\r\n").split("\t")
+    if len(values) != len(DUMP_COLUMNS):
+        raise ValueError(f"{len(values)} columns instead of {len(DUMP_COLUMNS)}")
+    row = {
+        name: _truncate(name, value) if len(value) > _LENGTHS[name] else value or None
+        for name, value in zip(_STRINGS, itemgetter(*_STRING_INDEXES)(values))
+    }
+    for name, index in zip(_INTEGERS, _INTEGER_INDEXES):
+        row[name] = int(values[index]) if values[index] else None
+    row["latitude"] = float(values[4])
+    row["longitude"] = float(values[5])
+    row["moddate"] = datetime.fromisoformat(values[18]) if values[18] else None
+    if row["geonameid"] is None:
+        raise ValueError("No geonameid")
+    row["names"] = city_names(values[1], values[2], values[3])
+    return row
+
+
+class _Latin(dict):
+    """table of str.translate to lower case latin, filled by unidecode of new characters"""
+
+    def __missing__(self, code: int) -> str:
+        value = self[code] = unidecode(chr(code)).replace("'", "").lower()
+        return value
+
+
+_LATIN = _Latin()
+
+
+def search_name(name: str) -> str:
+    """name for search: transliterated to latin, lower case, words split by single spaces"""
+    return _NOT_WORD.sub(" ", name.translate(_LATIN)).strip()[:SEARCH_NAME_LENGTH]
+
+
+def city_names(name: str, asciiname: str = "", alternatenames: str = "") -> list:
+    """
+    distinct names of the city for search
+
+    All names are transliterated together, joined by tabs (the dump
+    has no tabs in names and no character is transliterated to tab).
+
+    Returns:
+        list: Pairs of name and its search name, one per search name.
+    """
+    values = [
+        value.strip()
+        for value in itertools.chain((name, asciiname), alternatenames.split(","))
+    ]
+    keys = _NOT_WORD_OR_TAB.sub(" ", "\t".join(values).translate(_LATIN)).split("\t")
+    names = {}
+    for value, key in zip(values, keys):
+        key = key.strip()[:SEARCH_NAME_LENGTH]
+        if key and key not in names and "://" not in value:
+            names[key] = value[:SEARCH_NAME_LENGTH]
+    return [(value, key) for key, value in names.items()]
+
+
+def _name_rows(rows: list) -> list:
+    """take names out of the rows of cities as rows of geo_city_name"""
+    return [
+        {"geonameid": row["geonameid"], "name": name, "search_name": key}
+        for row in rows
+        for name, key in row.pop("names")
+    ]
+
+
+def parse_lines(lines: list, feature_classes: str = CITY_FEATURE_CLASS) -> tuple:
+    """
+    rows of the lines with feature classes (all for empty)
+
+    Returns:
+        tuple: Rows and count of skipped wrong lines (empty lines are not counted).
+    """
+    rows = []
+    skipped = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            row = parse_line(line)
+        except ValueError:
+            skipped += 1
+            continue
+        if not feature_classes or (row["fclass"] or "") in feature_classes:
+            rows.append(row)
+    return rows, skipped
+
+
+def dump_lines(path: str) -> Iterator[str]:
+    """lines of the dump, .zip of GeoNames with .txt of the same name or .txt"""
+    if path.endswith(".zip"):
+        with zipfile.ZipFile(path) as archive:
+            member = os.path.basename(path)[:-4] + ".txt"
+            if member not in archive.namelist():
+                member = next(name for name in archive.namelist() if name.endswith(".txt"))
+            with archive.open(member) as _file:
+                yield from io.TextIOWrapper(_file, encoding="utf-8")
+        return
+    with open(path, encoding="utf-8") as _file:
+        yield from _file
+
+
+def chunks(lines: Iterable[str], size: int) -> Iterator[list]:
+    """lists of size lines"""
+    lines = iter(lines)
+    while chunk := list(itertools.islice(lines, size)):
+        yield chunk
+
+
+def parsed_chunks(
+    lines: Iterable[str], size: int, workers: int = 0, feature_classes: str = CITY_FEATURE_CLASS
+) -> Iterator[tuple]:
+    """
+    rows of chunks of lines and counts of skipped wrong lines (see parse_lines),
+    parsed by process pool for workers > 0
+
+    Not more than two chunks per worker are read ahead, so the dump
+    is streamed in any case.
+    """
+    if workers <= 0:
+        for chunk in chunks(lines, size):
+            yield parse_lines(chunk, feature_classes)
+        return
+    with ProcessPoolExecutor(workers) as executor:
+        pending = deque()
+        for chunk in chunks(lines, size):
+            pending.append(executor.submit(parse_lines, chunk, feature_classes))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def load_cities(
+    engine: Engine,
+    lines: Iterable[str],
+    chunk_size: int = LOAD_CHUNK_SIZE,
+    workers: int = 0,
+    feature_classes: str = CITY_FEATURE_CLASS,
+    replace: bool = True,
+    drop_indexes: bool = True,
+) -> dict:
+    """
+    Load cities of GeoNames dump into geo_city.
+
+    Rows of every chunk are inserted by one executemany in their own
+    transaction, with names of the cities for search into
+    geo_city_name. Secondary indexes of the tables are dropped before
+    loading and created again after it (even if loading fails), so
+    the indexes are built once instead of updated row by row.
+
+    Args:
+        engine (Engine): Database engine.
+        lines: Lines of the dump, e.g. dump_lines(path).
+        chunk_size (int): Lines per chunk.
+        workers (int): Processes parsing the lines, 0 to parse in place.
+        feature_classes (str): Feature classes to load, empty for all.
+        replace (bool): Delete cities and their names before loading.
+        drop_indexes (bool): Drop and rebuild secondary indexes.
+
+    Returns:
+        dict: Counts of loaded cities and of skipped wrong lines.
+    """
+    tables = (GeoCity.__table__, GeoCityName.__table__)
+    indexes = [index for table in tables for index in table.indexes] if drop_indexes else []
+    counts = dict.fromkeys(("loaded", "skipped"), 0)
+    with engine.begin() as connection:
+        for index in indexes:
+            index.drop(connection, checkfirst=True)
+        for table in tables:
+            if replace and connection.dialect.name == "mysql":
+                connection.execute(text(f"TRUNCATE TABLE {table.name}"))
+            elif replace:
+                connection.execute(delete(table))
+    try:
+        for rows, skipped in parsed_chunks(lines, chunk_size, workers, feature_classes):
+            counts["skipped"] += skipped
+            if not rows:
+                continue
+            names = _name_rows(rows)
+            with engine.begin() as connection:
+                connection.execute(insert(GeoCity.__table__), rows)
+                connection.execute(insert(GeoCityName.__table__), names)
+            counts["loaded"] += len(rows)
+    finally:
+        with engine.begin() as connection:
+            for index in indexes:
+                index.create(connection, checkfirst=True)
+        invalidate_cities(deleted=True)
+    return counts
+
+
+def invalidate_cities(deleted: bool = False):
+    """
+    make responses and indexes built from cities outdated
+
+    The generations of the tags are kept by the response cache backend,
+    so processes sharing it (SQLite or Redis backend) see the change.
+    Indexes of cities (see app.geocoding) load changed cities only,
+    and all of them again if some were deleted.
+    """
+    response_cache.invalidate([CITIES_TAG, DELETED_CITIES_TAG] if deleted else [CITIES_TAG])
+
+
+def sync_files(paths: Iterable[str], since: str | None = None) -> list:
+    """
+    modifications-*.txt and deletes-*.txt of the paths (files or directories)
+
+    Returns:
+        list: Date, kind and path of the files from the date since,
+            in order of dates, modifications before deletes.
+    """
+    files = []
+    for path in paths:
+        names = (
+            [os.path.join(path, name) for name in os.listdir(path)]
+            if os.path.isdir(path)
+            else [path]
+        )
+        for name in names:
+            match = SYNC_FILE.search(os.path.basename(name))
+            if match and (since is None or match[2] >= since):
+                files.append((match[2], match[1], name))
+    return sorted(files, key=lambda item: (item[0], item[1] == "deletes", item[2]))
+
+
+def latest_moddate(engine: Engine) -> str | None:
+    """date of the latest modification of cities as YYYY-MM-DD"""
+    with engine.connect() as connection:
+        latest = connection.execute(select(func.max(GeoCity.moddate))).scalar()
+    return latest.strftime("%Y-%m-%d") if latest else None
+
+
+def _delete_names(connection, geonameids: list):
+    """delete names of cities by geonameids"""
+    if geonameids:
+        table = GeoCityName.__table__
+        connection.execute(delete(table).where(table.c.geonameid.in_(geonameids)))
+
+
+def _delete_cities(connection, geonameids: list) -> int:
+    """delete cities with their names by geonameids"""
+    if not geonameids:
+        return 0
+    table = GeoCity.__table__
+    _delete_names(connection, geonameids)
+    return connection.execute(delete(table).where(table.c.geonameid.in_(geonameids))).rowcount
+
+
+def _is_older(moddate: datetime | None, existing: datetime | None) -> bool:
+    """the modification is older than the stored city"""
+    return bool(moddate and existing and existing > moddate)
+
+
+def apply_modifications(
+    engine: Engine,
+    lines: Iterable[str],
+    chunk_size: int = LOAD_CHUNK_SIZE,
+    feature_classes: str = CITY_FEATURE_CLASS,
+) -> dict:
+    """
+    Upsert cities of modifications file by geonameid.
+
+    Every chunk is applied in its own transaction: one query finds
+    existing cities, then updates and inserts are executemany.
+    A city with later moddate than the line is kept (the latest line
+    of the city wins), a city changed to other feature class is deleted.
+    Names of changed cities in geo_city_name are replaced.
+
+    Returns:
+        dict: Counts of inserted, updated and deleted cities
+            and of skipped wrong lines.
+    """
+    table = GeoCity.__table__
+    counts = dict.fromkeys(("inserted", "updated", "deleted", "skipped"), 0)
+    statement = update(table).where(table.c.geonameid == bindparam("b_geonameid"))
+    for rows, skipped in parsed_chunks(lines, chunk_size, feature_classes=""):
+        counts["skipped"] += skipped
+        latest = {}
+        for row in rows:
+            previous = latest.get(row["geonameid"])
+            if previous is None or not _is_older(row["moddate"], previous["moddate"]):
+                latest[row["geonameid"]] = row
+        wanted = {
+            geonameid: row
+            for geonameid, row in latest.items()
+            if not feature_classes or (row["fclass"] or "") in feature_classes
+        }
+        unwanted = [geonameid for geonameid in latest if geonameid not in wanted]
+        query = select(table.c.geonameid, table.c.moddate).where(
+            table.c.geonameid.in_(list(wanted))
+        )
+        with engine.begin() as connection:
+            existing = dict(connection.execute(query).all()) if wanted else {}
+            changed = {
+                geonameid: row
+                for geonameid, row in wanted.items()
+                if geonameid not in existing or not _is_older(row["moddate"], existing[geonameid])
+            }
+            names = _name_rows(list(changed.values()))
+            updates = [
+                {**row, "b_geonameid": geonameid}
+                for geonameid, row in changed.items()
+                if geonameid in existing
+            ]
+            inserts = [row for geonameid, row in changed.items() if geonameid not in existing]
+            if updates:
+                connection.execute(statement, updates)
+            if inserts:
+                connection.execute(insert(table), inserts)
+            _delete_names(connection, list(changed))
+            if names:
+                connection.execute(insert(GeoCityName.__table__), names)
+            counts["deleted"] += _delete_cities(connection, unwanted)
+        counts["updated"] += len(updates)
+        counts["inserted"] += len(inserts)
+    return counts
+
+
+def apply_deletes(engine: Engine, lines: Iterable[str], chunk_size: int = LOAD_CHUNK_SIZE) -> int:
+    """delete cities of deletes file (geonameid, name and comment), count of deleted"""
+    deleted = 0
+    for chunk in chunks(lines, chunk_size):
+        geonameids = [int(line.split("\t", 1)[0]) for line in chunk if line[:1].isdigit()]
+        with engine.begin() as connection:
+            deleted += _delete_cities(connection, geonameids)
+    return deleted
+
+
+def sync_cities(
+    engine: Engine,
+    files: list,
+    chunk_size: int = LOAD_CHUNK_SIZE,
+    feature_classes: str = CITY_FEATURE_CLASS,
+) -> dict:
+    """
+    apply modifications and deletes files of sync_files to geo_city
+
+    Returns:
+        dict: Counts of files, inserted, updated and deleted cities
+            and of skipped wrong lines.
+    """
+    counts = dict.fromkeys(("files", "inserted", "updated", "deleted", "skipped"), 0)
+    try:
+        for _date, kind, path in files:
+            if kind == "deletes":
+                counts["deleted"] += apply_deletes(engine, dump_lines(path), chunk_size)
+            else:
+                changes = apply_modifications(
+                    engine, dump_lines(path), chunk_size, feature_classes
+                )
+                for name, count in changes.items():
+                    counts[name] += count
+            counts["files"] += 1
+    finally:
+        if counts["inserted"] or counts["updated"] or counts["deleted"]:
+            invalidate_cities(deleted=bool(counts["deleted"]))
+    return counts
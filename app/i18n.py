@@ -69,6 +69,23 @@ class TranslationWrapper:
         return self.translations.gettext(message)
 
 
+def get_language(request: Request) -> str:
+    """
+    Get the language of the request.
+
+    Args:
+        request (Request): The incoming request object.
+
+    Returns:
+        str: Language from the accept-language header
+        or default language.
+    """
+    lang = request.headers.get("Accept-Language", "ru")
+    if lang not in LANGUAGES:
+        lang = "ru"
+    return lang
+
+
 async def set_locale(request: Request):
     """
     Set the locale based on the request headers.
@@ -81,9 +98,7 @@ async def set_locale(request: Request):
     """
     translation_wrapper = TranslationWrapper()
 
-    lang = request.headers.get("Accept-Language", "ru")
-    if lang not in LANGUAGES:
-        lang = "ru"
+    lang = get_language(request)
     locales_dir = Path(__file__).parent / "translations"
 
     translation_wrapper.translations = gettext.translation(
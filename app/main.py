@@ -3,24 +3,25 @@ MAIN
 """
 
 from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
 from sqladmin import Admin
 
 from .dependencies import db
 from .i18n import _
 from .middleware import LanguageMiddleware
 from .models.admin import APIUserAdmin, PeakAdmin, RidgeAdmin, RouteAdmin
-from .routers import mountains, users
+from .routers import geo, mountains, users
+from .staticfiles import MediaFiles, PrecompressedStaticFiles
 
 app = FastAPI()
 
 app.add_middleware(LanguageMiddleware)
 
-app.mount("/static", StaticFiles(directory="static"), name="static")
-app.mount("/media", StaticFiles(directory="data"), name="media")
+app.mount("/static", PrecompressedStaticFiles(directory="static"), name="static")
+app.mount("/media", MediaFiles(directory="data"), name="media")
 
 app.include_router(mountains.router)
 app.include_router(users.router)
+app.include_router(geo.router)
 
 admin = Admin(app, db)
 admin.add_view(APIUserAdmin)
@@ -2,18 +2,38 @@
 Manage commands
 """
 
-import inspect
+import os
 import sys
+import time
 
 import pwinput
 import typer
 from fastapi import HTTPException, status
-from i18n import _
 from sqlalchemy.orm import Session
 from sqlmodel import select
 
-from dependencies import config, get_password_hash, get_session
-from models.users import APIUser
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.bulk import (  # noqa: E402
+    IMPORT_CHUNK_SIZE,
+    BulkImport,
+    json_documents,
+    ndjson_documents,
+)
+from app.catalogue import export_catalogue  # noqa: E402
+from app.dependencies import config, db, get_password_hash, get_session  # noqa: E402
+from app.geonames import (  # noqa: E402
+    CITY_FEATURE_CLASS,
+    LOAD_CHUNK_SIZE,
+    dump_lines,
+    latest_moddate,
+    load_cities,
+    sync_cities,
+    sync_files,
+)
+from app.i18n import _  # noqa: E402
+from app.models.users import APIUser  # noqa: E402
+from app.staticfiles import compress_static  # noqa: E402
 
 app = typer.Typer()
 
@@ -27,11 +47,9 @@ def hello(txt: str):
 @app.command()
 def commands():
     """list of commands"""
-    _imported = ("get_password_hash", "get_session")
     _list = [
-        f[0].replace("_", "-")
-        for f in inspect.getmembers(sys.modules["__main__"], inspect.isfunction)
-        if f[0] not in _imported
+        command.name or command.callback.__name__.replace("_", "-")
+        for command in app.registered_commands
     ]
     for item in _list:
         print(item)
@@ -105,6 +123,107 @@ def add_test_user():
     print(_("Test user {} is ready to test").format(user.username))
 
 
+@app.command()
+def compress_static_files(directory: str = "static", force: bool = False):
+    """write precompressed .br and .gz variants of static files"""
+    written = compress_static(directory, force=force)
+    for path in written:
+        print(path)
+    print(_("Compressed files written: {}").format(len(written)))
+
+
+@app.command()
+def export(output: str = "-", gzip: bool = False):
+    """export the catalogue as json lines to file or stdout (-), gzip for .gz file"""
+    gzip = gzip or output.endswith(".gz")
+    if output == "-":
+        for chunk in export_catalogue(db, gzip=gzip):
+            sys.stdout.buffer.write(chunk)
+        sys.stdout.buffer.flush()
+        return
+    size = 0
+    with open(output, "wb") as _file:
+        for chunk in export_catalogue(db, gzip=gzip):
+            _file.write(chunk)
+            size += len(chunk)
+    print(_("Exported {} bytes to {}").format(size, output))
+
+
+@app.command("import")
+def import_catalogue(path: str, dry_run: bool = False, chunk_size: int = IMPORT_CHUNK_SIZE):
+    """import ridges, peaks and routes from .json file or json lines file"""
+    db_session: Session = next(get_session())
+    started = time.perf_counter()
+    with open(path, encoding="utf-8") as _file:
+        if path.endswith(".json"):
+            documents = json_documents(_file.read())
+        else:
+            documents = ndjson_documents(_file)
+        result = BulkImport(db_session, dry_run=dry_run).run(documents, chunk_size)
+    seconds = time.perf_counter() - started
+
+    for error in result.errors:
+        print(f"{error.line}: {error.detail}")
+    rows = result.ridges + result.peaks + result.routes + result.sections + result.points
+    print(
+        _("Ridges: {}, peaks: {}, routes: {}, sections: {}, points: {}").format(
+            result.ridges, result.peaks, result.routes, result.sections, result.points
+        )
+    )
+    print(_("{} objects in {:.2f} s, {:.0f} objects/s").format(rows, seconds, rows / seconds))
+    if dry_run:
+        print(_("Dry run, nothing is written"))
+
+
+@app.command()
+def geonames_load(
+    path: str,
+    workers: int = 0,
+    chunk_size: int = LOAD_CHUNK_SIZE,
+    feature_classes: str = CITY_FEATURE_CLASS,
+    append: bool = False,
+    keep_indexes: bool = False,
+):
+    """load cities from GeoNames dump (cities500.txt, allCountries.zip) into geo_city"""
+    started = time.perf_counter()
+    counts = load_cities(
+        db,
+        dump_lines(path),
+        chunk_size=chunk_size,
+        workers=workers,
+        feature_classes=feature_classes,
+        replace=not append,
+        drop_indexes=not keep_indexes,
+    )
+    seconds = time.perf_counter() - started
+    count = counts["loaded"]
+    print(_("{} cities in {:.2f} s, {:.0f} rows/s").format(count, seconds, count / seconds))
+    if counts["skipped"]:
+        print(_("Skipped {} malformed lines").format(counts["skipped"]))
+
+
+@app.command()
+def geonames_sync(
+    paths: list[str],
+    all_files: bool = False,
+    chunk_size: int = LOAD_CHUNK_SIZE,
+    feature_classes: str = CITY_FEATURE_CLASS,
+):
+    """apply GeoNames modifications-*.txt and deletes-*.txt (files or directories) to geo_city"""
+    since = None if all_files else latest_moddate(db)
+    files = sync_files(paths, since)
+    started = time.perf_counter()
+    counts = sync_cities(db, files, chunk_size=chunk_size, feature_classes=feature_classes)
+    seconds = time.perf_counter() - started
+    print(
+        _("Files: {}, inserted: {}, updated: {}, deleted: {} in {:.2f} s").format(
+            counts["files"], counts["inserted"], counts["updated"], counts["deleted"], seconds
+        )
+    )
+    if counts["skipped"]:
+        print(_("Skipped {} malformed lines").format(counts["skipped"]))
+
+
 if __name__ == "__main__":
 
     app()
@@ -0,0 +1,120 @@
+"""
+Media URLs
+"""
+
+import hashlib
+import os
+import re
+import zlib
+from functools import lru_cache
+
+from starlette.datastructures import CommaSeparatedStrings
+
+import app.settings as app_settings
+from app.dependencies import config
+
+PROJECT_ROOT = os.path.abspath(os.path.dirname(__file__))
+MEDIA_DIR = f"{PROJECT_ROOT}{app_settings.MEDIA_ROOT}"
+
+FINGERPRINT_LENGTH = 12
+_FINGERPRINT_RE = re.compile(
+    rf"^(?P<stem>.+)\.(?P<fingerprint>[0-9a-f]{{{FINGERPRINT_LENGTH}}})(?P<ext>\.[^./]+)$"
+)
+
+_MEDIA_URL = config("MEDIA_URL", cast=str)
+_MEDIA_HOSTS = config("MEDIA_HOSTS", cast=CommaSeparatedStrings, default="")
+_MEDIA_FINGERPRINT = config("MEDIA_FINGERPRINT", cast=bool, default=False)
+
+
+@lru_cache(maxsize=4096)
+def _digest(full_path: str, size: int, mtime_ns: int) -> str:
+    """sha256 of the file content, cached while size and mtime are unchanged"""
+    sha = hashlib.sha256()
+    with open(full_path, "rb") as _file:
+        for chunk in iter(lambda: _file.read(1 << 16), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def file_digest(full_path: str, stat_result: os.stat_result | None = None) -> str:
+    """
+    get content digest of the media file
+
+    The file is read only when it was changed since the last call,
+    otherwise the digest is taken from cache.
+    """
+    if stat_result is None:
+        stat_result = os.stat(full_path)
+    return _digest(str(full_path), stat_result.st_size, stat_result.st_mtime_ns)
+
+
+def fingerprinted(path: str, digest: str) -> str:
+    """insert the fingerprint before file extension: a/b.jpg -> a/b.<fingerprint>.jpg"""
+    stem, ext = os.path.splitext(path)
+    return f"{stem}.{digest[:FINGERPRINT_LENGTH]}{ext}"
+
+
+def split_fingerprint(path: str) -> tuple[str, str | None]:
+    """get original path and fingerprint from fingerprinted path"""
+    match = _FINGERPRINT_RE.match(path)
+    if not match:
+        return path, None
+    return f"{match['stem']}{match['ext']}", match["fingerprint"]
+
+
+class MediaUrls:
+    """
+    Builder of public urls for the stored media files.
+
+    Base urls are resolved once, when the application starts.
+    If several base urls are set (CDN hosts) the file is always
+    assigned to the same host by hash of its path, so browser
+    and proxy caches stay warm. With fingerprinting the content
+    digest is a part of the file name, so urls change together
+    with the file and can be cached forever.
+
+    Attributes:
+        base_urls (tuple): Prefixes for media urls.
+        fingerprint (bool): Add content digest to the file name.
+    """
+
+    def __init__(self, base_urls, fingerprint: bool = False):
+        self.base_urls = tuple(url.rstrip("/") for url in base_urls)
+        self.fingerprint = fingerprint
+
+    def base_url(self, path: str) -> str:
+        """get base url for the path"""
+        if len(self.base_urls) == 1:
+            return self.base_urls[0]
+        shard = zlib.crc32(path.encode()) % len(self.base_urls)
+        return self.base_urls[shard]
+
+    def url(self, path: str | None) -> str | None:
+        """
+        get url for the media file
+
+        Args:
+            path (str): Path to the file as it is stored in db table.
+
+        Returns:
+            str: Url to the file or None if there is no file.
+        """
+        if not path:
+            return None
+        base_url = self.base_url(path)
+        if self.fingerprint:
+            try:
+                path = fingerprinted(path, file_digest(f"{MEDIA_DIR}{path}"))
+            except OSError:
+                pass
+        return f"{base_url}{path}"
+
+
+media_urls = MediaUrls(
+    list(_MEDIA_HOSTS) or [_MEDIA_URL], fingerprint=_MEDIA_FINGERPRINT
+)
+
+
+def media_url(path: str | None) -> str | None:
+    """get url for the media file"""
+    return media_urls.url(path)
@@ -13,7 +13,7 @@ from app.models.mountains import (
     GeoPoint, Ridge, RidgeInfoLink, Peak, PeakPhoto, Route, RouteSection,
     RoutePhoto, RoutePoint)
 from app.models.geoname import (
-    GeoCity, GeoCountry, GeoCountryLanguage, GeoCountryNeighbour,
+    GeoCity, GeoCityName, GeoCountry, GeoCountryLanguage, GeoCountryNeighbour,
     GeoCountryAdminSubject, GeoRUSSubject, GeoUKRSubject)
 
 sys.path.insert(0, dirname(dirname(abspath(__file__))))
@@ -0,0 +1,37 @@
+"""changed with microseconds
+
+Revision ID: 5f5ec2980151
+Revises: 16cd53acb59d
+Create Date: 2026-10-19 10:12:41.513208
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+from sqlalchemy.dialects import mysql
+
+# revision identifiers, used by Alembic.
+revision: str = '5f5ec2980151'
+down_revision: Union[str, Sequence[str], None] = '16cd53acb59d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for table in ('ridge', 'peak', 'route'):
+        op.alter_column(table, 'changed',
+                   existing_type=mysql.DATETIME(),
+                   type_=mysql.DATETIME(fsp=6),
+                   existing_nullable=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table in ('ridge', 'peak', 'route'):
+        op.alter_column(table, 'changed',
+                   existing_type=mysql.DATETIME(fsp=6),
+                   type_=mysql.DATETIME(),
+                   existing_nullable=False)
@@ -0,0 +1,32 @@
+"""route geometry
+
+Revision ID: 9b3d7e21c4a8
+Revises: 5f5ec2980151
+Create Date: 2026-10-19 15:02:17.284611
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+# revision identifiers, used by Alembic.
+revision: str = '9b3d7e21c4a8'
+down_revision: Union[str, Sequence[str], None] = '5f5ec2980151'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('route', sa.Column(
+        'geometry', sa.LargeBinary().with_variant(mysql.MEDIUMBLOB(), 'mysql'), nullable=True))
+
+    # no backfill: the geometry is the uploaded track, routes without it
+    # are read from their points, which are edited separately
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('route', 'geometry')
@@ -0,0 +1,52 @@
+"""route geometry levels
+
+Revision ID: c4e8a1f05d37
+Revises: 9b3d7e21c4a8
+Create Date: 2026-10-19 15:41:06.530172
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+from app.geometry import pack_levels, simplification_levels, unpack_geometry
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4e8a1f05d37'
+down_revision: Union[str, Sequence[str], None] = '9b3d7e21c4a8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+route = sa.table(
+    'route',
+    sa.column('id', sa.Integer),
+    sa.column('geometry', sa.LargeBinary),
+    sa.column('geometry_levels', sa.LargeBinary),
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('route', sa.Column(
+        'geometry_levels', sa.LargeBinary().with_variant(mysql.MEDIUMBLOB(), 'mysql'),
+        nullable=True))
+
+    # backfill: levels for every route with geometry, one track at a time
+    bind = op.get_bind()
+    route_ids = bind.execute(
+        sa.select(route.c.id).where(route.c.geometry.is_not(None))
+    ).scalars().all()
+    for route_id in route_ids:
+        geometry = bind.execute(
+            sa.select(route.c.geometry).where(route.c.id == route_id)
+        ).scalar()
+        levels = pack_levels(simplification_levels(unpack_geometry(geometry)))
+        bind.execute(
+            route.update().where(route.c.id == route_id).values(geometry_levels=levels))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('route', 'geometry_levels')
@@ -0,0 +1,73 @@
+"""geo city name
+
+Revision ID: d7f3a9b2e610
+Revises: c4e8a1f05d37
+Create Date: 2026-10-19 17:12:44.906315
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+from app.geonames import city_names
+
+# revision identifiers, used by Alembic.
+revision: str = 'd7f3a9b2e610'
+down_revision: Union[str, Sequence[str], None] = 'c4e8a1f05d37'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+CHUNK_SIZE = 10000
+
+geo_city = sa.table(
+    'geo_city',
+    sa.column('id', sa.Integer),
+    sa.column('geonameid', sa.Integer),
+    sa.column('name', sa.String),
+    sa.column('asciiname', sa.String),
+    sa.column('alternatenames', sa.String),
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    geo_city_name = op.create_table(
+        'geo_city_name',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('geonameid', sa.Integer(), nullable=False),
+        sa.Column('name', sqlmodel.sql.sqltypes.AutoString(length=200), nullable=False),
+        sa.Column('search_name', sqlmodel.sql.sqltypes.AutoString(length=200), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+
+    # backfill: names of stored cities (alternate names may be cut by the column,
+    # geonames-load fills the table from the dump)
+    bind = op.get_bind()
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(geo_city).where(geo_city.c.id > last_id)
+            .order_by(geo_city.c.id).limit(CHUNK_SIZE)
+        ).all()
+        if not rows:
+            break
+        names = [
+            {'geonameid': row.geonameid, 'name': name, 'search_name': key}
+            for row in rows
+            for name, key in city_names(row.name or '', row.asciiname or '', row.alternatenames or '')
+        ]
+        if names:
+            bind.execute(geo_city_name.insert(), names)
+        last_id = rows[-1].id
+
+    op.create_index(op.f('ix_geo_city_name_geonameid'), 'geo_city_name', ['geonameid'], unique=False)
+    op.create_index(op.f('ix_geo_city_name_search_name'), 'geo_city_name', ['search_name'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_geo_city_name_search_name'), table_name='geo_city_name')
+    op.drop_index(op.f('ix_geo_city_name_geonameid'), table_name='geo_city_name')
+    op.drop_table('geo_city_name')
@@ -35,6 +35,17 @@ class GeoCity(SQLModel, table=True):
     moddate: datetime | None = Field(default=None)
 
 
+class GeoCityName(SQLModel, table=True):
+    """
+    Model for normalized name of City (name, ascii name or alternate name)
+    """
+    __tablename__ = "geo_city_name"
+    id: int | None = Field(default=None, primary_key=True)
+    geonameid: int = Field(default=0, index=True)
+    name: str = Field(max_length=200)
+    search_name: str = Field(max_length=200, index=True)
+
+
 class GeoCountry(SQLModel, table=True):
     """
     Model for Country
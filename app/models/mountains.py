@@ -7,17 +7,26 @@ from datetime import datetime
 from typing import List, Optional
 
 from pydantic import BaseModel, ConfigDict, HttpUrl, computed_field
-from sqlalchemy import Column, Text
-from sqlalchemy.types import String, TypeDecorator
+from sqlalchemy import Column, LargeBinary, Text, event, func, inspect, select, update
+from sqlalchemy.dialects import mysql
+from sqlalchemy.orm import column_property, declared_attr, deferred, object_session
+from sqlalchemy.types import DateTime, String, TypeDecorator
 from sqlmodel import Field, Relationship, SQLModel
 
 import app.settings as app_settings
-from app.dependencies import config
+from app.geocoding import nearest_city
+from app.geometry import GEOMETRY_VERTEX_SIZE, unpack_geometry
+from app.media import media_url, media_urls
 from app.models.users import APIUser
 from app.schema.mountains import PeakListItem
 
 PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 
+# time of change with microseconds, so that every write gets new version
+ChangedDateTime = DateTime().with_variant(mysql.DATETIME(fsp=6), "mysql")
+# packed track of the route (see app.geometry), up to 16 MB in MySQL
+GeometryBlob = LargeBinary().with_variant(mysql.MEDIUMBLOB(), "mysql")
+
 
 class MediaRoot:
     """
@@ -69,7 +78,7 @@ class MediaRoot:
         """
         get prefix to photo url
         """
-        return config("MEDIA_URL", cast=str)
+        return media_urls.base_urls[0]
 
 
 class HttpUrlType(TypeDecorator):
@@ -136,7 +145,7 @@ class Ridge(SQLModel, table=True):
     editor_id: Optional[int] = Field(default=None, foreign_key="api_user.id")
     editor: Optional[APIUser] = Relationship()
     active: bool = Field(default=True)
-    changed: datetime = Field(default_factory=datetime.utcnow)
+    changed: datetime = Field(default_factory=datetime.utcnow, sa_type=ChangedDateTime)
 
     infolinks: List["RidgeInfoLink"] = Relationship(back_populates="ridge")
     peaks: List["Peak"] = Relationship(back_populates="ridge")
@@ -262,7 +271,7 @@ class Peak(SQLModel, table=True):
     editor_id: Optional[int] = Field(default=None, foreign_key="api_user.id")
     editor: Optional[APIUser] = Relationship()
     active: bool = Field(default=True)
-    changed: datetime = Field(default_factory=datetime.utcnow)
+    changed: datetime = Field(default_factory=datetime.utcnow, sa_type=ChangedDateTime)
 
     photos: List["PeakPhoto"] = Relationship(back_populates="peak")
     routes: List["Route"] = Relationship(back_populates="peak")
@@ -301,10 +310,17 @@ class Peak(SQLModel, table=True):
 
     @computed_field
     @property
-    def photo_url(self) -> str:
+    def photo_url(self) -> str | None:
         """url to photo"""
 
-        return f"{MediaRoot.image_root_url()}{self.photo}"
+        return media_url(self.photo)
+
+    @property
+    def nearest_city(self) -> dict | None:
+        """the nearest city to the peak"""
+        if self.point is None:
+            return None
+        return nearest_city(self.point.latitude, self.point.longitude)
 
 
 class PeakOut(BaseModel):
@@ -372,10 +388,10 @@ class PeakPhoto(SQLModel, table=True):
 
     @computed_field
     @property
-    def photo_url(self) -> str:
+    def photo_url(self) -> str | None:
         """url to photo"""
 
-        return f"{MediaRoot.image_root_url()}{self.photo}"
+        return media_url(self.photo)
 
 
 class Route(SQLModel, table=True):
@@ -404,13 +420,26 @@ class Route(SQLModel, table=True):
     descent: str | None = Field(default=None, sa_column=Column(Text))
     editor_id: Optional[int] = Field(default=None, foreign_key="api_user.id")
     editor: Optional[APIUser] = Relationship()
-    changed: datetime = Field(default_factory=datetime.utcnow)
+    changed: datetime = Field(default_factory=datetime.utcnow, sa_type=ChangedDateTime)
     ready: bool = Field(default=False)
+    geometry: bytes | None = Field(default=None, sa_type=GeometryBlob, exclude=True)
+    geometry_levels: bytes | None = Field(default=None, sa_type=GeometryBlob, exclude=True)
 
     photos: List["RoutePhoto"] = Relationship(back_populates="route")
     routepoints: List["RoutePoint"] = Relationship(back_populates="route")
     sections: List["RouteSection"] = Relationship(back_populates="route")
 
+    @declared_attr.directive
+    def __mapper_args__(cls) -> dict:
+        """the track and its simplification levels are loaded only when they are read"""
+        columns = cls.__table__.c
+        return {
+            "properties": {
+                "geometry": deferred(columns.geometry),
+                "geometry_levels": deferred(columns.geometry_levels),
+            }
+        }
+
     @computed_field
     @property
     def photos_list(self) -> list:
@@ -453,17 +482,26 @@ class Route(SQLModel, table=True):
 
     @computed_field
     @property
-    def photo_url(self) -> str:
+    def photo_url(self) -> str | None:
         """url to photo"""
 
-        return f"{MediaRoot.image_root_url()}{self.photo}"
+        return media_url(self.photo)
 
     @computed_field
     @property
-    def map_image_url(self) -> str:
+    def map_image_url(self) -> str | None:
         """url to map"""
 
-        return f"{MediaRoot.image_root_url()}{self.map_image}"
+        return media_url(self.map_image)
+
+    @property
+    def nearest_city(self) -> dict | None:
+        """the nearest city to the start of the route (first vertex of its track or first point)"""
+        coordinates = unpack_geometry(self.track_start)
+        if len(coordinates):
+            latitude, longitude = coordinates[0].tolist()
+            return nearest_city(latitude, longitude)
+        return nearest_city(self.start_latitude, self.start_longitude)
 
 
 class RouteOut(BaseModel):
@@ -578,10 +616,10 @@ class RoutePhoto(SQLModel, table=True):
 
     @computed_field
     @property
-    def photo_url(self) -> str:
+    def photo_url(self) -> str | None:
         """url to photo"""
 
-        return f"{MediaRoot.image_root_url()}{self.photo}"
+        return media_url(self.photo)
 
 
 class RoutePoint(SQLModel, table=True):
@@ -610,6 +648,33 @@ class RoutePoint(SQLModel, table=True):
         return self.point.longitude
 
 
+# start of the route read by SQL, without the track and the points: the first
+# vertex of the packed geometry and coordinates of the first route point
+_first_point = (
+    select(RoutePoint.point_id)
+    .where(RoutePoint.route_id == Route.id)
+    .order_by(RoutePoint.id)
+    .limit(1)
+    .correlate_except(RoutePoint)
+    .scalar_subquery()
+)
+Route.track_start = column_property(
+    func.substr(Route.__table__.c.geometry, 1, GEOMETRY_VERTEX_SIZE, type_=LargeBinary),
+    deferred=True,
+    group="start",
+)
+Route.start_latitude = column_property(
+    select(GeoPoint.latitude).where(GeoPoint.id == _first_point).scalar_subquery(),
+    deferred=True,
+    group="start",
+)
+Route.start_longitude = column_property(
+    select(GeoPoint.longitude).where(GeoPoint.id == _first_point).scalar_subquery(),
+    deferred=True,
+    group="start",
+)
+
+
 class RoutePointCreate(BaseModel):
     """
     Data Model for new Route Point
@@ -618,3 +683,113 @@ class RoutePointCreate(BaseModel):
     route_id: int
     description: Optional[str] = None
     point: GeoPointCreate
+
+
+_PARENTS = {
+    RidgeInfoLink: ("ridge_id", Ridge),
+    Peak: ("ridge_id", Ridge),
+    PeakPhoto: ("peak_id", Peak),
+    Route: ("peak_id", Peak),
+    RouteSection: ("route_id", Route),
+    RoutePhoto: ("route_id", Route),
+    RoutePoint: ("route_id", Route),
+}
+
+
+def touch(connection, model, row_id: int, changed: datetime | None = None) -> list:
+    """
+    set time of change for the row and for all its parents:
+    route -> peak -> ridge
+
+    Returns:
+        list: Touched rows as (table name, id).
+    """
+    changed = changed or datetime.utcnow()
+    touched = []
+    while model is not None and row_id is not None:
+        connection.execute(
+            update(model).where(model.id == row_id).values(changed=changed)
+        )
+        touched.append((model.__tablename__, row_id))
+        if model not in _PARENTS:
+            break
+        fk_name, parent = _PARENTS[model]
+        row_id = connection.execute(
+            select(getattr(model, fk_name)).where(model.id == row_id)
+        ).scalar()
+        model = parent
+    return touched
+
+
+def _parent_ids(target, fk_name: str) -> set:
+    """current and previous values of the foreign key"""
+    history = inspect(target).attrs[fk_name].history
+    ids = set(history.deleted or ())
+    ids.add(getattr(target, fk_name))
+    ids.discard(None)
+    return ids
+
+
+def _record_changes(target, rows):
+    """
+    remember changed rows in the session,
+    caches are invalidated by them after commit
+    """
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault("changed_rows", set()).update(rows)
+
+
+def _on_change(mapper, connection, target):
+    """set time of change for parents of inserted, updated or deleted row"""
+    rows = []
+    if isinstance(target, _VERSIONED):
+        rows.append((target.__tablename__, target.id))
+    if type(target) in _PARENTS:
+        fk_name, parent = _PARENTS[type(target)]
+        changed = datetime.utcnow()
+        for parent_id in _parent_ids(target, fk_name):
+            rows.extend(touch(connection, parent, parent_id, changed))
+    _record_changes(target, rows)
+
+
+def _on_update(mapper, connection, target):
+    """set time of change for parents of updated row"""
+    if object_session(target).is_modified(target, include_collections=False):
+        _on_change(mapper, connection, target)
+
+
+def _on_point_update(mapper, connection, target):
+    """set time of change for peaks and routes with moved geo point"""
+    if not object_session(target).is_modified(target, include_collections=False):
+        return
+    peak_ids = connection.execute(select(Peak.id).where(Peak.point_id == target.id)).scalars()
+    route_ids = connection.execute(
+        select(RoutePoint.route_id).where(RoutePoint.point_id == target.id)
+    ).scalars()
+    rows = []
+    changed = datetime.utcnow()
+    for model, ids in ((Peak, set(peak_ids)), (Route, set(route_ids) - {None})):
+        for row_id in ids:
+            rows.extend(touch(connection, model, row_id, changed))
+    _record_changes(target, rows)
+
+
+def _set_changed(mapper, connection, target):
+    """set time of change for updated row"""
+    session = object_session(target)
+    if session is None or session.is_modified(target, include_collections=False):
+        target.changed = datetime.utcnow()
+
+
+_VERSIONED = (Ridge, Peak, Route)
+
+for _model in _VERSIONED:
+    event.listen(_model, "before_update", _set_changed)
+
+for _model in (Ridge, *_PARENTS):
+    event.listen(_model, "after_insert", _on_change)
+    event.listen(_model, "after_update", _on_update)
+    event.listen(_model, "after_delete", _on_change)
+
+event.listen(GeoPoint, "after_update", _on_point_update)
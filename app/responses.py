@@ -0,0 +1,57 @@
+"""
+Json responses
+"""
+
+from functools import lru_cache
+from typing import Any, Mapping
+
+from fastapi import Response
+from pydantic import TypeAdapter
+
+
+@lru_cache(maxsize=None)
+def type_adapter(schema) -> TypeAdapter:
+    """get adapter for the schema, e.g. RouteOut or List[RouteListItem]"""
+    return TypeAdapter(schema)
+
+
+def dump_json(schema, content: Any) -> bytes:
+    """
+    validate content into schema once and serialize it to json
+
+    Args:
+        schema: Pydantic model or type, e.g. List[PeakListItem].
+        content: Orm objects or data for the schema.
+
+    Returns:
+        bytes: Json document.
+    """
+    adapter = type_adapter(schema)
+    return adapter.dump_json(adapter.validate_python(content, from_attributes=True))
+
+
+class SchemaJSONResponse(Response):
+    """
+    Json response built by schema.
+
+    FastAPI validates the returned object against response_model,
+    converts it to python data and dumps it with json module. The
+    Response returned by handler is sent as is, so the content is
+    validated once and serialized to bytes by pydantic-core.
+    response_model of the route still describes it in OpenAPI.
+
+    Args:
+        schema: Pydantic model or type of the content.
+        content: Orm objects or data for the schema.
+    """
+
+    media_type = "application/json"
+
+    def __init__(
+        self,
+        schema,
+        content: Any,
+        status_code: int = 200,
+        headers: Mapping[str, str] | None = None,
+    ):
+        super().__init__(dump_json(schema, content), status_code, headers)
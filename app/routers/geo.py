@@ -0,0 +1,72 @@
+"""
+Router Geo
+"""
+
+from typing import Annotated, List
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy import case, func
+from sqlmodel import Session, select
+
+import app.settings as app_settings
+from app.dependencies import get_session
+from app.geonames import search_name
+from app.i18n import _
+from app.models.geoname import GeoCity, GeoCityName
+from app.responses import SchemaJSONResponse
+from app.schema.geo import GeoCityOut
+
+router = APIRouter(
+    prefix="/geo",
+    tags=["geo"],
+    responses={404: {"description": _("Not found")}},
+)
+
+
+@router.get("/cities/search", response_model=List[GeoCityOut])
+async def search_cities(
+    q: Annotated[str, Query(min_length=app_settings.CITY_SEARCH_MIN_LENGTH, max_length=100)],
+    country: Annotated[str | None, Query(min_length=2, max_length=2)] = None,
+    limit: Annotated[int, Query(ge=1, le=50)] = 10,
+    session: Session = Depends(get_session),
+) -> List[GeoCityOut]:
+    """
+    search cities by the beginning of name in any script
+
+    The query and names of cities (name, ascii name and alternate
+    names in any language) are transliterated to latin the same way,
+    so "Яремче" finds the city by its Ukrainian name and "Yaremche" by
+    ascii one. Exact matches go first, then more populated cities;
+    the matched name of the city is its exactly matching name if any.
+    Shorter prefixes than CITY_SEARCH_MIN_LENGTH (after transliteration)
+    find nothing, they would match a large part of all names.
+    """
+    key = search_name(q)
+    if len(key) < app_settings.CITY_SEARCH_MIN_LENGTH:
+        return SchemaJSONResponse(List[GeoCityOut], [])
+    names = (
+        select(
+            GeoCityName.geonameid,
+            func.coalesce(
+                func.max(case((GeoCityName.search_name == key, GeoCityName.name))),
+                func.min(GeoCityName.name),
+            ).label("matched_name"),
+            func.max(case((GeoCityName.search_name == key, 1), else_=0)).label("exact"),
+        )
+        .where(GeoCityName.search_name.like(f"{key}%"))
+        .group_by(GeoCityName.geonameid)
+        .subquery()
+    )
+    statement = (
+        select(GeoCity, names.c.matched_name)
+        .join(names, names.c.geonameid == GeoCity.geonameid)
+        .order_by(names.c.exact.desc(), GeoCity.population.desc(), GeoCity.id)
+        .limit(limit)
+    )
+    if country:
+        statement = statement.where(GeoCity.country == country.upper())
+    cities = [
+        {**city.model_dump(), "matched_name": matched_name}
+        for city, matched_name in session.exec(statement).all()
+    ]
+    return SchemaJSONResponse(List[GeoCityOut], cities)
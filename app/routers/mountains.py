@@ -2,13 +2,52 @@
 Router Mountains
 """
 
-from typing import Annotated, List
-
-from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, status
+import hashlib
+import xml.etree.ElementTree as ET
+from typing import Annotated, List, Literal
+
+import anyio
+import numpy as np
+from fastapi import (
+    APIRouter,
+    Depends,
+    HTTPException,
+    Path,
+    Query,
+    Request,
+    UploadFile,
+    status,
+)
+from fastapi.responses import Response, StreamingResponse
 from slugify import slugify
+from sqlalchemy.orm import selectinload, undefer_group
 from sqlmodel import Session, select
 
+import app.settings as app_settings
+from app.bulk import (
+    BulkImport,
+    add_route_points,
+    add_route_sections,
+    json_documents,
+    ndjson_documents,
+    set_route_geometry,
+)
+from app.cache.response import CacheEntry, listen_changed_rows, response_cache
+from app.catalogue import export_catalogue
+from app.clusters import ClusterIndex
+from app.conditional import is_not_modified, validator_headers, version_validators
 from app.dependencies import db, get_session
+from app.fieldsets import FieldSet, fieldset
+from app.geocoding import cities_generation
+from app.geometry import (
+    POLYLINE_PRECISION,
+    encode_polyline,
+    simplification_levels,
+    unpack_geometry,
+    unpack_levels,
+    zoom_tolerance,
+)
+from app.geonames import CITIES_TAG
 from app.i18n import _
 from app.models.mountains import (
     GeoPoint,
@@ -22,22 +61,41 @@ from app.models.mountains import (
     RouteSection,
 )
 from app.models.users import APIUser
+from app.responses import SchemaJSONResponse, dump_json
 from app.routers.users import get_current_active_user
 from app.schema.mountains import (
+    ImportResult,
+    PeakBatchItem,
+    PeakClusterOut,
     PeakCreate,
     PeakOut,
     PeakListItem,
+    PointImport,
     ResponseStatus,
     RidgeCreate,
     RidgeInfoLinkCreate,
     RidgeListItem,
     RidgeOut,
+    RouteBatchItem,
+    RouteBatchResult,
     RouteCreate,
+    RouteGeometryOut,
     RouteListItem,
     RouteOut,
+    RoutePageOut,
     RoutePointCreate,
     RouteSectionCreate,
     RouteSectionOut,
+    SectionImport,
+)
+from app.staticfiles import accepted_encodings
+from app.tiles import MVT_MEDIA_TYPE, create_tile_service
+from app.tracks import (
+    TRACK_MEDIA_TYPES,
+    export_tracks,
+    read_track,
+    simplify,
+    track_format,
 )
 
 router = APIRouter(
@@ -45,24 +103,106 @@ router = APIRouter(
     tags=["mountains"],
     responses={404: {"description": _("Not found")}},
 )
-
-
-def unique_slugify(klas, text: str) -> str:
-    """slugify string and check that is unique"""
-    session = Session(db)
+tile_service = create_tile_service(db)
+listen_changed_rows(tile_service.index.changed)
+cluster_index = ClusterIndex(db, app_settings.CLUSTER_MAX_ZOOM)
+listen_changed_rows(cluster_index.changed)
+
+# relationships read by can_be_deleted and *_list fields of the schemas
+_ROUTE_LISTS = (
+    selectinload(Route.photos),
+    selectinload(Route.routepoints).selectinload(RoutePoint.point),
+    selectinload(Route.sections),
+)
+_PEAK_LISTS = (
+    selectinload(Peak.photos),
+    selectinload(Peak.routes).options(*_ROUTE_LISTS),
+)
+# everything read by PeakOut and RouteOut
+_PEAK_DETAIL = (
+    selectinload(Peak.ridge).options(selectinload(Ridge.peaks), selectinload(Ridge.infolinks)),
+    selectinload(Peak.point),
+    *_PEAK_LISTS,
+)
+_ROUTE_DETAIL = (
+    *_ROUTE_LISTS,
+    selectinload(Route.peak).options(selectinload(Peak.photos), selectinload(Peak.routes)),
+    undefer_group("start"),
+)
+# what to load for the fields of schemas (see FieldSet.options)
+_FIELD_LOADS = {
+    Ridge: {
+        "needs": {
+            "peaks_list": ("peaks",),
+            "infolinks_list": ("infolinks",),
+            "can_be_deleted": ("peaks", "infolinks"),
+        },
+        "nested": {},
+        "always": ("changed",),
+    },
+    Peak: {
+        "needs": {
+            "photo_url": ("photo",),
+            "photos_list": ("photos",),
+            "routes_list": ("routes",),
+            "can_be_deleted": ("photos", "routes"),
+            "nearest_city": ("point",),
+        },
+        "nested": {
+            "ridge": (selectinload(Ridge.peaks), selectinload(Ridge.infolinks)),
+            "routes": _ROUTE_LISTS,
+        },
+        "always": ("changed", "ridge_id"),
+    },
+    Route: {
+        "needs": {
+            "photo_url": ("photo",),
+            "map_image_url": ("map_image",),
+            "photos_list": ("photos",),
+            "routepoints_list": ("routepoints",),
+            "sections_list": ("sections",),
+            "can_be_deleted": ("photos", "routepoints", "sections"),
+            "nearest_city": ("track_start", "start_latitude", "start_longitude"),
+        },
+        "nested": {
+            "peak": (selectinload(Peak.photos), selectinload(Peak.routes)),
+            "routepoints": (selectinload(RoutePoint.point),),
+        },
+        "always": ("changed", "peak_id"),
+    },
+}
+
+
+def unique_slugify(session: Session, klas, text: str) -> str:
+    """slugify string and check that is unique, taken slugs are selected by one query"""
     slug = slugify(text)
+    statement = select(klas.slug).where((klas.slug == slug) | klas.slug.like(f"{slug}-%"))
+    taken = set(session.exec(statement).all())
     for k in range(100):
         _slug = slug
         if k:
             _slug = f"{slug}-{k}"
-        statement = select(klas).where(klas.slug == _slug)
-        item = session.exec(statement).first()
-        if not item:
+        if _slug not in taken:
             slug = _slug
             break
     return slug
 
 
+def saved(session: Session, schema, obj) -> SchemaJSONResponse:
+    """
+    save the object with related new rows in one transaction
+    and return it as response
+
+    Flush sends the changes and gets ids, the response is built before
+    commit, so the object is not selected again after commit.
+    """
+    session.add(obj)
+    session.flush()
+    response = SchemaJSONResponse(schema, obj)
+    session.commit()
+    return response
+
+
 def checked_ridge(session: Session, ridge_id: int = None, slug: str = None) -> Ridge:
     """select and return the ridge by id or slug. Raise 404 if ridge is not found"""
     if ridge_id:
@@ -105,6 +245,90 @@ def checked_route(session: Session, route_id: int = None, slug: str = None) -> R
     return route
 
 
+def shaped(statement, fields: FieldSet, model, default=()):
+    """add loader options for the fieldset, or default ones for the default schema"""
+    if fields.fields is None:
+        return statement.options(*default)
+    return statement.options(*fields.options(model, **_FIELD_LOADS[model]))
+
+
+def batch_slugs(slugs: str) -> list:
+    """unique slugs of batch lookup in the order of request. Raise 400 if there are too many"""
+    items = list(dict.fromkeys(slug.strip() for slug in slugs.split(",") if slug.strip()))
+    if len(items) > app_settings.BATCH_MAX_SLUGS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=_("Too many slugs, maximum is {}").format(app_settings.BATCH_MAX_SLUGS),
+        )
+    return items
+
+
+def batch_items(items: list) -> list:
+    """items of batch writing. Raise 400 if there are too many"""
+    if len(items) > app_settings.BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=_("Too many items, maximum is {}").format(app_settings.BATCH_MAX_ITEMS),
+        )
+    return items
+
+
+def ridge_version(session: Session, slug: str) -> tuple | None:
+    """version of the ridge: id and time of change"""
+    statement = select(Ridge.id, Ridge.changed).where(Ridge.slug == slug)
+    return session.exec(statement).first()
+
+
+def peak_version(session: Session, slug: str) -> tuple | None:
+    """version of the peak: id, time of change of the peak and of its ridge"""
+    statement = (
+        select(Peak.id, Peak.changed, Ridge.changed)
+        .outerjoin(Ridge, Peak.ridge_id == Ridge.id)
+        .where(Peak.slug == slug)
+    )
+    return session.exec(statement).first()
+
+
+def route_version(session: Session, slug: str) -> tuple | None:
+    """version of the route: id, time of change of the route and of its peak"""
+    statement = (
+        select(Route.id, Route.changed, Peak.changed)
+        .outerjoin(Peak, Route.peak_id == Peak.id)
+        .where(Route.slug == slug)
+    )
+    return session.exec(statement).first()
+
+
+def route_page_version(session: Session, slug: str) -> tuple | None:
+    """version of the route page: id and times of change of route, peak and ridge"""
+    statement = (
+        select(Route.id, Route.changed, Peak.changed, Ridge.changed)
+        .outerjoin(Peak, Route.peak_id == Peak.id)
+        .outerjoin(Ridge, Peak.ridge_id == Ridge.id)
+        .where(Route.slug == slug)
+    )
+    return session.exec(statement).first()
+
+
+def track_response(
+    request: Request, kind: str, version: tuple, filename: str, export
+) -> Response:
+    """
+    streaming response with exported tracks, or 304
+
+    ETag and Last-Modified are made from the version of the object,
+    so the client (or proxy) keeps the export while it is actual
+    and revalidates it without the export being generated.
+    """
+    format = request.path_params["format"]
+    etag, modified = version_validators(f"{kind}.{format}", version)
+    headers = validator_headers(etag, modified)
+    if is_not_modified(request.headers, etag, modified):
+        return Response(status_code=304, headers=headers)
+    headers["Content-Disposition"] = f'attachment; filename="{filename}.{format}"'
+    return StreamingResponse(export, media_type=TRACK_MEDIA_TYPES[format], headers=headers)
+
+
 def can_add(current_user: APIUser) -> bool:
     """can user add this object"""
     if not (current_user.is_admin or current_user.is_editor):
@@ -127,11 +351,102 @@ def can_edit(current_user: APIUser, obj) -> bool:
     return True
 
 
+@router.get("/cache/stats")
+async def get_cache_stats(
+    current_user: Annotated[APIUser, Depends(get_current_active_user)],
+) -> dict:
+    """get counters of the response cache"""
+    if not current_user.is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=_("No permission for this action"),
+        )
+    return response_cache.stats()
+
+
+@router.get("/export.ndjson")
+async def export(request: Request) -> StreamingResponse:
+    """
+    stream the whole catalogue as json lines
+
+    The output is compressed on the fly if the client accepts gzip.
+    """
+    gzip = "gzip" in accepted_encodings(request.headers.get("accept-encoding", ""))
+    headers = {"Vary": "Accept-Encoding"}
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(
+        export_catalogue(db, gzip=gzip), media_type="application/x-ndjson", headers=headers
+    )
+
+
+@router.get("/tiles/{z}/{x}/{y}.mvt")
+async def get_tile(
+    z: Annotated[int, Path(ge=0, le=app_settings.TILE_MAX_ZOOM)],
+    x: Annotated[int, Path(ge=0)],
+    y: Annotated[int, Path(ge=0)],
+    request: Request,
+) -> Response:
+    """
+    get vector tile with peaks and route lines
+
+    Layer "peaks" has points with slug, name and height, layer "routes"
+    has lines with slug, name and difficulty simplified for the zoom.
+    """
+    if x >= 2**z or y >= 2**z:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=_("Tile not found"))
+    data = await anyio.to_thread.run_sync(tile_service.tile, z, x, y)
+    etag = f'"{hashlib.sha1(data).hexdigest()}"'
+    headers = validator_headers(etag, None)
+    if is_not_modified(request.headers, etag, None):
+        return Response(status_code=304, headers=headers)
+    return Response(data, media_type=MVT_MEDIA_TYPE, headers=headers)
+
+
+@router.post("/import", response_model=ImportResult)
+async def import_catalogue(
+    request: Request,
+    current_user: Annotated[APIUser, Depends(get_current_active_user)],
+    dry_run: bool = False,
+    session: Session = Depends(get_session),
+) -> ImportResult:
+    """
+    import ridges, peaks and routes with sections and points
+
+    The body is json (array or single document) for application/json
+    and json lines otherwise, see app.bulk for the documents.
+    """
+    can_add(current_user)
+
+    body = await request.body()
+    try:
+        if request.headers.get("content-type", "").startswith("application/json"):
+            documents = list(json_documents(body))
+        else:
+            documents = ndjson_documents(body.decode().splitlines())
+    except ValueError as error:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=_("Invalid document: {}").format(error),
+        ) from error
+
+    bulk = BulkImport(session, editor_id=current_user.id, dry_run=dry_run)
+    return await anyio.to_thread.run_sync(bulk.run, documents)
+
+
 @router.get("/ridges", response_model=List[RidgeListItem])
-async def get_ridges(session: Session = Depends(get_session)) -> list[RidgeListItem]:
+async def get_ridges(
+    request: Request,
+    fields: FieldSet = Depends(fieldset(RidgeOut, RidgeListItem)),
+    session: Session = Depends(get_session),
+) -> list[RidgeListItem]:
     """get list of mountain ridges"""
-    ridges = session.exec(select(Ridge)).all()
-    return ridges
+
+    def build():
+        ridges = session.exec(shaped(select(Ridge), fields, Ridge)).all()
+        return CacheEntry(fields.dump(ridges, many=True), tags=["ridge"])
+
+    return await response_cache.respond(request, build)
 
 
 @router.post("/ridges/add", response_model=RidgeOut)
@@ -147,13 +462,10 @@ async def add_ridge(
         name=ridge.name,
         description=ridge.description,
         editor_id=current_user.id,
-        slug=unique_slugify(Ridge, ridge.name),
+        slug=unique_slugify(session, Ridge, ridge.name),
     )
 
-    session.add(db_ridge)
-    session.commit()
-    session.refresh(db_ridge)
-    return db_ridge
+    return saved(session, RidgeOut, db_ridge)
 
 
 @router.put("/ridge/{slug}", response_model=RidgeOut)
@@ -166,29 +478,62 @@ async def update_ridge(
     """update the ridge fields"""
     db_ridge = checked_ridge(session, slug=slug)
 
-    can_edit(current_user)
+    can_edit(current_user, db_ridge)
 
     ridge_dict = ridge.model_dump(exclude_unset=True)
     for key, value in ridge_dict.items():
         setattr(db_ridge, key, value)
 
-    session.add(db_ridge)
-    session.commit()
-    session.refresh(db_ridge)
-
-    return db_ridge
+    return saved(session, RidgeOut, db_ridge)
 
 
-@router.get("/ridge/{slug}")
-async def get_ridge(slug: str, session: Session = Depends(get_session)) -> RidgeOut:
-    """get the ridge by slug"""
-    statement = select(Ridge).where(Ridge.slug == slug)
+@router.get("/ridge/{slug}.{format}")
+async def export_ridge_tracks(
+    slug: str,
+    format: Literal["gpx", "kml", "geojson"],
+    request: Request,
+    session: Session = Depends(get_session),
+) -> StreamingResponse:
+    """get routes and peaks of the ridge as GPX, KML or GeoJSON"""
+    statement = select(Ridge.id, Ridge.changed, Ridge.name).where(Ridge.slug == slug)
     ridge = session.exec(statement).first()
     if ridge is None:
         raise HTTPException(status_code=404, detail=_("Ridge not found"))
-    ridge_out = RidgeOut.model_validate(ridge)
+    export = export_tracks(
+        db, format, ridge.name, Peak.ridge_id == ridge.id, Peak.ridge_id == ridge.id
+    )
+    return track_response(request, "ridge", (ridge.id, ridge.changed), slug, export)
 
-    return ridge_out
+
+@router.get("/ridge/{slug}")
+async def get_ridge(
+    slug: str,
+    request: Request,
+    fields: FieldSet = Depends(fieldset(RidgeOut)),
+    session: Session = Depends(get_session),
+) -> RidgeOut:
+    """get the ridge by slug"""
+
+    def version():
+        _version = ridge_version(session, slug)
+        if _version is None:
+            raise HTTPException(status_code=404, detail=_("Ridge not found"))
+        return version_validators(fields.kind("ridge"), _version)
+
+    def build():
+        statement = shaped(select(Ridge).where(Ridge.slug == slug), fields, Ridge)
+        ridge = session.exec(statement).first()
+        if ridge is None:
+            raise HTTPException(status_code=404, detail=_("Ridge not found"))
+        etag, modified = version_validators(fields.kind("ridge"), (ridge.id, ridge.changed))
+        return CacheEntry(
+            fields.dump(ridge),
+            tags=[f"ridge:{ridge.id}"],
+            etag=etag,
+            modified=modified,
+        )
+
+    return await response_cache.respond(request, build, version)
 
 
 @router.post("/ridge/{ridge_id}/add/link", response_model=RidgeInfoLink)
@@ -201,7 +546,7 @@ async def add_ridge_infolink(
     """add new link to the ridge"""
     ridge = checked_ridge(session, ridge_id=ridge_id)
 
-    can_edit(current_user)
+    can_edit(current_user, ridge)
 
     db_link = RidgeInfoLink(
         ridge_id=ridge.id,
@@ -209,10 +554,7 @@ async def add_ridge_infolink(
         description=infolink.description,
     )
 
-    session.add(db_link)
-    session.commit()
-    session.refresh(db_link)
-    return db_link
+    return saved(session, RidgeInfoLink, db_link)
 
 
 @router.delete("/ridge/{slug}", response_model=ResponseStatus)
@@ -224,7 +566,7 @@ async def delete_ridge(
     """delete the ridge"""
     ridge = checked_ridge(session, slug=slug)
 
-    can_edit(current_user)
+    can_edit(current_user, ridge)
 
     session.delete(ridge)
     session.commit()
@@ -245,7 +587,7 @@ async def delete_ridge_link(
     link = session.exec(statement).first()
     if link is None:
         raise HTTPException(status_code=404, detail=_("Ridge info link not found"))
-    can_edit(current_user)
+    can_edit(current_user, link.ridge)
 
     session.delete(link)
     session.commit()
@@ -258,48 +600,124 @@ async def delete_ridge_link(
 
 @router.get("/ridge/peaks/{slug}", response_model=List[PeakListItem])
 async def get_ridge_peaks(
-    slug: str, session: Session = Depends(get_session)
+    slug: str,
+    fields: FieldSet = Depends(fieldset(PeakOut, PeakListItem)),
+    session: Session = Depends(get_session),
 ) -> List[PeakListItem]:
     """get list of ridge peaks"""
     ridge = checked_ridge(session, slug=slug)
 
     statement = select(Peak).where(Peak.ridge == ridge)
-    peaks = session.exec(statement).all()
-    # peaks = [PeakShortOut.model_validate(peak) for peak in peaks]
+    peaks = session.exec(shaped(statement, fields, Peak)).all()
 
-    return peaks
+    return SchemaJSONResponse(List[fields.output], peaks)
 
 
-@router.get("/peaks")
-async def get_peaks(session: Session = Depends(get_session)) -> list[Peak]:
+@router.get("/peaks", response_model=List[PeakOut])
+async def get_peaks(
+    fields: FieldSet = Depends(fieldset(PeakOut)),
+    session: Session = Depends(get_session),
+) -> List[PeakOut]:
     """get list of all peaks"""
-    peaks = session.exec(select(Peak)).all()
-    return peaks
+    peaks = session.exec(shaped(select(Peak), fields, Peak, _PEAK_DETAIL)).all()
+    return SchemaJSONResponse(List[fields.output], peaks)
 
 
-@router.get("/peaks/search", response_model=list[PeakListItem])
+@router.get("/peaks/search", response_model=List[PeakListItem])
 async def search_peak(
     key: Annotated[str | None, Query(max_length=50)] = None,
+    fields: FieldSet = Depends(fieldset(PeakOut, PeakListItem)),
     session: Session = Depends(get_session),
 ) -> list[PeakListItem]:
     """search peaks by slug or name"""
     statement = select(Peak)
     if key:
         statement = statement.where(Peak.slug.contains(key) | Peak.name.contains(key))
-    peaks = session.exec(statement).all()
+    peaks = session.exec(shaped(statement, fields, Peak)).all()
+
+    return SchemaJSONResponse(List[fields.output], peaks)
 
-    return peaks
+
+@router.get("/peaks/clusters", response_model=List[PeakClusterOut])
+async def get_peak_clusters(
+    bbox: Annotated[str, Query(max_length=128)],
+    zoom: Annotated[int, Query(ge=0, le=22)],
+) -> List[PeakClusterOut]:
+    """
+    get clusters of peaks within bbox "west,south,east,north" for zoom level
+
+    Every cluster has its centroid, count of peaks and the highest peak,
+    peaks are single above CLUSTER_MAX_ZOOM.
+    """
+    try:
+        west, south, east, north = (float(value) for value in bbox.split(","))
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=_("Invalid bbox"))
+    if not (-180 <= west <= east <= 180 and -90 <= south <= north <= 90):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=_("Invalid bbox"))
+    clusters = await anyio.to_thread.run_sync(
+        cluster_index.clusters, (west, south, east, north), zoom
+    )
+    return SchemaJSONResponse(List[PeakClusterOut], clusters)
+
+
+@router.get("/peaks/batch", response_model=List[PeakBatchItem])
+async def get_peaks_batch(
+    slugs: Annotated[str, Query(max_length=8192)],
+    session: Session = Depends(get_session),
+) -> List[PeakBatchItem]:
+    """get peaks by comma separated slugs"""
+    items = batch_slugs(slugs)
+    statement = select(Peak).where(Peak.slug.in_(items)).options(*_PEAK_DETAIL)
+    # the collation of slugs is case insensitive
+    peaks = (
+        {peak.slug.lower(): peak for peak in session.exec(statement).all()} if items else {}
+    )
+
+    return SchemaJSONResponse(
+        List[PeakBatchItem],
+        [
+            {"slug": slug, "status": 200, "peak": peaks[slug.lower()]}
+            if slug.lower() in peaks
+            else {"slug": slug, "status": 404, "detail": _("Peak not found")}
+            for slug in items
+        ],
+    )
 
 
 @router.get("/peak/{slug}", response_model=PeakOut)
-async def get_peak(slug: str, session: Session = Depends(get_session)) -> PeakOut:
+async def get_peak(
+    slug: str,
+    request: Request,
+    fields: FieldSet = Depends(fieldset(PeakOut)),
+    session: Session = Depends(get_session),
+) -> PeakOut:
     """get the peak by slug"""
-    statement = select(Peak).where(Peak.slug == slug)
-    peak = session.exec(statement).first()
-    if peak is None:
-        raise HTTPException(status_code=404, detail=_("Peak not found"))
 
-    return peak
+    def version():
+        _version = peak_version(session, slug)
+        if _version is None:
+            raise HTTPException(status_code=404, detail=_("Peak not found"))
+        return version_validators(fields.kind("peak"), (*_version, cities_generation()))
+
+    def build():
+        generation = cities_generation()
+        statement = shaped(select(Peak).where(Peak.slug == slug), fields, Peak)
+        peak = session.exec(statement).first()
+        if peak is None:
+            raise HTTPException(status_code=404, detail=_("Peak not found"))
+        ridge_changed = peak.ridge.changed if peak.ridge else None
+        etag, modified = version_validators(
+            fields.kind("peak"), (peak.id, peak.changed, ridge_changed, generation)
+        )
+        return CacheEntry(
+            fields.dump(peak),
+            tags=[f"peak:{peak.id}", f"ridge:{peak.ridge_id}", CITIES_TAG],
+            etag=etag,
+            modified=modified,
+        )
+
+    return await response_cache.respond(request, build, version)
 
 
 @router.post("/peaks/add", response_model=PeakOut)
@@ -311,31 +729,21 @@ async def add_peak(
     """add new peak"""
     can_add(current_user)
 
-    point_id = None
-    if peak.point:
-        db_point = GeoPoint(
-            latitude=peak.point.latitude,
-            longitude=peak.point.longitude,
-        )
-        session.add(db_point)
-        session.commit()
-        session.refresh(db_point)
-        point_id = db_point.id
-
     db_peak = Peak(
         name=peak.name,
         description=peak.description,
-        slug=unique_slugify(Peak, peak.name),
+        slug=unique_slugify(session, Peak, peak.name),
         ridge_id=peak.ridge_id,
         height=peak.height,
-        point_id=point_id,
         editor_id=current_user.id,
     )
+    if peak.point:
+        db_peak.point = GeoPoint(
+            latitude=peak.point.latitude,
+            longitude=peak.point.longitude,
+        )
 
-    session.add(db_peak)
-    session.commit()
-    session.refresh(db_peak)
-    return db_peak
+    return saved(session, PeakOut, db_peak)
 
 
 @router.post("/peak/{peak_id}/add/photo", response_model=PeakPhoto)
@@ -347,9 +755,9 @@ async def add_peak_photo(
     session: Session = Depends(get_session),
 ) -> PeakPhoto:
     """add new peak photo"""
-    checked_peak(session, peak_id=peak_id)
+    peak = checked_peak(session, peak_id=peak_id)
 
-    can_edit(current_user)
+    can_edit(current_user, peak)
 
     image_dir = Peak.path_to_images()
     try:
@@ -361,11 +769,7 @@ async def add_peak_photo(
         photo_path = f"{_path}/{file.filename}"
         image = PeakPhoto(peak_id=peak_id, photo=photo_path, description=description)
 
-        session.add(image)
-        session.commit()
-        session.refresh(image)
-
-        return image
+        return saved(session, PeakPhoto, image)
 
     except Exception as error:
         return {"message": error.args, "success": False}
@@ -381,31 +785,25 @@ async def update_peak(
     """update the peak fields"""
     db_peak = checked_peak(session, slug=slug)
 
-    can_edit(current_user)
+    can_edit(current_user, db_peak)
 
-    peak_dict = peak.model_dump(exclude_unset=True)
+    peak_dict = peak.model_dump(exclude_unset=True, exclude={"point"})
     for key, value in peak_dict.items():
-        if key == "point_id":
-            continue
         setattr(db_peak, key, value)
 
-    point_id = None
-    if peak.point:
-        db_point = GeoPoint(
+    if peak.point is None:
+        db_peak.point = None
+    elif db_peak.point is None or (db_peak.point.latitude, db_peak.point.longitude) != (
+        peak.point.latitude,
+        peak.point.longitude,
+    ):
+        # a new point: the old one may be shared with route points
+        db_peak.point = GeoPoint(
             latitude=peak.point.latitude,
             longitude=peak.point.longitude,
         )
-        session.add(db_point)
-        session.commit()
-        session.refresh(db_point)
-        point_id = db_point.id
-    db_peak.point_id = point_id
-
-    session.add(db_peak)
-    session.commit()
-    session.refresh(db_peak)
 
-    return db_peak
+    return saved(session, PeakOut, db_peak)
 
 
 @router.put("/peak/{peak_id}/photo", response_model=PeakOut)
@@ -418,7 +816,7 @@ async def update_peak_photo(
     """update the peak photo"""
     peak = checked_peak(session, peak_id=peak_id)
 
-    can_edit(current_user)
+    can_edit(current_user, peak)
 
     image_dir = Peak.path_to_images()
     try:
@@ -430,11 +828,7 @@ async def update_peak_photo(
         photo_path = f"{_path}/{file.filename}"
         peak.photo = photo_path
 
-        session.add(peak)
-        session.commit()
-        session.refresh(peak)
-
-        return peak
+        return saved(session, PeakOut, peak)
 
     except Exception as error:
         return {"message": error.args, "success": False}
@@ -483,21 +877,55 @@ async def delete_peak_photo(
 
 @router.get("/peak/routes/{slug}", response_model=List[RouteListItem])
 async def get_peak_routes(
-    slug: str, session: Session = Depends(get_session)
+    slug: str,
+    request: Request,
+    fields: FieldSet = Depends(fieldset(RouteOut, RouteListItem)),
+    session: Session = Depends(get_session),
 ) -> List[RouteListItem]:
     """get list of peak routes"""
-    peak = checked_peak(session, slug=slug)
 
-    statement = select(Route).where(Route.peak == peak)
-    routers = session.exec(statement).all()
-    return routers
+    def build():
+        peak = checked_peak(session, slug=slug)
+
+        statement = select(Route).where(Route.peak == peak)
+        routes = session.exec(shaped(statement, fields, Route, _ROUTE_LISTS)).all()
+        return CacheEntry(fields.dump(routes, many=True), tags=[f"peak:{peak.id}"])
+
+    return await response_cache.respond(request, build)
 
 
 @router.get("/routes", response_model=List[RouteListItem])
-async def get_routes(session: Session = Depends(get_session)) -> List[RouteListItem]:
+async def get_routes(
+    fields: FieldSet = Depends(fieldset(RouteOut, RouteListItem)),
+    session: Session = Depends(get_session),
+) -> List[RouteListItem]:
     """get list of all routes"""
-    routes = session.exec(select(Route)).all()
-    return routes
+    routes = session.exec(shaped(select(Route), fields, Route, _ROUTE_LISTS)).all()
+    return SchemaJSONResponse(List[fields.output], routes)
+
+
+@router.get("/routes/batch", response_model=List[RouteBatchItem])
+async def get_routes_batch(
+    slugs: Annotated[str, Query(max_length=8192)],
+    session: Session = Depends(get_session),
+) -> List[RouteBatchItem]:
+    """get routes by comma separated slugs"""
+    items = batch_slugs(slugs)
+    statement = select(Route).where(Route.slug.in_(items)).options(*_ROUTE_DETAIL)
+    # the collation of slugs is case insensitive
+    routes = (
+        {route.slug.lower(): route for route in session.exec(statement).all()} if items else {}
+    )
+
+    return SchemaJSONResponse(
+        List[RouteBatchItem],
+        [
+            {"slug": slug, "status": 200, "route": routes[slug.lower()]}
+            if slug.lower() in routes
+            else {"slug": slug, "status": 404, "detail": _("Route not found")}
+            for slug in items
+        ],
+    )
 
 
 @router.get("/routes/search", response_model=List[RouteListItem])
@@ -505,6 +933,7 @@ async def search_route(
     query: Annotated[str | None, Query(max_length=50)] = None,
     author: Annotated[str | None, Query(max_length=50)] = None,
     category: Annotated[str | None, Query(max_length=50)] = None,
+    fields: FieldSet = Depends(fieldset(RouteOut, RouteListItem)),
     session: Session = Depends(get_session),
 ) -> List[RouteListItem]:
     """search routes by slug or name"""
@@ -517,19 +946,201 @@ async def search_route(
         statement = statement.where(Route.author.contains(author))
     if category:
         statement = statement.where(Route.difficulty.startswith(category))
-    routes = session.exec(statement).all()
+    routes = session.exec(shaped(statement, fields, Route, _ROUTE_LISTS)).all()
 
-    return routes
+    return SchemaJSONResponse(List[fields.output], routes)
+
+
+@router.get("/route/{slug}.{format}")
+async def export_route_track(
+    slug: str,
+    format: Literal["gpx", "kml", "geojson"],
+    request: Request,
+    session: Session = Depends(get_session),
+) -> StreamingResponse:
+    """get the route with its peak as GPX, KML or GeoJSON"""
+    statement = (
+        select(Route.id, Route.changed, Peak.changed, Route.name, Route.peak_id)
+        .outerjoin(Peak, Route.peak_id == Peak.id)
+        .where(Route.slug == slug)
+    )
+    route = session.exec(statement).first()
+    if route is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=_("Route not found"))
+    export = export_tracks(db, format, route.name, Route.id == route.id, Peak.id == route.peak_id)
+    return track_response(request, "route", tuple(route[:3]), slug, export)
 
 
 @router.get("/route/{slug}", response_model=RouteOut)
-async def get_route(slug: str, session: Session = Depends(get_session)) -> RouteOut:
+async def get_route(
+    slug: str,
+    request: Request,
+    fields: FieldSet = Depends(fieldset(RouteOut)),
+    session: Session = Depends(get_session),
+) -> RouteOut:
     """get the route by slug"""
-    route = checked_route(session, slug=slug)
 
-    route_out = RouteOut.model_validate(route)
+    def version():
+        _version = route_version(session, slug)
+        if _version is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail=_("Route not found")
+            )
+        return version_validators(fields.kind("route"), (*_version, cities_generation()))
+
+    def build():
+        generation = cities_generation()
+        statement = shaped(select(Route).where(Route.slug == slug), fields, Route)
+        route = session.exec(statement).first()
+        if route is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail=_("Route not found")
+            )
+        peak_changed = route.peak.changed if route.peak else None
+        etag, modified = version_validators(
+            fields.kind("route"), (route.id, route.changed, peak_changed, generation)
+        )
+        return CacheEntry(
+            fields.dump(route),
+            tags=[f"route:{route.id}", f"peak:{route.peak_id}", CITIES_TAG],
+            etag=etag,
+            modified=modified,
+        )
+
+    return await response_cache.respond(request, build, version)
+
+
+@router.get("/route/{slug}/page", response_model=RoutePageOut)
+async def get_route_page(
+    slug: str, request: Request, session: Session = Depends(get_session)
+) -> RoutePageOut:
+    """get the route with its peak and ridge"""
+
+    def version():
+        _version = route_page_version(session, slug)
+        if _version is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail=_("Route not found")
+            )
+        return version_validators("route-page", (*_version, cities_generation()))
+
+    def build():
+        generation = cities_generation()
+        statement = (
+            select(Route)
+            .where(Route.slug == slug)
+            .options(
+                *_ROUTE_LISTS,
+                undefer_group("start"),
+                selectinload(Route.peak).options(*_PEAK_DETAIL),
+            )
+        )
+        route = session.exec(statement).first()
+        if route is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail=_("Route not found")
+            )
+        peak = route.peak
+        ridge = peak.ridge if peak else None
+        etag, modified = version_validators(
+            "route-page",
+            (
+                route.id,
+                route.changed,
+                peak.changed if peak else None,
+                ridge.changed if ridge else None,
+                generation,
+            ),
+        )
+        tags = [f"route:{route.id}", CITIES_TAG]
+        tags += [f"peak:{peak.id}"] if peak else []
+        tags += [f"ridge:{ridge.id}"] if ridge else []
+        page = {"route": route, "peak": peak, "ridge": ridge}
+        return CacheEntry(
+            dump_json(RoutePageOut, page),
+            tags=tags,
+            etag=etag,
+            modified=modified,
+        )
+
+    return await response_cache.respond(request, build, version)
 
-    return route_out
+
+@router.get("/route/{slug}/geometry", response_model=RouteGeometryOut)
+async def get_route_geometry(
+    slug: str,
+    request: Request,
+    precision: Annotated[int, Query(ge=1, le=7)] = POLYLINE_PRECISION,
+    zoom: Annotated[int | None, Query(ge=0, le=22)] = None,
+    tolerance: Annotated[float | None, Query(ge=0, le=100000)] = None,
+    session: Session = Depends(get_session),
+) -> RouteGeometryOut:
+    """
+    get the track of the route as encoded polyline
+
+    The track is the packed geometry of the route, or its points
+    for the route without geometry. It is simplified by Douglas-Peucker
+    with tolerance in meters, or with tolerance of the map pixel at
+    zoom level; the levels of vertices are precomputed with geometry.
+    """
+    kind = f"route-geometry?precision={precision}&zoom={zoom}&tolerance={tolerance}"
+
+    def version():
+        _version = route_version(session, slug)
+        if _version is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail=_("Route not found")
+            )
+        return version_validators(kind, _version)
+
+    def build():
+        statement = (
+            select(Route.id, Route.changed, Peak.changed, Route.geometry, Route.geometry_levels)
+            .outerjoin(Peak, Route.peak_id == Peak.id)
+            .where(Route.slug == slug)
+        )
+        route = session.exec(statement).first()
+        if route is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail=_("Route not found")
+            )
+        coordinates = unpack_geometry(route.geometry)
+        levels = unpack_levels(route.geometry_levels)
+        if route.geometry is None:
+            statement = (
+                select(GeoPoint.latitude, GeoPoint.longitude)
+                .join(RoutePoint, RoutePoint.point_id == GeoPoint.id)
+                .where(RoutePoint.route_id == route.id)
+                .order_by(RoutePoint.id)
+            )
+            coordinates = np.asarray(session.exec(statement).all()).reshape(-1, 2)
+
+        _tolerance = tolerance
+        if _tolerance is None and zoom is not None and len(coordinates):
+            _tolerance = zoom_tolerance(
+                zoom, float(coordinates[0, 0]), app_settings.GEOMETRY_TOLERANCE_PIXELS
+            )
+        if _tolerance:
+            if levels is None or len(levels) != len(coordinates):
+                levels = simplification_levels(coordinates)
+            coordinates = coordinates[levels > _tolerance]
+
+        content = RouteGeometryOut(
+            route_id=route.id,
+            points=len(coordinates),
+            precision=precision,
+            tolerance=_tolerance or 0,
+            polyline=encode_polyline(coordinates, precision),
+        )
+        etag, modified = version_validators(kind, tuple(route[:3]))
+        return CacheEntry(
+            dump_json(RouteGeometryOut, content),
+            tags=[f"route:{route.id}"],
+            etag=etag,
+            modified=modified,
+        )
+
+    return await response_cache.respond(request, build, version)
 
 
 @router.post("/routes/add", response_model=RouteOut)
@@ -546,7 +1157,7 @@ async def add_route(
         description=route.description,
         short_description=route.short_description,
         recommended_equipment=route.recommended_equipment,
-        slug=unique_slugify(Route, route.name),
+        slug=unique_slugify(session, Route, route.name),
         peak_id=route.peak_id,
         difficulty=route.difficulty,
         max_difficulty=route.max_difficulty,
@@ -559,10 +1170,7 @@ async def add_route(
         editor_id=current_user.id,
     )
 
-    session.add(db_route)
-    session.commit()
-    session.refresh(db_route)
-    return db_route
+    return saved(session, RouteOut, db_route)
 
 
 @router.post("/route/{route_id}/add/section", response_model=RouteSectionOut)
@@ -586,10 +1194,7 @@ async def add_route_section(
         length=section.length,
     )
 
-    session.add(db_section)
-    session.commit()
-    session.refresh(db_section)
-    return db_section
+    return saved(session, RouteSectionOut, db_section)
 
 
 @router.post("/route/{route_id}/add/point", response_model=RoutePoint)
@@ -604,27 +1209,131 @@ async def add_route_point(
 
     can_edit(current_user, route)
 
-    point_id = None
+    db_point = RoutePoint(
+        description=point.description,
+        route_id=point.route_id,
+    )
     if point.point:
-        _db_point = GeoPoint(
+        db_point.point = GeoPoint(
             latitude=point.point.latitude,
             longitude=point.point.longitude,
         )
-        session.add(_db_point)
-        session.commit()
-        session.refresh(_db_point)
-        point_id = _db_point.id
 
-    db_point = RoutePoint(
-        description=point.description,
-        route_id=point.route_id,
-        point_id=point_id,
+    return saved(session, RoutePoint, db_point)
+
+
+@router.post("/route/{route_id}/points/batch", response_model=RouteBatchResult)
+async def add_route_points_batch(
+    route_id: int,
+    points: List[PointImport],
+    current_user: Annotated[APIUser, Depends(get_current_active_user)],
+    replace: bool = False,
+    ids: bool = False,
+    session: Session = Depends(get_session),
+) -> RouteBatchResult:
+    """
+    add route points in the order of the track
+
+    With replace=true existing points of the route are deleted,
+    so the track can be uploaded again. With ids=true the ids of
+    added points are returned.
+    """
+    route = checked_route(session, route_id=route_id)
+
+    can_edit(current_user, route)
+    batch_items(points)
+
+    return await anyio.to_thread.run_sync(
+        add_route_points, session, route_id, points, replace, ids
     )
 
-    session.add(db_point)
-    session.commit()
-    session.refresh(db_point)
-    return db_point
+
+@router.post("/route/{route_id}/sections/batch", response_model=RouteBatchResult)
+async def add_route_sections_batch(
+    route_id: int,
+    sections: List[SectionImport],
+    current_user: Annotated[APIUser, Depends(get_current_active_user)],
+    replace: bool = False,
+    session: Session = Depends(get_session),
+) -> RouteBatchResult:
+    """
+    add route sections
+
+    With replace=true existing sections of the route are deleted.
+    """
+    route = checked_route(session, route_id=route_id)
+
+    can_edit(current_user, route)
+    batch_items(sections)
+
+    return await anyio.to_thread.run_sync(
+        add_route_sections, session, route_id, sections, replace
+    )
+
+
+def import_track(
+    session: Session,
+    route_id: int,
+    file,
+    format: str,
+    tolerance: float,
+    target: str,
+    replace: bool,
+) -> RouteBatchResult:
+    """read, simplify and save the track as geometry or route points. Raise 400 for invalid track"""
+    track = simplify(read_track(file, format), tolerance)
+    try:
+        if target == "geometry":
+            return set_route_geometry(session, route_id, track)
+        points = (
+            PointImport.model_construct(latitude=latitude, longitude=longitude, description=None)
+            for latitude, longitude in track
+        )
+        return add_route_points(session, route_id, points, replace, track=True)
+    except (ET.ParseError, ValueError) as error:
+        session.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=_("Invalid track: {}").format(error),
+        ) from error
+
+
+@router.post("/route/{route_id}/track", response_model=RouteBatchResult)
+async def add_route_track(
+    route_id: int,
+    file: UploadFile,
+    current_user: Annotated[APIUser, Depends(get_current_active_user)],
+    format: Annotated[str | None, Query(pattern="^(gpx|kml|geojson)$")] = None,
+    tolerance: Annotated[float, Query(ge=0, le=1000)] = app_settings.TRACK_TOLERANCE,
+    target: Literal["geometry", "points"] = "geometry",
+    replace: bool = True,
+    session: Session = Depends(get_session),
+) -> RouteBatchResult:
+    """
+    import GPX, KML or GeoJSON track as geometry or points of the route
+
+    The file is parsed incrementally and simplified on the fly
+    (tolerance in meters, 0 keeps all points), so long tracks are
+    imported in constant memory. The format is taken from the
+    extension of the file if it is not given. By default the track
+    replaces the packed geometry of the route and the route points
+    are kept as waypoints; with target=points the track is saved as
+    route points (replacing them unless replace=false) and the packed
+    geometry is dropped.
+    """
+    route = checked_route(session, route_id=route_id)
+
+    can_edit(current_user, route)
+    _format = track_format(file.filename, format)
+    if _format is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=_("Unknown track format, expected gpx, kml or geojson"),
+        )
+
+    return await anyio.to_thread.run_sync(
+        import_track, session, route_id, file.file, _format, tolerance, target, replace
+    )
 
 
 @router.post("/route/{route_id}/add/photo", response_model=RoutePhoto)
@@ -650,11 +1359,7 @@ async def add_route_photo(
         photo_path = f"{_path}/{file.filename}"
         image = RoutePhoto(route_id=route_id, photo=photo_path, description=description)
 
-        session.add(image)
-        session.commit()
-        session.refresh(image)
-
-        return image
+        return saved(session, RoutePhoto, image)
 
     except Exception as error:
         return {"message": error.args, "success": False}
@@ -682,11 +1387,7 @@ async def update_route_map(
         photo_path = f"{_path}/{file.filename}"
         route.map_image = photo_path
 
-        session.add(route)
-        session.commit()
-        session.refresh(route)
-
-        return route
+        return saved(session, RouteOut, route)
 
     except Exception as error:
         return {"message": error.args, "success": False}
@@ -714,11 +1415,7 @@ async def update_route_photo(
         photo_path = f"{_path}/{file.filename}"
         route.photo = photo_path
 
-        session.add(route)
-        session.commit()
-        session.refresh(route)
-
-        return route
+        return saved(session, RouteOut, route)
 
     except Exception as error:
         return {"message": error.args, "success": False}
@@ -734,17 +1431,13 @@ async def update_route(
     """update route fields"""
     db_route = checked_route(session, route_id=route_id)
 
-    can_edit(current_user, route)
+    can_edit(current_user, db_route)
 
     route_dict = route.model_dump(exclude_unset=True)
     for key, value in route_dict.items():
         setattr(db_route, key, value)
 
-    session.add(db_route)
-    session.commit()
-    session.refresh(db_route)
-
-    return db_route
+    return saved(session, RouteOut, db_route)
 
 
 @router.put("/route/section/{section_id}", response_model=RouteSectionOut)
@@ -767,11 +1460,7 @@ async def update_route_section(
     for key, value in section_dict.items():
         setattr(db_section, key, value)
 
-    session.add(db_section)
-    session.commit()
-    session.refresh(db_section)
-
-    return db_section
+    return saved(session, RouteSectionOut, db_section)
 
 
 @router.delete("/route/{slug}", response_model=ResponseStatus)
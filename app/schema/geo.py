@@ -0,0 +1,23 @@
+"""
+Geo Models
+"""
+
+from typing import Optional
+
+from pydantic import BaseModel
+
+
+class GeoCityOut(BaseModel):
+    """
+    City found by name, with the name matching the search
+    """
+
+    id: int
+    geonameid: int
+    name: Optional[str]
+    matched_name: str
+    country: Optional[str]
+    admin1: Optional[str]
+    latitude: Optional[float]
+    longitude: Optional[float]
+    population: Optional[int]
@@ -4,7 +4,7 @@ Mountain Models
 
 import os
 from datetime import datetime
-from typing import Optional
+from typing import Literal, Optional
 
 from pydantic import BaseModel, ConfigDict, HttpUrl
 from sqlmodel import Field
@@ -35,6 +35,7 @@ class GeoPoint(BaseModel):
     Data Model for GeoPoint
     """
 
+    model_config = ConfigDict(from_attributes=True)
     latitude: float = 0
     longitude: float = 0
 
@@ -100,6 +101,17 @@ class RidgeInfoLinkCreate(BaseModel):
     description: Optional[str] = None
 
 
+class NearestCityOut(BaseModel):
+    """
+    The nearest city of GeoNames to the peak or the route start
+    """
+
+    id: int
+    name: str
+    country: str | None
+    distance: int
+
+
 class PeakOut(BaseModel):
     """
     Peak model for single Peak
@@ -120,6 +132,7 @@ class PeakOut(BaseModel):
     active: bool
     changed: datetime
     can_be_deleted: bool
+    nearest_city: Optional[NearestCityOut] = None
 
     photos_list: list | None = []
     routes_list: list | None = []
@@ -191,12 +204,79 @@ class RouteOut(BaseModel):
     changed: datetime
     ready: bool
     can_be_deleted: bool
+    nearest_city: Optional[NearestCityOut] = None
 
     photos_list: list
     routepoints_list: list
     sections_list: list
 
 
+class RouteGeometryOut(BaseModel):
+    """
+    Track of the route as encoded polyline
+    """
+
+    route_id: int
+    points: int
+    precision: int
+    tolerance: float = 0
+    polyline: str
+
+
+class PeakClusterTop(BaseModel):
+    """
+    The highest peak of the cluster
+    """
+
+    id: int
+    slug: str | None
+    name: str
+    height: int | None
+
+
+class PeakClusterOut(BaseModel):
+    """
+    Cluster of peaks at zoom level, single peak has count 1
+    """
+
+    latitude: float
+    longitude: float
+    count: int
+    peak: PeakClusterTop
+
+
+class PeakBatchItem(BaseModel):
+    """
+    Peak of batch lookup, or status of its absence
+    """
+
+    slug: str
+    status: int
+    detail: Optional[str] = None
+    peak: Optional[PeakOut] = None
+
+
+class RouteBatchItem(BaseModel):
+    """
+    Route of batch lookup, or status of its absence
+    """
+
+    slug: str
+    status: int
+    detail: Optional[str] = None
+    route: Optional[RouteOut] = None
+
+
+class RoutePageOut(BaseModel):
+    """
+    Route with its peak and ridge for the route page
+    """
+
+    route: RouteOut
+    peak: Optional[PeakOut]
+    ridge: Optional[RidgeOut]
+
+
 class RouteCreate(BaseModel):
     """
     Data Model for new Route
@@ -264,3 +344,117 @@ class RoutePointCreate(BaseModel):
     route_id: int
     description: Optional[str] = None
     point: GeoPointCreate
+
+
+class SectionImport(BaseModel):
+    """
+    Data Model for Route Section in bulk import
+    """
+
+    num: Optional[int] = None
+    description: Optional[str] = None
+    length: Optional[int] = None
+    difficulty: Optional[str] = Field(default=None, max_length=32)
+    angle: Optional[str] = Field(default=None, max_length=32)
+
+
+class PointImport(BaseModel):
+    """
+    Data Model for Route Point in bulk import
+    """
+
+    latitude: float
+    longitude: float
+    description: Optional[str] = Field(default=None, max_length=128)
+
+
+class RouteImport(BaseModel):
+    """
+    Data Model for Route in bulk import
+
+    peak is slug of existing peak, it is required
+    for the route outside of peak document
+    """
+
+    type: Literal["route"] = "route"
+    peak: Optional[str] = None
+    slug: Optional[str] = Field(default=None, max_length=64)
+    name: str = Field(max_length=64)
+    description: Optional[str] = None
+    short_description: Optional[str] = None
+    recommended_equipment: Optional[str] = None
+    difficulty: Optional[str] = Field(default=None, max_length=3)
+    max_difficulty: Optional[str] = Field(default=None, max_length=16)
+    author: Optional[str] = Field(default=None, max_length=64)
+    length: Optional[int] = None
+    year: Optional[int] = None
+    height_difference: Optional[int] = None
+    start_height: Optional[int] = None
+    descent: Optional[str] = None
+    ready: bool = False
+    sections: list[SectionImport] = []
+    points: list[PointImport] = []
+
+
+class PeakImport(BaseModel):
+    """
+    Data Model for Peak in bulk import
+
+    ridge is slug of existing ridge, it is required
+    for the peak outside of ridge document
+    """
+
+    type: Literal["peak"] = "peak"
+    ridge: Optional[str] = None
+    slug: Optional[str] = Field(default=None, max_length=64)
+    name: str = Field(max_length=64)
+    description: Optional[str] = None
+    height: Optional[int] = None
+    point: Optional[GeoPointCreate] = None
+    routes: list[RouteImport] = []
+
+
+class RidgeImport(BaseModel):
+    """
+    Data Model for Ridge in bulk import
+    """
+
+    type: Literal["ridge"] = "ridge"
+    slug: Optional[str] = Field(default=None, max_length=128)
+    name: str = Field(max_length=128)
+    description: Optional[str] = None
+    peaks: list[PeakImport] = []
+
+
+class RouteBatchResult(BaseModel):
+    """
+    Result of batch adding of route points or sections
+    """
+
+    route_id: int
+    deleted: int = 0
+    added: int = 0
+    ids: list[int] = []
+
+
+class ImportLineError(BaseModel):
+    """
+    Error of bulk import for the document
+    """
+
+    line: int
+    detail: str
+
+
+class ImportResult(BaseModel):
+    """
+    Result of bulk import
+    """
+
+    dry_run: bool = False
+    ridges: int = 0
+    peaks: int = 0
+    routes: int = 0
+    sections: int = 0
+    points: int = 0
+    errors: list[ImportLineError] = []
@@ -1,2 +1,14 @@
 MEDIA_ROOT = "/data"
 PHOTOS_ROOT = "/photos"
+MEDIA_MAX_AGE = 3600
+MEDIA_IMMUTABLE_MAX_AGE = 31536000
+BATCH_MAX_SLUGS = 100
+BATCH_MAX_ITEMS = 10000
+TRACK_TOLERANCE = 5.0
+GEOMETRY_TOLERANCE_PIXELS = 1.0
+TILE_MAX_ZOOM = 18
+TILE_CHECK_INTERVAL = 1
+CLUSTER_MAX_ZOOM = 16
+CLUSTER_RADIUS = 40.0
+GEOCODING_CHECK_INTERVAL = 60
+CITY_SEARCH_MIN_LENGTH = 3
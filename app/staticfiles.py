@@ -0,0 +1,196 @@
+"""
+Static and media files
+"""
+
+import gzip
+import mimetypes
+import os
+import stat
+
+import anyio
+import brotli
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, PathLike, StaticFiles
+from starlette.types import Scope
+
+import app.settings as app_settings
+from app.media import file_digest, split_fingerprint
+
+
+class MediaFiles(StaticFiles):
+    """
+    Static files application for photos and maps.
+
+    The file is served with strong ETag made from the digest of
+    its content. Fingerprinted urls (see app.media) are resolved to
+    the stored file and, while the fingerprint matches the content,
+    are served as immutable. Conditional requests are answered with
+    304, byte ranges and zero-copy sending (http.response.pathsend,
+    if the server supports it) are provided by FileResponse.
+    """
+
+    def lookup_path(self, path: str) -> tuple[str, os.stat_result | None]:
+        """
+        Find the file by path or by fingerprinted path.
+
+        Runs in a worker thread, so the digest of new or changed
+        file is calculated here and not in the event loop.
+        """
+        full_path, stat_result = super().lookup_path(path)
+        if stat_result is None:
+            original, fingerprint = split_fingerprint(path)
+            if fingerprint:
+                full_path, stat_result = super().lookup_path(original)
+        if stat_result and stat.S_ISREG(stat_result.st_mode):
+            file_digest(full_path, stat_result)
+        return full_path, stat_result
+
+    def file_response(
+        self,
+        full_path: PathLike,
+        stat_result: os.stat_result,
+        scope: Scope,
+        status_code: int = 200,
+    ) -> Response:
+        """Response with strong ETag and cache headers"""
+        request_headers = Headers(scope=scope)
+        digest = file_digest(full_path, stat_result)
+        _, fingerprint = split_fingerprint(self.get_path(scope))
+
+        if fingerprint and digest.startswith(fingerprint):
+            cache_control = f"public, max-age={app_settings.MEDIA_IMMUTABLE_MAX_AGE}, immutable"
+        else:
+            cache_control = f"public, max-age={app_settings.MEDIA_MAX_AGE}"
+        headers = {"etag": f'"{digest}"', "cache-control": cache_control}
+
+        response = FileResponse(
+            full_path, status_code=status_code, headers=headers, stat_result=stat_result
+        )
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+COMPRESSIBLE_EXTENSIONS = (
+    ".css", ".js", ".mjs", ".json", ".map", ".svg", ".html", ".txt", ".xml", ".ico",
+)
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+MIN_COMPRESS_SIZE = 256
+
+
+def is_compressible(path: str) -> bool:
+    """is the file worth compression"""
+    return path.lower().endswith(COMPRESSIBLE_EXTENSIONS)
+
+
+def accepted_encodings(accept_encoding: str) -> set:
+    """get encodings accepted by client from Accept-Encoding header"""
+    encodings = set()
+    for item in accept_encoding.split(","):
+        encoding, _, params = item.partition(";")
+        params = params.replace(" ", "")
+        if params.startswith("q="):
+            try:
+                if float(params[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        encodings.add(encoding.strip().lower())
+    return encodings
+
+
+def compress_static(directory: PathLike, force: bool = False) -> list:
+    """
+    Write .br and .gz siblings for compressible files in directory.
+
+    The compressed file is written only if it is smaller than
+    original one, up to date files are skipped unless force is set.
+
+    Returns:
+        list: Paths of written files.
+    """
+    written = []
+    for root, _, files in os.walk(directory):
+        for name in files:
+            path = os.path.join(root, name)
+            if not is_compressible(path):
+                continue
+            source_stat = os.stat(path)
+            if source_stat.st_size < MIN_COMPRESS_SIZE:
+                continue
+            with open(path, "rb") as _file:
+                data = None
+                for encoding, suffix in ENCODINGS:
+                    target = f"{path}{suffix}"
+                    if (
+                        not force
+                        and os.path.exists(target)
+                        and os.stat(target).st_mtime >= source_stat.st_mtime
+                    ):
+                        continue
+                    if data is None:
+                        data = _file.read()
+                    if encoding == "br":
+                        compressed = brotli.compress(data, quality=11)
+                    else:
+                        compressed = gzip.compress(data, compresslevel=9, mtime=0)
+                    if len(compressed) >= len(data):
+                        if os.path.exists(target):
+                            os.remove(target)
+                        continue
+                    with open(target, "wb") as _target:
+                        _target.write(compressed)
+                    written.append(target)
+    return written
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """
+    Static files application serving precompressed variants.
+
+    For compressible files the .br or .gz sibling written by
+    compress_static() is sent if the client accepts the encoding,
+    so nothing is compressed per request. Responses for
+    compressible files always have 'Vary: Accept-Encoding'.
+    """
+
+    def lookup_variant(self, path: str, suffix: str) -> tuple[str, os.stat_result | None]:
+        """find compressed variant that is not older than original file"""
+        full_path, stat_result = self.lookup_path(f"{path}{suffix}")
+        if not (stat_result and stat.S_ISREG(stat_result.st_mode)):
+            return "", None
+        _, source_stat = self.lookup_path(path)
+        if source_stat is None or source_stat.st_mtime > stat_result.st_mtime:
+            return "", None
+        return full_path, stat_result
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        """Response with precompressed variant if it is possible"""
+        if not is_compressible(path):
+            return await super().get_response(path, scope)
+
+        request_headers = Headers(scope=scope)
+        if scope["method"] in ("GET", "HEAD"):
+            accepted = accepted_encodings(request_headers.get("accept-encoding", ""))
+            for encoding, suffix in ENCODINGS:
+                if encoding not in accepted and "*" not in accepted:
+                    continue
+                full_path, stat_result = await anyio.to_thread.run_sync(
+                    self.lookup_variant, path, suffix
+                )
+                if stat_result is None:
+                    continue
+                response = FileResponse(
+                    full_path,
+                    stat_result=stat_result,
+                    headers={"content-encoding": encoding, "vary": "Accept-Encoding"},
+                    media_type=mimetypes.guess_type(path)[0] or "text/plain",
+                )
+                if self.is_not_modified(response.headers, request_headers):
+                    return NotModifiedResponse(response.headers)
+                return response
+
+        response = await super().get_response(path, scope)
+        response.headers["vary"] = "Accept-Encoding"
+        return response
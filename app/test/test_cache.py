@@ -0,0 +1,103 @@
+"""
+tests for response cache
+"""
+
+import asyncio
+import threading
+
+import pytest
+from fastapi import Request
+
+from app.cache.backends import CacheEntry, MemoryBackend
+from app.cache.response import ResponseCache
+from app.cache.singleflight import SingleFlight
+
+REQUESTS = 5
+
+
+def make_request(path: str = "/mountains/peaks") -> Request:
+    """GET request of the path"""
+    return Request(
+        {"type": "http", "method": "GET", "path": path, "query_string": b"", "headers": []}
+    )
+
+
+async def wait_coalesced(flight: SingleFlight, count: int):
+    """wait until count calls wait for the call in flight"""
+    for _ in range(1000):
+        if flight.stats()["coalesced"] >= count:
+            return
+        await asyncio.sleep(0.001)
+    raise AssertionError("calls are not coalesced")
+
+
+def test_concurrent_requests_build_once():
+    """test concurrent identical requests missing the cache share one build"""
+    cache = ResponseCache(MemoryBackend(100, 1024 * 1024))
+    release = threading.Event()
+    builds = []
+
+    def build():
+        builds.append(threading.get_ident())
+        assert release.wait(5)
+        return CacheEntry(b'{"peaks": []}', tags=["peak"])
+
+    async def main():
+        responses = asyncio.gather(
+            *(cache.respond(make_request(), build) for _ in range(REQUESTS))
+        )
+        await wait_coalesced(cache.flight, REQUESTS - 1)
+        release.set()
+        return await responses
+
+    responses = asyncio.run(main())
+
+    assert len(builds) == 1
+    assert [response.body for response in responses] == [b'{"peaks": []}'] * REQUESTS
+    stats = cache.stats()
+    assert (stats["leaders"], stats["coalesced"], stats["in_flight"]) == (1, REQUESTS - 1, 0)
+    assert stats["stores"] == 1
+
+    asyncio.run(cache.respond(make_request(), build))
+    assert len(builds) == 1
+    assert cache.stats()["hits"] == 1
+
+
+def test_concurrent_calls_share_exception():
+    """test waiters of the failed call get its exception, the next call runs again"""
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def fail():
+        calls.append(1)
+        assert release.wait(5)
+        raise ValueError("build failed")
+
+    async def main():
+        results = asyncio.gather(
+            *(flight.do("key", fail) for _ in range(REQUESTS)), return_exceptions=True
+        )
+        await wait_coalesced(flight, REQUESTS - 1)
+        release.set()
+        return await results
+
+    results = asyncio.run(main())
+
+    assert len(calls) == 1
+    assert all(isinstance(result, ValueError) for result in results)
+    assert flight.stats() == {"leaders": 1, "coalesced": REQUESTS - 1, "in_flight": 0}
+    with pytest.raises(ValueError):
+        asyncio.run(flight.do("key", fail))
+    assert len(calls) == 2
+
+
+def test_different_keys_are_not_coalesced():
+    """test calls with different keys run each"""
+    flight = SingleFlight()
+
+    async def main():
+        return await asyncio.gather(*(flight.do(str(n), lambda n=n: n) for n in range(3)))
+
+    assert asyncio.run(main()) == [0, 1, 2]
+    assert flight.stats() == {"leaders": 3, "coalesced": 0, "in_flight": 0}
@@ -0,0 +1,50 @@
+"""
+tests for peak clusters
+"""
+
+from sqlalchemy import create_engine
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, SQLModel
+
+from app.clusters import ClusterIndex
+from app.models.mountains import GeoPoint, Peak
+
+BOUNDS = (-180, -85, 180, 85)
+
+
+def test_changed_peaks_are_clustered_in_background():
+    """test levels are rebuilt after changes, the previous ones are served meanwhile"""
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        for k in range(3):
+            point = GeoPoint(latitude=48.0 + k * 0.001, longitude=24.0)
+            session.add(Peak(slug=f"peak-{k}", name=f"Peak {k}", height=2000 + k, point=point))
+        session.commit()
+    index = ClusterIndex(engine, 16)
+
+    clusters = index.clusters(BOUNDS, 0)
+    assert [(cluster["count"], cluster["peak"]["slug"]) for cluster in clusters] == [
+        (3, "peak-2")
+    ]
+    assert len(index.clusters(BOUNDS, 17)) == 3
+
+    with Session(engine) as session:
+        session.add(Peak(slug="far", name="Far", height=100, point=GeoPoint(latitude=10.0)))
+        peak = session.get(Peak, 3)
+        peak.height = 1000
+        session.flush()
+        rows = set(session.info["changed_rows"])
+        session.commit()
+    levels, _info = index.levels()
+    index.changed(rows)
+    index.join()
+
+    assert index.levels()[0] is not levels
+    clusters = sorted(index.clusters(BOUNDS, 0), key=lambda cluster: cluster["count"])
+    assert [(cluster["count"], cluster["peak"]["slug"]) for cluster in clusters] == [
+        (1, "far"),
+        (3, "peak-1"),
+    ]
@@ -0,0 +1,98 @@
+"""
+tests for router Geo
+"""
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import delete
+from sqlmodel import Session
+
+from app.dependencies import db
+from app.geonames import city_names
+from app.main import app
+from app.models.geoname import GeoCity, GeoCityName
+
+client = TestClient(app)
+
+# made up cities, geonameids are out of the range of GeoNames
+CITIES = [
+    (990000001, "Ґорґанці", "Gorgantsi", "Gorgantsi-Zakhid,Horhantsi,Горганцы", "UA", 900),
+    (990000002, "Gorgantsivka", "Gorgantsivka", "Ґорґанцівка", "UA", 5000),
+    (990000003, "Gorgantsin", "Gorgantsin", "", "PL", 100),
+]
+
+
+@pytest.fixture
+def cities():
+    """fixture made up cities with their names, deleted after the test"""
+    geonameids = [geonameid for geonameid, *_values in CITIES]
+    with Session(db) as session:
+        for geonameid, name, asciiname, alternatenames, country, population in CITIES:
+            session.add(
+                GeoCity(
+                    geonameid=geonameid,
+                    name=name,
+                    asciiname=asciiname,
+                    alternatenames=alternatenames,
+                    fclass="P",
+                    fcode="PPL",
+                    country=country,
+                    population=population,
+                )
+            )
+            for value, key in city_names(name, asciiname, alternatenames):
+                session.add(GeoCityName(geonameid=geonameid, name=value, search_name=key))
+        session.commit()
+    yield geonameids
+    with Session(db) as session:
+        session.exec(delete(GeoCityName).where(GeoCityName.geonameid.in_(geonameids)))
+        session.exec(delete(GeoCity).where(GeoCity.geonameid.in_(geonameids)))
+        session.commit()
+
+
+def search(params: dict, geonameids: list) -> list:
+    """geonameids and matched names of the found cities among the geonameids"""
+    response = client.get("/geo/cities/search", params={"limit": 50, **params})
+    assert response.status_code == 200
+    return [
+        (city["geonameid"], city["matched_name"])
+        for city in response.json()
+        if city["geonameid"] in geonameids
+    ]
+
+
+def test_search_cities(cities):
+    """test search of cities by names, exact match first, then more populated"""
+    response = client.get("/geo/cities/search", params={"q": "gorgan", "limit": 2})
+    assert response.status_code == 200
+    found = response.json()
+    assert len(found) == 2
+    for city in found:
+        assert {"id", "geonameid", "name", "matched_name", "country"} <= city.keys()
+
+    assert search({"q": "gorgantsi"}, cities) == [
+        (990000001, "Ґорґанці"),
+        (990000002, "Gorgantsivka"),
+        (990000003, "Gorgantsin"),
+    ]
+    assert search({"q": "Gorgantsiv"}, cities) == [(990000002, "Gorgantsivka")]
+    assert search({"q": "gorgantsi z"}, cities) == [(990000001, "Gorgantsi-Zakhid")]
+    assert search({"q": "gorgantsi", "country": "pl"}, cities) == [(990000003, "Gorgantsin")]
+    assert search({"q": "xyzgorgan"}, cities) == []
+
+
+def test_search_cities_cyrillic(cities):
+    """test search of cities by cyrillic names and their transliteration"""
+    assert search({"q": "Ґорґанці"}, cities)[0] == (990000001, "Ґорґанці")
+    assert search({"q": "Горганцы"}, cities) == [(990000001, "Горганцы")]
+    assert search({"q": "Horhan"}, cities) == [(990000001, "Horhantsi")]
+
+
+def test_search_cities_short():
+    """test too short queries are refused or find nothing"""
+    response = client.get("/geo/cities/search", params={"q": "go"})
+    assert response.status_code == 422
+
+    response = client.get("/geo/cities/search", params={"q": "- -"})
+    assert response.status_code == 200
+    assert response.json() == []
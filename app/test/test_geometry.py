@@ -0,0 +1,101 @@
+"""
+tests for route geometry
+"""
+
+import numpy as np
+import pytest
+
+from app.geometry import (
+    encode_polyline,
+    geometry_points,
+    pack_geometry,
+    pack_levels,
+    project,
+    simplification_levels,
+    unpack_geometry,
+    unpack_levels,
+)
+
+# example of the polyline algorithm documentation of Google Maps
+GOOGLE_POINTS = [(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)]
+GOOGLE_POLYLINE = "_p~iF~ps|U_ulLnnqC_mqNvxq`@"
+
+
+def test_encode_polyline():
+    """test encoded polyline of known points"""
+    assert encode_polyline(GOOGLE_POINTS) == GOOGLE_POLYLINE
+    assert encode_polyline([]) == ""
+    assert encode_polyline([(0.0, 0.0)]) == "??"
+
+
+def test_encode_polyline_precision():
+    """test polyline with 6 digits (OSRM) of known points"""
+    assert encode_polyline(GOOGLE_POINTS, 6) == "_izlhA~rlgdF_{geC~ywl@_kwzCn`{nI"
+
+
+def test_pack_geometry():
+    """test points are packed as float32 pairs and unpacked without copying"""
+    blob = pack_geometry(iter(GOOGLE_POINTS))
+    coordinates = unpack_geometry(blob)
+
+    assert len(blob) == 8 * len(GOOGLE_POINTS)
+    assert coordinates.shape == (3, 2)
+    assert not coordinates.flags.writeable
+    assert np.allclose(coordinates, GOOGLE_POINTS, atol=1e-5)
+    assert np.allclose(geometry_points(blob), GOOGLE_POINTS, atol=1e-5)
+    assert encode_polyline(coordinates) == GOOGLE_POLYLINE
+
+
+def test_pack_empty_geometry():
+    """test empty track has no blob"""
+    assert pack_geometry([]) is None
+    assert unpack_geometry(None).shape == (0, 2)
+    assert geometry_points(None) == []
+    assert pack_levels(np.empty(0)) is None
+    assert unpack_levels(None) is None
+
+
+def douglas_peucker(xy: np.ndarray, tolerance: float) -> list:
+    """indexes of vertices kept by recursive Douglas-Peucker"""
+    kept = {0, len(xy) - 1}
+
+    def split(start: int, end: int):
+        if end - start < 2:
+            return
+        a, b = xy[start], xy[end]
+        ab = b - a
+        length = float(ab @ ab)
+        distances = []
+        for index in range(start + 1, end):
+            ap = xy[index] - a
+            t = min(1.0, max(0.0, float(ap @ ab) / length)) if length > 0 else 0.0
+            distances.append(float(np.hypot(*(ap - t * ab))))
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            kept.add(start + 1 + farthest)
+            split(start, start + 1 + farthest)
+            split(start + 1 + farthest, end)
+
+    split(0, len(xy) - 1)
+    return sorted(kept)
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_simplification_levels(seed):
+    """test levels give the vertices of recursive Douglas-Peucker for any tolerance"""
+    rng = np.random.default_rng(seed)
+    coordinates = np.cumsum(rng.normal(0, 0.0005, (300, 2)), axis=0) + (48.0, 24.0)
+    levels = simplification_levels(coordinates)
+    xy = project(coordinates)
+
+    assert np.isinf(levels[[0, -1]]).all()
+    for tolerance in (0, 1, 5, 20, 100, 1000):
+        kept = np.flatnonzero(levels > tolerance).tolist()
+        assert kept == douglas_peucker(xy, tolerance)
+
+
+def test_simplification_levels_short():
+    """test levels of tracks without interior vertices"""
+    assert simplification_levels([]).size == 0
+    assert np.isinf(simplification_levels([(48.0, 24.0)])).all()
+    assert np.isinf(simplification_levels([(48.0, 24.0), (48.1, 24.1)])).all()
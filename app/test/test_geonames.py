@@ -0,0 +1,179 @@
+"""
+tests for GeoNames dumps
+"""
+
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.pool import StaticPool
+from sqlmodel import SQLModel
+
+from app.geonames import (
+    apply_deletes,
+    apply_modifications,
+    city_names,
+    load_cities,
+    parse_line,
+    parse_lines,
+    search_name,
+)
+from app.models.geoname import GeoCity, GeoCityName
+
+
+def dump_line(geonameid, name, asciiname, alternatenames="", fclass="P", moddate="2024-01-01"):
+    """tab separated line of the dump"""
+    values = [str(geonameid), name, asciiname, alternatenames, "48.45", "24.55", fclass, "PPL"]
+    values += ["UA", "", "13", "", "", "", "16000", "", "530", "Europe/Kyiv", moddate]
+    return "\t".join(values) + "\n"
+
+
+YAREMCHE = dump_line(690548, "Yaremche", "Yaremche", "Jaremcze,Яремче")
+HOVERLA = dump_line(703217, "Hoverla", "Hoverla", "Говерла", fclass="T")
+KOLOMYIA = dump_line(705392, "Kolomyia", "Kolomyia", "Коломия,Kolomyja")
+
+
+@pytest.fixture
+def engine():
+    """fixture engine of empty database in memory"""
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    SQLModel.metadata.create_all(engine)
+    return engine
+
+
+def cities(engine) -> dict:
+    """names of the cities by geonameids"""
+    with engine.connect() as connection:
+        return dict(connection.execute(select(GeoCity.geonameid, GeoCity.name)).all())
+
+
+def search_names(engine) -> set:
+    """geonameids and search names of the cities"""
+    with engine.connect() as connection:
+        rows = connection.execute(select(GeoCityName.geonameid, GeoCityName.search_name))
+        return set(rows.all())
+
+
+@pytest.mark.parametrize(
+    "name, key",
+    [
+        ("Yaremche", "yaremche"),
+        ("Яремче", "iaremche"),
+        ("Київ", "kiyiv"),
+        ("Киев", "kiev"),
+        ("Kyïv", "kyiv"),
+        ("Ґорґани", "gorgani"),
+        ("Ivano-Frankivs'k", "ivano frankivsk"),
+        ("Івано-Франківськ", "ivano frankivsk"),
+        ("  Mukachevo (Мукачево)  ", "mukachevo mukachevo"),
+        ("Zürich", "zurich"),
+        ("—", ""),
+    ],
+)
+def test_search_name(name, key):
+    """test names in latin and cyrillic are transliterated, words split by single spaces"""
+    assert search_name(name) == key
+
+
+def test_city_names():
+    """test names of the city are transliterated together, one per search name"""
+    names = city_names("Київ", "Kyiv", "Kiev,Киев,Kyïv,https://kyiv.example,Київ, ")
+
+    assert names == [("Київ", "kiyiv"), ("Kyiv", "kyiv"), ("Kiev", "kiev")]
+    assert [key for _name, key in names] == [search_name(name) for name, _key in names]
+
+
+def test_parse_line():
+    """test columns of the line are converted, names are transliterated for search"""
+    row = parse_line(YAREMCHE)
+
+    assert row["geonameid"] == 690548
+    assert row["name"] == "Yaremche"
+    assert (row["latitude"], row["longitude"]) == (48.45, 24.55)
+    assert row["fclass"] == "P"
+    assert row["cc2"] is None
+    assert row["population"] == 16000
+    assert row["elevation"] is None
+    assert row["moddate"].year == 2024
+    assert row["names"] == [
+        ("Yaremche", "yaremche"),
+        ("Jaremcze", "jaremcze"),
+        ("Яремче", "iaremche"),
+    ]
+
+
+@pytest.mark.parametrize(
+    "line",
+    [
+        "690548\tYaremche\n",
+        YAREMCHE.replace("48.45", "north"),
+        YAREMCHE.replace("690548", ""),
+    ],
+)
+def test_parse_wrong_line(line):
+    """test wrong lines raise ValueError"""
+    with pytest.raises(ValueError):
+        parse_line(line)
+
+
+def test_parse_lines():
+    """test lines of other feature classes are left out, wrong lines are counted"""
+    lines = [YAREMCHE, "\n", "690548\tYaremche\n", HOVERLA, KOLOMYIA.replace("24.55", "east")]
+
+    rows, skipped = parse_lines(lines)
+    assert [row["geonameid"] for row in rows] == [690548]
+    assert skipped == 2
+
+    rows, skipped = parse_lines(lines, "")
+    assert [row["geonameid"] for row in rows] == [690548, 703217]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 100])
+def test_load_cities(engine, chunk_size):
+    """test cities of the dump are loaded with their names, wrong lines are counted"""
+    lines = [YAREMCHE, HOVERLA, "wrong\n", KOLOMYIA]
+
+    counts = load_cities(engine, lines, chunk_size=chunk_size)
+
+    assert counts == {"loaded": 2, "skipped": 1}
+    assert cities(engine) == {690548: "Yaremche", 705392: "Kolomyia"}
+    assert (690548, "iaremche") in search_names(engine)
+    assert (705392, "kolomiia") in search_names(engine)
+
+    counts = load_cities(engine, [KOLOMYIA], chunk_size=chunk_size)
+
+    assert counts == {"loaded": 1, "skipped": 0}
+    assert cities(engine) == {705392: "Kolomyia"}
+    assert {geonameid for geonameid, _name in search_names(engine)} == {705392}
+
+
+def test_apply_modifications(engine):
+    """test cities are inserted or updated, older lines are ignored, other classes deleted"""
+    load_cities(engine, [YAREMCHE, KOLOMYIA])
+    lines = [
+        dump_line(690548, "Jaremcze", "Jaremcze", moddate="2024-02-01"),
+        dump_line(690548, "Yaremche old", "Yaremche old", moddate="2023-01-01"),
+        dump_line(705392, "Kolomyia", "Kolomyia", fclass="A", moddate="2024-02-01"),
+        dump_line(707471, "Ivano-Frankivsk", "Ivano-Frankivsk", "Івано-Франківськ"),
+        "wrong\n",
+    ]
+
+    counts = apply_modifications(engine, lines)
+
+    assert counts == {"inserted": 1, "updated": 1, "deleted": 1, "skipped": 1}
+    assert cities(engine) == {690548: "Jaremcze", 707471: "Ivano-Frankivsk"}
+    assert search_names(engine) == {(690548, "jaremcze"), (707471, "ivano frankivsk")}
+
+    older = dump_line(690548, "Yaremche", "Yaremche", moddate="2024-01-15")
+    assert apply_modifications(engine, [older])["updated"] == 0
+    assert cities(engine)[690548] == "Jaremcze"
+
+
+def test_apply_deletes(engine):
+    """test cities of deletes file are deleted with their names"""
+    load_cities(engine, [YAREMCHE, KOLOMYIA])
+    lines = ["690548\tYaremche\tduplicate\n", "# comment\n", "123\tUnknown\t\n"]
+
+    assert apply_deletes(engine, lines) == 1
+    assert cities(engine) == {705392: "Kolomyia"}
+    assert {geonameid for geonameid, _name in search_names(engine)} == {705392}
@@ -1,9 +1,18 @@
 """
 tests for router mountains
 """
+import json
+from contextlib import contextmanager
+
+import pytest
 from fastapi.testclient import TestClient
+from sqlalchemy import event, text
+from sqlmodel import Session
 
+from app.dependencies import config, db
+from app.geonames import invalidate_cities
 from app.main import app
+from app.routers.mountains import cluster_index
 
 RIDGE_SLUG = "chernogora"
 PEAK_SLUG = "bliznitsa"
@@ -12,6 +21,38 @@ ROUTE_SLUG = "bliznitsa-iz-vostochnogo-tsirka"
 client = TestClient(app)
 
 
+@pytest.fixture
+def auth_headers():
+    """fixture auth_headers of the test user"""
+    form_data = {
+        "username": config("TEST_USERNAME", cast=str),
+        "password": config("TEST_PASSWORD", cast=str),
+    }
+    response = client.post("/users/token", data=form_data)
+    assert response.status_code == 200
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@contextmanager
+def counted():
+    """count commits and statements sent to the database"""
+    counts = {"commits": 0, "statements": 0}
+
+    def on_commit(_session):
+        counts["commits"] += 1
+
+    def on_execute(*_args):
+        counts["statements"] += 1
+
+    event.listen(Session, "after_commit", on_commit)
+    event.listen(db, "before_cursor_execute", on_execute)
+    try:
+        yield counts
+    finally:
+        event.remove(Session, "after_commit", on_commit)
+        event.remove(db, "before_cursor_execute", on_execute)
+
+
 def test_read_ridges():
     """test read ridges"""
     response = client.get("/mountains/ridges")
@@ -56,6 +97,8 @@ def test_read_peaks():
     item = data[0]
     assert item["slug"]
     assert item["name"]
+    assert item["ridge"]["slug"]
+    assert "routes_list" in item
 
 
 def test_search_peaks():
@@ -129,3 +172,600 @@ def test_read_route():
     assert data["slug"]
     assert data["peak_id"]
     assert data["sections_list"]
+
+
+def test_read_peaks_batch():
+    """test read peaks by slugs, missing slug is reported"""
+    response = client.get(f"/mountains/peaks/batch?slugs={PEAK_SLUG},missing-peak")
+    assert response.status_code == 200
+    found, missing = response.json()
+
+    assert found["status"] == 200
+    assert found["peak"]["slug"] == PEAK_SLUG
+    assert missing["slug"] == "missing-peak"
+    assert missing["status"] == 404
+    assert missing["peak"] is None
+
+
+def test_read_routes_batch():
+    """test read routes by slugs"""
+    response = client.get(f"/mountains/routes/batch?slugs={ROUTE_SLUG}")
+    assert response.status_code == 200
+    data = response.json()
+
+    assert len(data) == 1
+    assert data[0]["route"]["slug"] == ROUTE_SLUG
+
+    response = client.get(f"/mountains/routes/batch?slugs={ROUTE_SLUG.upper()}")
+    assert response.status_code == 200
+    data = response.json()
+
+    assert data[0]["slug"] == ROUTE_SLUG.upper()
+    assert data[0]["status"] == 200
+    assert data[0]["route"]["slug"] == ROUTE_SLUG
+
+
+def test_read_route_page():
+    """test read route with its peak and ridge"""
+    response = client.get(f"/mountains/route/{ROUTE_SLUG}/page")
+    assert response.status_code == 200
+    data = response.json()
+
+    assert data["route"]["slug"] == ROUTE_SLUG
+    assert data["peak"]["slug"] == PEAK_SLUG
+    assert data["ridge"]["slug"] == RIDGE_SLUG
+
+    response = client.get(
+        f"/mountains/route/{ROUTE_SLUG}/page",
+        headers={"If-None-Match": response.headers["etag"]},
+    )
+    assert response.status_code == 304
+
+
+def test_read_route_page_changed_cities():
+    """test the route page is outdated by changed cities"""
+    response = client.get(f"/mountains/route/{ROUTE_SLUG}/page")
+    assert response.status_code == 200
+
+    invalidate_cities()
+    response = client.get(
+        f"/mountains/route/{ROUTE_SLUG}/page",
+        headers={"If-None-Match": response.headers["etag"]},
+    )
+    assert response.status_code == 200
+
+
+def test_read_route_fields():
+    """test read route with sparse fieldset"""
+    response = client.get(f"/mountains/route/{ROUTE_SLUG}?fields=name,difficulty")
+    assert response.status_code == 200
+    assert set(response.json()) == {"name", "difficulty"}
+
+    full = client.get(f"/mountains/route/{ROUTE_SLUG}")
+    assert full.headers["etag"] != response.headers["etag"]
+
+    response = client.get(f"/mountains/route/{ROUTE_SLUG}?fields=unknown")
+    assert response.status_code == 400
+
+
+def test_search_routes_include():
+    """test search routes with additional fields"""
+    response = client.get("/mountains/routes/search?include=description")
+    assert response.status_code == 200
+    item = response.json()[0]
+    assert "description" in item
+    assert item["slug"]
+
+
+def test_read_route_not_modified():
+    """test read route with If-None-Match"""
+    response = client.get(f"/mountains/route/{ROUTE_SLUG}")
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+
+    response = client.get(
+        f"/mountains/route/{ROUTE_SLUG}", headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+    assert not response.content
+
+
+def test_read_peak_not_modified():
+    """test read peak with If-Modified-Since"""
+    response = client.get(f"/mountains/peak/{PEAK_SLUG}")
+    assert response.status_code == 200
+    last_modified = response.headers["last-modified"]
+
+    response = client.get(
+        f"/mountains/peak/{PEAK_SLUG}", headers={"If-Modified-Since": last_modified}
+    )
+    assert response.status_code == 304
+
+
+def test_read_ridge_modified():
+    """test read ridge with outdated ETag"""
+    response = client.get(
+        f"/mountains/ridge/{RIDGE_SLUG}", headers={"If-None-Match": '"outdated"'}
+    )
+    assert response.status_code == 200
+    assert response.headers["etag"] != '"outdated"'
+    assert response.json()["slug"] == RIDGE_SLUG
+
+
+def test_read_ridges_cached():
+    """test read ridges twice, the second response is from cache"""
+    response = client.get("/mountains/ridges")
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+
+    response = client.get("/mountains/ridges")
+    assert response.status_code == 200
+    assert response.headers["etag"] == etag
+
+    response = client.get("/mountains/ridges", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+
+def test_export_catalogue():
+    """test export of the catalogue as json lines"""
+    response = client.get("/mountains/export.ndjson")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    records = [json.loads(line) for line in response.text.splitlines()]
+
+    assert records[0]["type"] == "ridge"
+    assert {record["type"] for record in records} >= {"ridge", "peak", "route"}
+    assert any(record.get("slug") == ROUTE_SLUG for record in records)
+
+
+def test_import_requires_user():
+    """test bulk import is not available without authorization"""
+    response = client.post(
+        "/mountains/import?dry_run=true",
+        content='{"type": "ridge", "name": "Test ridge"}',
+        headers={"content-type": "application/x-ndjson"},
+    )
+    assert response.status_code == 401
+
+
+def test_import_catalogue(auth_headers):
+    """test bulk import of ridge with peak and routes, objects are read by their slugs"""
+    documents = [
+        {
+            "type": "ridge",
+            "name": "Test import ridge",
+            "peaks": [
+                {
+                    "name": "Test import peak",
+                    "height": 2000,
+                    "point": {"latitude": 48.1, "longitude": 24.1},
+                    "routes": [
+                        {
+                            "name": "Test import route",
+                            "sections": [{"num": 1, "description": "Test section"}],
+                            "points": [
+                                {"latitude": 48.1, "longitude": 24.1},
+                                {"latitude": 48.2, "longitude": 24.2},
+                            ],
+                        }
+                    ],
+                }
+            ],
+        },
+        {"type": "route", "peak": PEAK_SLUG, "name": "Test import route"},
+    ]
+    response = client.post(
+        "/mountains/import",
+        content="\n".join(json.dumps(document) for document in documents),
+        headers={**auth_headers, "content-type": "application/x-ndjson"},
+    )
+    assert response.status_code == 200
+    result = response.json()
+
+    ridge = client.get("/mountains/ridge/test-import-ridge").json()
+    peak = client.get("/mountains/peak/test-import-peak").json()
+    route = client.get("/mountains/route/test-import-route").json()
+    other = client.get("/mountains/route/test-import-route-1").json()
+    for path in (
+        "/mountains/route/test-import-route",
+        "/mountains/route/test-import-route-1",
+        "/mountains/peak/test-import-peak",
+        "/mountains/ridge/test-import-ridge",
+    ):
+        client.delete(path, headers=auth_headers)
+
+    assert result["errors"] == []
+    assert [result[name] for name in ("ridges", "peaks", "routes", "sections", "points")] == [
+        1,
+        1,
+        2,
+        1,
+        2,
+    ]
+    assert peak["ridge_id"] == ridge["id"]
+    assert peak["point"]["latitude"] == 48.1
+    assert route["peak_id"] == peak["id"]
+    assert len(route["sections_list"]) == 1
+    assert len(route["routepoints_list"]) == 2
+    assert other["peak_id"] != peak["id"]
+    assert other["peak"]["slug"] == PEAK_SLUG
+
+
+def test_add_peak_one_commit(auth_headers):
+    """test peak with point is added by one commit"""
+    ridge = client.get(f"/mountains/ridge/{RIDGE_SLUG}").json()
+    data = {
+        "name": "Test peak",
+        "ridge_id": ridge["id"],
+        "height": 1000,
+        "point": {"latitude": 48.1, "longitude": 24.1},
+    }
+    with counted() as counts:
+        response = client.post("/mountains/peaks/add", json=data, headers=auth_headers)
+    assert response.status_code == 200
+    peak = response.json()
+    client.delete(f"/mountains/peak/{peak['slug']}", headers=auth_headers)
+
+    assert peak["point"]["latitude"] == 48.1
+    assert counts["commits"] == 1
+    assert counts["statements"] <= 12
+
+
+def test_add_route_point_one_commit(auth_headers):
+    """test route point with geo point is added by one commit"""
+    route = client.get(f"/mountains/route/{ROUTE_SLUG}").json()
+    data = {"route_id": route["id"], "point": {"latitude": 48.1, "longitude": 24.1}}
+    with counted() as counts:
+        response = client.post(
+            f"/mountains/route/{route['id']}/add/point", json=data, headers=auth_headers
+        )
+    assert response.status_code == 200
+    point = response.json()
+    client.delete(f"/mountains/route/point/{point['id']}", headers=auth_headers)
+
+    assert point["point_id"]
+    assert counts["commits"] == 1
+    assert counts["statements"] <= 12
+
+
+def test_add_route_points_batch(auth_headers):
+    """test route points are added by one request"""
+    route = client.get(f"/mountains/route/{ROUTE_SLUG}").json()
+    points = [
+        {"latitude": 48.1, "longitude": 24.1},
+        {"latitude": 48.2, "longitude": 24.2, "description": "Test point"},
+    ]
+    with counted() as counts:
+        response = client.post(
+            f"/mountains/route/{route['id']}/points/batch?ids=true",
+            json=points,
+            headers=auth_headers,
+        )
+    assert response.status_code == 200
+    data = response.json()
+    for point_id in data["ids"]:
+        client.delete(f"/mountains/route/point/{point_id}", headers=auth_headers)
+
+    assert data["deleted"] == 0
+    assert len(data["ids"]) == 2
+    assert counts["commits"] == 1
+
+
+def test_update_peak_keeps_shared_point(auth_headers):
+    """test moving the peak does not move route points sharing its geo point"""
+    document = {
+        "type": "peak",
+        "ridge": RIDGE_SLUG,
+        "name": "Test moved peak",
+        "point": {"latitude": 48.1, "longitude": 24.1},
+        "routes": [
+            {"name": "Test moved peak route", "points": [{"latitude": 48.1, "longitude": 24.1}]}
+        ],
+    }
+    response = client.post("/mountains/import", json=document, headers=auth_headers)
+    assert response.status_code == 200
+    with Session(db) as session:
+        session.execute(
+            text(
+                "UPDATE route_point SET point_id = (SELECT point_id FROM peak WHERE slug = :peak)"
+                " WHERE route_id = (SELECT id FROM route WHERE slug = :route)"
+            ),
+            {"peak": "test-moved-peak", "route": "test-moved-peak-route"},
+        )
+        session.commit()
+    peak = client.get("/mountains/peak/test-moved-peak").json()
+
+    response = client.put(
+        "/mountains/peak/test-moved-peak",
+        json={
+            "name": "Test moved peak",
+            "ridge_id": peak["ridge_id"],
+            "point": {"latitude": 47.5, "longitude": 24.5},
+        },
+        headers=auth_headers,
+    )
+    route = client.get("/mountains/route/test-moved-peak-route").json()
+    moved = client.get("/mountains/peak/test-moved-peak").json()
+    with Session(db) as session:
+        point = session.execute(
+            text("SELECT latitude, longitude FROM geopoint WHERE id = :id"),
+            {"id": route["routepoints_list"][0]["point_id"]},
+        ).one()
+    client.delete("/mountains/route/test-moved-peak-route", headers=auth_headers)
+    client.delete("/mountains/peak/test-moved-peak", headers=auth_headers)
+
+    assert response.status_code == 200
+    assert (moved["point"]["latitude"], moved["point"]["longitude"]) == (47.5, 24.5)
+    assert tuple(point) == (48.1, 24.1)
+
+
+def test_replace_route_points_keeps_peak_point(auth_headers):
+    """test replacing route points keeps the geo point shared with the peak"""
+    document = {
+        "type": "peak",
+        "ridge": RIDGE_SLUG,
+        "name": "Test shared point peak",
+        "point": {"latitude": 48.1, "longitude": 24.1},
+        "routes": [
+            {
+                "name": "Test shared point route",
+                "points": [{"latitude": 48.1, "longitude": 24.1}],
+            }
+        ],
+    }
+    response = client.post("/mountains/import", json=document, headers=auth_headers)
+    assert response.status_code == 200
+    with Session(db) as session:
+        session.execute(
+            text(
+                "UPDATE route_point SET point_id = (SELECT point_id FROM peak WHERE slug = :peak)"
+                " WHERE route_id = (SELECT id FROM route WHERE slug = :route)"
+            ),
+            {"peak": "test-shared-point-peak", "route": "test-shared-point-route"},
+        )
+        session.commit()
+    route = client.get("/mountains/route/test-shared-point-route").json()
+
+    response = client.post(
+        f"/mountains/route/{route['id']}/points/batch?replace=true",
+        json=[{"latitude": 48.2, "longitude": 24.2}],
+        headers=auth_headers,
+    )
+    peak = client.get("/mountains/peak/test-shared-point-peak").json()
+    client.delete("/mountains/route/test-shared-point-route", headers=auth_headers)
+    client.delete("/mountains/peak/test-shared-point-peak", headers=auth_headers)
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["deleted"] == 1
+    assert data["added"] == 1
+    assert data["ids"] == []
+    assert peak["point"]["latitude"] == 48.1
+
+
+def test_add_route_sections_batch_too_many(auth_headers):
+    """test batch of route sections is limited"""
+    route = client.get(f"/mountains/route/{ROUTE_SLUG}").json()
+    sections = [{"num": num} for num in range(10001)]
+    response = client.post(
+        f"/mountains/route/{route['id']}/sections/batch", json=sections, headers=auth_headers
+    )
+    assert response.status_code == 400
+
+
+def test_add_route_track_unknown_format(auth_headers):
+    """test track of unknown format is not imported"""
+    route = client.get(f"/mountains/route/{ROUTE_SLUG}").json()
+    response = client.post(
+        f"/mountains/route/{route['id']}/track",
+        files={"file": ("track.txt", b"48.1 24.1")},
+        headers=auth_headers,
+    )
+    assert response.status_code == 400
+
+
+def test_add_route_track_invalid(auth_headers):
+    """test track point without longitude is reported as invalid track"""
+    route = client.get(f"/mountains/route/{ROUTE_SLUG}").json()
+    gpx = b'<gpx><trk><trkseg><trkpt lat="48.1"/></trkseg></trk></gpx>'
+    response = client.post(
+        f"/mountains/route/{route['id']}/track",
+        files={"file": ("track.gpx", gpx)},
+        headers=auth_headers,
+    )
+    assert response.status_code == 400
+
+
+def test_export_route_gpx():
+    """test export of the route as GPX"""
+    response = client.get(f"/mountains/route/{ROUTE_SLUG}.gpx")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/gpx+xml")
+    assert "<trk>" in response.text
+
+    etag = response.headers["etag"]
+    response = client.get(f"/mountains/route/{ROUTE_SLUG}.gpx", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+
+def test_export_ridge_geojson():
+    """test export of the ridge as GeoJSON"""
+    response = client.get(f"/mountains/ridge/{RIDGE_SLUG}.geojson")
+    assert response.status_code == 200
+    data = response.json()
+
+    assert data["type"] == "FeatureCollection"
+    assert {feature["properties"]["kind"] for feature in data["features"]} >= {"peak", "route"}
+
+
+@pytest.fixture
+def geometry_route(auth_headers):
+    """fixture new route of the test peak, deleted after the test"""
+    document = {"type": "route", "peak": PEAK_SLUG, "name": "Test geometry route"}
+    response = client.post("/mountains/import", json=document, headers=auth_headers)
+    assert response.status_code == 200
+    route = client.get("/mountains/route/test-geometry-route").json()
+    yield route
+    client.delete("/mountains/route/test-geometry-route", headers=auth_headers)
+
+
+def upload_track(route: dict, points: list, headers: dict, target: str = "geometry"):
+    """upload the points as GPX track of the route without simplification"""
+    gpx = "".join(
+        [
+            "<gpx><trk><trkseg>",
+            *(f'<trkpt lat="{lat}" lon="{lon}"/>' for lat, lon in points),
+            "</trkseg></trk></gpx>",
+        ]
+    )
+    response = client.post(
+        f"/mountains/route/{route['id']}/track?tolerance=0&target={target}",
+        files={"file": ("track.gpx", gpx.encode())},
+        headers=headers,
+    )
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_read_route_geometry(auth_headers, geometry_route):
+    """test read the uploaded track of the route as encoded polyline"""
+    points = [(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)]
+    result = upload_track(geometry_route, points, auth_headers)
+    response = client.get(f"/mountains/route/{geometry_route['slug']}/geometry")
+    assert response.status_code == 200
+    data = response.json()
+
+    assert result["added"] == 3
+    assert data["precision"] == 5
+    assert data["points"] == 3
+    # example of the polyline algorithm documentation of Google Maps
+    assert data["polyline"] == "_p~iF~ps|U_ulLnnqC_mqNvxq`@"
+
+
+def test_track_as_points_drops_geometry(auth_headers, geometry_route):
+    """test the track saved as route points is read instead of the uploaded geometry"""
+    points = [(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)]
+    upload_track(geometry_route, points, auth_headers)
+    result = upload_track(geometry_route, [(48.0, 24.0), (48.1, 24.1)], auth_headers, "points")
+    response = client.get(f"/mountains/route/{geometry_route['slug']}/geometry")
+    assert response.status_code == 200
+
+    assert result["added"] == 2
+    assert response.json()["points"] == 2
+
+
+def test_read_route_nearest_city_of_track(monkeypatch, auth_headers, geometry_route):
+    """test the nearest city of the route is found for the first vertex of its track"""
+    monkeypatch.setattr(
+        "app.models.mountains.nearest_city",
+        lambda latitude, longitude: {
+            "id": 1,
+            "name": f"{latitude:.2f},{longitude:.2f}",
+            "country": None,
+            "distance": 0,
+        },
+    )
+    url = f"/mountains/route/{geometry_route['slug']}?fields=nearest_city"
+    response = client.post(
+        f"/mountains/route/{geometry_route['id']}/points/batch",
+        json=[{"latitude": 48.75, "longitude": 24.25}, {"latitude": 48.0, "longitude": 24.0}],
+        headers=auth_headers,
+    )
+    assert response.status_code == 200
+    assert client.get(url).json()["nearest_city"]["name"] == "48.75,24.25"
+
+    upload_track(geometry_route, [(48.25, 24.5), (48.5, 24.75)], auth_headers)
+    statements = []
+
+    def on_execute(_connection, _cursor, statement, *_args):
+        statements.append(statement)
+
+    event.listen(db, "before_cursor_execute", on_execute)
+    try:
+        response = client.get(url)
+        page = client.get(f"/mountains/route/{geometry_route['slug']}/page")
+    finally:
+        event.remove(db, "before_cursor_execute", on_execute)
+    assert response.status_code == 200
+    assert page.status_code == 200
+
+    assert response.json()["nearest_city"]["name"] == "48.25,24.50"
+    assert page.json()["route"]["nearest_city"]["name"] == "48.25,24.50"
+    # only the first vertex of the track is read
+    assert statements
+    for statement in statements:
+        assert "route.geometry" not in statement.replace("substr(route.geometry", "")
+
+
+def test_read_route_geometry_zoom(auth_headers, geometry_route):
+    """test the track of the route is simplified for zoom level"""
+    points = [(48.0 + k * 0.0001, 24.0 + k * 0.0001 + (k % 2) * 0.00001) for k in range(200)]
+    upload_track(geometry_route, points, auth_headers)
+    full = client.get(f"/mountains/route/{geometry_route['slug']}/geometry").json()
+    response = client.get(f"/mountains/route/{geometry_route['slug']}/geometry?zoom=10")
+    assert response.status_code == 200
+    data = response.json()
+
+    assert full["points"] == 200
+    assert data["tolerance"] > 0
+    assert 2 <= data["points"] < 10
+
+
+def test_export_catalogue_geometry(auth_headers, geometry_route):
+    """test the route geometry is exported as polyline without simplification levels"""
+    points = [(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)]
+    upload_track(geometry_route, points, auth_headers)
+    response = client.get("/mountains/export.ndjson")
+    assert response.status_code == 200
+    records = [json.loads(line) for line in response.text.splitlines()]
+    routes = {record["id"]: record for record in records if record["type"] == "route"}
+    route = routes[geometry_route["id"]]
+
+    assert route["geometry"] == "_p~iF~ps|U_ulLnnqC_mqNvxq`@"
+    assert "geometry_levels" not in route
+
+
+def test_read_tile():
+    """test the vector tile is returned and validated by etag"""
+    response = client.get("/mountains/tiles/0/0/0.mvt")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/vnd.mapbox-vector-tile"
+
+    response = client.get(
+        "/mountains/tiles/0/0/0.mvt", headers={"If-None-Match": response.headers["etag"]}
+    )
+    assert response.status_code == 304
+    assert client.get("/mountains/tiles/1/2/0.mvt").status_code == 404
+
+
+def test_read_peak_clusters():
+    """test peaks are clustered for zoom level within bbox"""
+    # peaks changed by other tests are clustered in background
+    cluster_index.join()
+    response = client.get("/mountains/peaks/clusters?bbox=-180,-85,180,85&zoom=0")
+    assert response.status_code == 200
+    clusters = response.json()
+    peaks = client.get("/mountains/peaks?fields=id,point").json()
+
+    assert sum(cluster["count"] for cluster in clusters) == len(
+        [peak for peak in peaks if peak["point"]]
+    )
+    for cluster in clusters:
+        assert cluster["peak"]["slug"]
+
+    response = client.get("/mountains/peaks/clusters?bbox=30,45,20,50&zoom=0")
+    assert response.status_code == 400
+
+
+def test_read_peak_nearest_city():
+    """test the nearest city of the peak is in the response"""
+    response = client.get(f"/mountains/peak/{PEAK_SLUG}?fields=point,nearest_city")
+    assert response.status_code == 200
+    data = response.json()
+
+    assert "nearest_city" in data
+    if data["nearest_city"]:
+        assert data["point"]
+        assert data["nearest_city"]["name"]
+        assert data["nearest_city"]["distance"] >= 0
@@ -0,0 +1,179 @@
+"""
+tests for vector tiles
+"""
+
+import numpy as np
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, SQLModel
+
+from app.models.mountains import GeoPoint, Peak
+from app.tiles import (
+    EXTENT,
+    TileCache,
+    TileIndex,
+    TileService,
+    _RouteShape,
+    clip_line,
+    mercator,
+)
+
+
+def _varint(data: bytes, pos: int) -> tuple:
+    """unsigned varint at the position and the next position"""
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if byte < 0x80:
+            return value, pos
+
+
+def _fields(data: bytes) -> list:
+    """field numbers with varints or bytes of protobuf message"""
+    fields, pos = [], 0
+    while pos < len(data):
+        key, pos = _varint(data, pos)
+        if key & 7 == 0:
+            value, pos = _varint(data, pos)
+        elif key & 7 == 2:
+            size, pos = _varint(data, pos)
+            end = pos + size
+            value, pos = data[pos:end], end
+        else:
+            end = pos + 8
+            value, pos = data[pos:end], end
+        fields.append((key >> 3, value))
+    return fields
+
+
+def _packed(data: bytes) -> list:
+    """packed varints"""
+    values, pos = [], 0
+    while pos < len(data):
+        value, pos = _varint(data, pos)
+        values.append(value)
+    return values
+
+
+def _lines(commands: list) -> list:
+    """lines of points decoded from geometry commands"""
+    lines, x, y, pos = [], 0, 0, 0
+    while pos < len(commands):
+        command, count = commands[pos] & 7, commands[pos] >> 3
+        pos += 1
+        if command == 1:
+            lines.append([])
+        for _ in range(count):
+            dx, dy = commands[pos], commands[pos + 1]
+            x += (dx >> 1) ^ -(dx & 1)
+            y += (dy >> 1) ^ -(dy & 1)
+            lines[-1].append((x, y))
+            pos += 2
+    return lines
+
+
+def decode_tile(data: bytes) -> dict:
+    """layers of the tile: features by ids with type, lines and properties"""
+    layers = {}
+    for _number, layer_data in _fields(data):
+        layer = dict(_fields(layer_data))
+        fields = _fields(layer_data)
+        keys = [value.decode() for number, value in fields if number == 3]
+        values = []
+        for number, value in fields:
+            if number == 4:
+                kind, raw = _fields(value)[0]
+                values.append(raw.decode() if kind == 1 else (raw >> 1) ^ -(raw & 1))
+        features = {}
+        for number, value in fields:
+            if number == 2:
+                feature = dict(_fields(value))
+                tags = _packed(feature.get(2, b""))
+                features[feature[1]] = {
+                    "type": feature[3],
+                    "lines": _lines(_packed(feature[4])),
+                    "properties": {keys[k]: values[v] for k, v in zip(tags[::2], tags[1::2])},
+                }
+        assert layer[5] == EXTENT
+        layers[layer[1].decode()] = features
+    return layers
+
+
+def test_clip_line():
+    """test parts of lines inside the square"""
+    parts = clip_line(np.array([(-5.0, 5.0), (5.0, 5.0), (15.0, 5.0)]), 0, 10)
+    assert [part.tolist() for part in parts] == [[[0, 5], [5, 5], [10, 5]]]
+
+    parts = clip_line(np.array([(2.0, 2.0), (2.0, 20.0), (8.0, 20.0), (8.0, 2.0)]), 0, 10)
+    assert [part.tolist() for part in parts] == [[[2, 2], [2, 10]], [[8, 10], [8, 2]]]
+
+    assert clip_line(np.array([(-5.0, -5.0), (-1.0, 20.0)]), 0, 10) == []
+    assert clip_line(np.array([(5.0, 5.0)]), 0, 10) == []
+
+
+def test_encode_tile():
+    """test peaks and routes of the encoded tile"""
+    index = TileIndex(None)
+    index.loaded = True
+    position = mercator([(48.16, 24.5)])[0]
+    index.peaks[7] = (tuple(position), {"slug": "hoverla", "name": "Hoverla", "height": 2061})
+    index.peaks[8] = (tuple(mercator([(-30.0, -60.0)])[0]), {"slug": "far", "name": "Far"})
+    coordinates = np.array([(48.0, 24.0), (48.1, 24.1), (48.2, 24.2)])
+    index.routes[3] = _RouteShape({"slug": "route", "name": "Route"}, coordinates, None)
+
+    tile = decode_tile(index.encode(0, 0, 0))
+
+    assert set(tile) == {"peaks", "routes"}
+    assert set(tile["peaks"]) == {7, 8}
+    peak = tile["peaks"][7]
+    assert peak["type"] == 1
+    assert peak["lines"] == [[tuple(np.round(position * EXTENT).astype(int).tolist())]]
+    assert peak["properties"] == {"slug": "hoverla", "name": "Hoverla", "height": 2061}
+    route = tile["routes"][3]
+    assert route["type"] == 2
+    assert route["properties"] == {"slug": "route", "name": "Route"}
+
+    x, y = (position * 2**10).astype(int)
+    assert set(decode_tile(index.encode(10, x, y))["peaks"]) == {7}
+    assert decode_tile(index.encode(10, x + 5, y)) == {}
+
+
+@pytest.fixture
+def engine():
+    """fixture engine of empty database in memory"""
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    SQLModel.metadata.create_all(engine)
+    return engine
+
+
+def test_moved_peak_drops_cached_tile(engine):
+    """test the cached tile is built again after its peak is moved away"""
+    with Session(engine) as session:
+        peak = Peak(slug="hoverla", name="Hoverla", point=GeoPoint(latitude=48.16, longitude=24.5))
+        session.add(peak)
+        session.commit()
+        peak_id = peak.id
+    service = TileService(TileIndex(engine), TileCache(None, 100), 18)
+    x, y = (mercator([(48.16, 24.5)])[0] * 2**10).astype(int).tolist()
+
+    assert set(decode_tile(service.tile(10, x, y))["peaks"]) == {peak_id}
+
+    with Session(engine) as session:
+        peak = session.get(Peak, peak_id)
+        peak.point.latitude = 47.0
+        session.flush()
+        rows = set(session.info["changed_rows"])
+        session.commit()
+    # the listener of changed rows (see app.cache.response.listen_changed_rows)
+    service.index.changed(rows)
+
+    assert ("peak", peak_id) in rows
+    assert decode_tile(service.tile(10, x, y)) == {}
+    x, y = (mercator([(47.0, 24.5)])[0] * 2**10).astype(int).tolist()
+    assert set(decode_tile(service.tile(10, x, y))["peaks"]) == {peak_id}
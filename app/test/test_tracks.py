@@ -0,0 +1,117 @@
+"""
+tests for GPS tracks
+"""
+
+import io
+import math
+
+import pytest
+
+from app import tracks
+from app.tracks import _meters, read_track, simplify
+
+GPX = b"""<?xml version="1.0" encoding="UTF-8"?>
+<gpx version="1.1" xmlns="http://www.topografix.com/GPX/1/1">
+<wpt lat="48.0" lon="24.0"><name>Waypoint</name></wpt>
+<trk><trkseg>
+<trkpt lat="48.1" lon="24.1"><ele>1000</ele></trkpt>
+<trkpt lat="48.2" lon="24.2"/>
+</trkseg></trk>
+<rte><rtept lat="49.0" lon="25.0"/></rte>
+</gpx>
+"""
+
+KML = b"""<?xml version="1.0" encoding="UTF-8"?>
+<kml xmlns="http://www.opengis.net/kml/2.2"
+    xmlns:gx="http://www.google.com/kml/ext/2.2"><Document>
+<Placemark><Point><coordinates>24.0,48.0,0</coordinates></Point></Placemark>
+<Placemark><LineString><coordinates>
+24.1,48.1,1000 24.2,48.2,1100
+</coordinates></LineString></Placemark>
+<Placemark><gx:Track><gx:coord>24.3 48.3 1200</gx:coord></gx:Track></Placemark>
+</Document></kml>
+"""
+
+GEOJSON = b"""{"type": "FeatureCollection", "features": [
+{"type": "Feature", "properties": {"name": "coordinates"},
+ "geometry": {"type": "Point", "coordinates": [24.0, 48.0]}},
+{"type": "Feature", "properties": {},
+ "geometry": {"type": "LineString", "coordinates": [[24.1, 48.1, 1000], [24.2, 48.2]]}},
+{"type": "Feature", "properties": {},
+ "geometry": {"type": "MultiLineString", "coordinates": [[[24.3, 48.3]], [[-24.4, -48.4e0]]]}}
+]}
+"""
+
+
+def test_read_gpx():
+    """test track points of GPX are read, waypoints and route points are skipped"""
+    assert list(read_track(io.BytesIO(GPX), "gpx")) == [(48.1, 24.1), (48.2, 24.2)]
+
+
+def test_read_kml():
+    """test line strings and gx:Track of KML are read, points are skipped"""
+    points = list(read_track(io.BytesIO(KML), "kml"))
+    assert points == [(48.1, 24.1), (48.2, 24.2), (48.3, 24.3)]
+
+
+@pytest.mark.parametrize("read_size", [1, 7, 64 * 1024])
+def test_read_geojson(monkeypatch, read_size):
+    """test lines of GeoJSON are read by chunks splitting tokens, points are skipped"""
+    monkeypatch.setattr(tracks, "READ_SIZE", read_size)
+    points = list(read_track(io.BytesIO(GEOJSON), "geojson"))
+    assert points == [(48.1, 24.1), (48.2, 24.2), (48.3, 24.3), (-48.4, -24.4)]
+
+
+@pytest.mark.parametrize(
+    "data, format",
+    [
+        (b'<gpx><trk><trkseg><trkpt lat="48.1"/></trkseg></trk></gpx>', "gpx"),
+        (b"<gpx><trk><trkseg><trkpt", "gpx"),
+        (b"<kml><LineString><coordinates>24.1</coordinates></LineString></kml>", "kml"),
+        (b'{"coordinates": [[24.1], [24.2, 48.2]]}', "geojson"),
+        (b'{"coordinates": [[24.1, "48.1"]]}', "geojson"),
+        (b'{"coordinates": [[24.1, 48.1]', "geojson"),
+        (b'{"type": "Point", "coordinates": [24.1, 48.1]}', "geojson"),
+    ],
+)
+def test_read_invalid_track(data, format):
+    """test invalid tracks raise ValueError (ParseError for broken xml)"""
+    with pytest.raises((ValueError, SyntaxError)):
+        list(read_track(io.BytesIO(data), format))
+
+
+def _deviation(start: tuple, end: tuple, point: tuple) -> float:
+    """distance in meters of the point from the line through start and end"""
+    x, y = _meters(start, end)
+    px, py = _meters(start, point)
+    length = math.hypot(x, y)
+    if length == 0:
+        return math.hypot(px, py)
+    return abs(x * py - y * px) / length
+
+
+def test_simplify_tolerance():
+    """test every dropped point is within tolerance of the line between kept points"""
+    points = [
+        (48.0 + k * 0.0001, 24.0 + k * 0.0001 + 0.00005 * math.sin(k / 7) + 0.0002 * (k > 300))
+        for k in range(1000)
+    ]
+    tolerance = 10.0
+    kept = list(simplify(points, tolerance))
+
+    assert kept[0] == points[0]
+    assert kept[-1] == points[-1]
+    assert 2 < len(kept) < len(points) / 5
+    index = {point: k for k, point in enumerate(points)}
+    for start, end in zip(kept, kept[1:]):
+        first, last = index[start] + 1, index[end]
+        for point in points[first:last]:
+            assert _deviation(start, end, point) <= tolerance + 1e-6
+
+
+def test_simplify_keeps_all_points_without_tolerance():
+    """test zero tolerance keeps all points, straight line is two points"""
+    points = [(48.0 + k * 0.001, 24.0 + k * 0.001) for k in range(100)]
+
+    assert list(simplify(points, 0)) == points
+    assert list(simplify(points, 1.0)) == [points[0], points[-1]]
@@ -0,0 +1,604 @@
+"""
+Vector tiles
+"""
+
+import math
+import os
+import shutil
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from sqlalchemy import Engine, select
+
+import app.settings as app_settings
+from app.cache.response import response_cache
+from app.dependencies import config
+from app.geometry import simplification_levels, unpack_geometry, unpack_levels, zoom_tolerance
+from app.models.mountains import GeoPoint, Peak, Route, RoutePoint
+
+EXTENT = 4096
+# margin of the tile in its units, lines are clipped to it
+BUFFER = 64
+MAX_LATITUDE = 85.0511287798
+# ids per query loading changed objects
+LOAD_CHUNK_SIZE = 500
+MVT_MEDIA_TYPE = "application/vnd.mapbox-vector-tile"
+# tags of response cache changed with peaks and routes (see app.cache.response.row_tags)
+VERSION_TAGS = ("peak", "route")
+
+_CACHE_DIR = config("TILE_CACHE_DIR", cast=str, default="")
+_CACHE_MAX_ENTRIES = config("TILE_CACHE_MAX_ENTRIES", cast=int, default=2048)
+
+
+def tiles_version() -> tuple:
+    """generations of peaks and routes in the response cache, shared by workers"""
+    return tuple(response_cache.backend.generation(tag) for tag in VERSION_TAGS)
+
+
+def mercator(coordinates) -> np.ndarray:
+    """latitude and longitude pairs in web mercator, 0..1 from north-west corner"""
+    coordinates = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+    latitude = np.radians(np.clip(coordinates[:, 0], -MAX_LATITUDE, MAX_LATITUDE))
+    x = (coordinates[:, 1] + 180.0) / 360.0
+    y = (1.0 - np.log(np.tan(latitude) + 1.0 / np.cos(latitude)) / math.pi) / 2.0
+    return np.column_stack((x, y))
+
+
+def tile_bounds(z: int, x: int, y: int, buffer: float = 0) -> tuple:
+    """bounds of the tile in mercator with buffer in tile units"""
+    size = 1.0 / 2**z
+    margin = size * buffer / EXTENT
+    return (x * size - margin, y * size - margin, (x + 1) * size + margin, (y + 1) * size + margin)
+
+
+def tile_range(z: int, bounds: tuple) -> tuple:
+    """x and y ranges of tiles at zoom z covering the bounds (with neighbours for buffer)"""
+    count = 2**z
+    minx, miny, maxx, maxy = bounds
+    return (
+        max(0, int(minx * count) - 1),
+        max(0, int(miny * count) - 1),
+        min(count - 1, int(maxx * count) + 1),
+        min(count - 1, int(maxy * count) + 1),
+    )
+
+
+# protobuf encoding of vector tile (mapbox vector tile specification 2.1)
+
+
+def _varint(value: int) -> bytes:
+    """unsigned varint"""
+    out = bytearray()
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _zigzag(value: int) -> int:
+    """signed integer for varint"""
+    return (value << 1) ^ (value >> 63)
+
+
+def _field(number: int, data: bytes) -> bytes:
+    """length delimited field"""
+    return _varint(number << 3 | 2) + _varint(len(data)) + data
+
+
+def _uint_field(number: int, value: int) -> bytes:
+    """varint field"""
+    return _varint(number << 3) + _varint(value)
+
+
+def _packed(number: int, values) -> bytes:
+    """packed repeated uint32 field"""
+    return _field(number, b"".join(_varint(value) for value in values))
+
+
+def _value(value) -> bytes:
+    """Value message: string, sint64 or double"""
+    if isinstance(value, str):
+        return _field(1, value.encode())
+    if isinstance(value, int):
+        return _uint_field(6, _zigzag(value))
+    return _varint(3 << 3 | 1) + struct.pack("<d", value)
+
+
+def _command(command: int, count: int) -> int:
+    """command integer of geometry"""
+    return command & 7 | count << 3
+
+
+def _geometry(lines) -> list:
+    """geometry commands of points (line of one point) or lines in tile units"""
+    commands = []
+    cursor = (0, 0)
+    for line in lines:
+        for index, (x, y) in enumerate(line):
+            if index == 0:
+                commands.append(_command(1, 1))
+            elif index == 1:
+                commands.append(_command(2, len(line) - 1))
+            commands += [_zigzag(x - cursor[0]), _zigzag(y - cursor[1])]
+            cursor = (x, y)
+    return commands
+
+
+class LayerEncoder:
+    """
+    Layer of vector tile.
+
+    Keys and values of feature properties are stored once in the layer
+    and referenced by features with their indexes.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.features = []
+        self.keys = {}
+        self.values = {}
+
+    def _tags(self, properties: dict) -> list:
+        """indexes of keys and values of the properties"""
+        tags = []
+        for key, value in properties.items():
+            if value is None:
+                continue
+            tags.append(self.keys.setdefault(key, len(self.keys)))
+            tags.append(self.values.setdefault((type(value), value), len(self.values)))
+        return tags
+
+    def add(self, feature_id: int, kind: int, lines: list, properties: dict):
+        """add feature of kind 1 (point) or 2 (line string)"""
+        self.features.append(
+            _uint_field(1, feature_id)
+            + _packed(2, self._tags(properties))
+            + _uint_field(3, kind)
+            + _packed(4, _geometry(lines))
+        )
+
+    def encode(self) -> bytes:
+        """Layer message"""
+        return (
+            _uint_field(15, 2)
+            + _field(1, self.name.encode())
+            + b"".join(_field(2, feature) for feature in self.features)
+            + b"".join(_field(3, key.encode()) for key in self.keys)
+            + b"".join(_field(4, _value(value)) for _type, value in self.values)
+            + _uint_field(5, EXTENT)
+        )
+
+
+def clip_line(points: np.ndarray, low: float, high: float) -> list:
+    """
+    Parts of the line inside the square low..high (Liang-Barsky).
+
+    All segments are clipped at once, consecutive visible segments
+    joined at unclipped vertices make one part.
+
+    Returns:
+        list: Arrays of vertices of the parts.
+    """
+    if len(points) < 2:
+        return []
+    start, delta = points[:-1], np.diff(points, axis=0)
+    t0 = np.zeros(len(delta))
+    t1 = np.ones(len(delta))
+    visible = np.ones(len(delta), dtype=bool)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for p, q in (
+            (-delta[:, 0], start[:, 0] - low),
+            (delta[:, 0], high - start[:, 0]),
+            (-delta[:, 1], start[:, 1] - low),
+            (delta[:, 1], high - start[:, 1]),
+        ):
+            ratio = q / p
+            visible &= ~((p == 0) & (q < 0))
+            t0 = np.where(p < 0, np.maximum(t0, ratio), t0)
+            t1 = np.where(p > 0, np.minimum(t1, ratio), t1)
+    visible &= t0 <= t1
+    heads = start + t0[:, None] * delta
+    tails = start + t1[:, None] * delta
+
+    parts = []
+    part, last = None, -1
+    for index in np.flatnonzero(visible):
+        if part is None or index - 1 != last or t1[last] < 1 or t0[index] > 0:
+            part = [heads[index]]
+            parts.append(part)
+        part.append(tails[index])
+        last = index
+    return [np.array(part) for part in parts]
+
+
+def _tile_units(points: np.ndarray, z: int, x: int, y: int) -> np.ndarray:
+    """mercator points in units of the tile"""
+    scale = 2**z * EXTENT
+    return points * scale - (x * EXTENT, y * EXTENT)
+
+
+def _distinct(points: np.ndarray) -> list:
+    """rounded vertices without repeated ones"""
+    rounded = np.round(points).astype(np.int64)
+    keep = np.ones(len(rounded), dtype=bool)
+    keep[1:] = np.any(rounded[1:] != rounded[:-1], axis=1)
+    return rounded[keep].tolist()
+
+
+class _RouteShape:
+    """track of the route in the index"""
+
+    __slots__ = ("properties", "points", "levels", "latitude", "bounds")
+
+    def __init__(self, properties: dict, coordinates: np.ndarray, levels: np.ndarray | None):
+        self.properties = properties
+        self.points = mercator(coordinates)
+        if levels is None or len(levels) != len(coordinates):
+            levels = simplification_levels(coordinates)
+        self.levels = levels
+        self.latitude = float(coordinates[0, 0])
+        self.bounds = (*self.points.min(axis=0), *self.points.max(axis=0))
+
+
+class TileIndex:
+    """
+    Peaks and route tracks in memory for vector tiles.
+
+    Peaks are kept as arrays of mercator positions, routes as tracks
+    with their simplification levels and bounding boxes; objects of the
+    tile are found by comparing the arrays with the tile bounds.
+    The index is loaded with the first tile, peaks and routes changed
+    by this process are reloaded before the next tile.
+
+    Every commit changing peaks or routes increments their generations
+    in the response cache (shared by workers with SQLite or Redis
+    backend). The index counts the commits of this process, so other
+    generations mean changes of other processes: they are checked every
+    check_interval seconds and the whole index is loaded again.
+
+    Attributes:
+        engine (Engine): Database engine.
+        check_interval (float): Seconds between checks of generations.
+        loaded (bool): The index is loaded.
+    """
+
+    def __init__(self, engine: Engine, check_interval: float = 0):
+        self.engine = engine
+        self.check_interval = check_interval
+        self.loaded = False
+        self.peaks = {}
+        self.routes = {}
+        self.pending = set()
+        self._lock = threading.Lock()
+        self._arrays = None
+        self._version = None
+        self._checked = 0.0
+        self._stale = False
+
+    def changed(self, rows):
+        """remember changed peaks and routes (table, id), they are reloaded later"""
+        with self._lock:
+            tables = {table for table, _row_id in rows}
+            if self._version is not None:
+                self._version = tuple(
+                    generation + (tag in tables)
+                    for generation, tag in zip(self._version, VERSION_TAGS)
+                )
+            self.pending.update(
+                (table, row_id) for table, row_id in rows if table in ("peak", "route")
+            )
+
+    def outdated(self) -> bool:
+        """the index is not loaded or is changed by other process"""
+        if not self.loaded or self._stale:
+            return True
+        if time.monotonic() - self._checked < self.check_interval:
+            return False
+        self._checked = time.monotonic()
+        self._stale = tiles_version() != self._version
+        return self._stale
+
+    def refresh(self) -> list | None:
+        """
+        load the index or changed objects
+
+        Returns:
+            list | None: Bounds of changed objects, before and after
+                change, None if the whole index is loaded.
+        """
+        with self._lock:
+            if self.outdated():
+                self.pending.clear()
+                self._version = tiles_version()
+                self._stale = False
+                self._checked = time.monotonic()
+                self.peaks, self.routes = {}, {}
+                self._load_peaks(None)
+                self._load_routes(None)
+                self.loaded = True
+                self._arrays = None
+                return None
+            if not self.pending:
+                return []
+            pending, self.pending = self.pending, set()
+        bounds = []
+        for table, items, load in (
+            ("peak", self.peaks, self._load_peaks),
+            ("route", self.routes, self._load_routes),
+        ):
+            ids = sorted(row_id for _table, row_id in pending if _table == table)
+            for start in range(0, len(ids), LOAD_CHUNK_SIZE):
+                end = start + LOAD_CHUNK_SIZE
+                part = ids[start:end]
+                bounds += [self._bounds(items.pop(row_id)) for row_id in part if row_id in items]
+                load(part)
+                bounds += [self._bounds(items[row_id]) for row_id in part if row_id in items]
+        self._arrays = None
+        return bounds
+
+    @staticmethod
+    def _bounds(item) -> tuple:
+        """bounds of peak or route"""
+        if isinstance(item, _RouteShape):
+            return item.bounds
+        x, y = item[0]
+        return (x, y, x, y)
+
+    def _load_peaks(self, ids: list | None):
+        """load peaks with positions, all of them or by ids"""
+        statement = select(
+            Peak.id, Peak.slug, Peak.name, Peak.height, GeoPoint.latitude, GeoPoint.longitude
+        ).join(GeoPoint, Peak.point_id == GeoPoint.id)
+        if ids is not None:
+            statement = statement.where(Peak.id.in_(ids))
+        with self.engine.connect() as connection:
+            for row in connection.execute(statement):
+                position = mercator([(row.latitude, row.longitude)])[0]
+                properties = {"slug": row.slug, "name": row.name, "height": row.height}
+                self.peaks[row.id] = (tuple(position), properties)
+
+    def _load_routes(self, ids: list | None):
+        """load route tracks from geometry or route points, all of them or by ids"""
+        statement = select(
+            Route.id,
+            Route.slug,
+            Route.name,
+            Route.difficulty,
+            Route.geometry,
+            Route.geometry_levels,
+        )
+        points = (
+            select(RoutePoint.route_id, GeoPoint.latitude, GeoPoint.longitude)
+            .join(GeoPoint, RoutePoint.point_id == GeoPoint.id)
+            .order_by(RoutePoint.route_id, RoutePoint.id)
+        )
+        if ids is not None:
+            statement = statement.where(Route.id.in_(ids))
+            points = points.where(RoutePoint.route_id.in_(ids))
+        with self.engine.connect() as connection:
+            without_geometry = {}
+            for row in connection.execute(statement):
+                properties = {"slug": row.slug, "name": row.name, "difficulty": row.difficulty}
+                if row.geometry:
+                    coordinates = unpack_geometry(row.geometry)
+                    levels = unpack_levels(row.geometry_levels)
+                    self.routes[row.id] = _RouteShape(properties, coordinates, levels)
+                else:
+                    without_geometry[row.id] = properties
+            if not without_geometry:
+                return
+            tracks = {}
+            for row in connection.execute(points):
+                if row.route_id in without_geometry:
+                    tracks.setdefault(row.route_id, []).append((row.latitude, row.longitude))
+            for route_id, track in tracks.items():
+                coordinates = np.array(track, dtype=np.float64)
+                self.routes[route_id] = _RouteShape(without_geometry[route_id], coordinates, None)
+
+    def arrays(self) -> tuple:
+        """ids and positions of peaks, ids and bounds of routes"""
+        with self._lock:
+            if self._arrays is None:
+                peak_ids = np.fromiter(self.peaks, dtype=np.int64, count=len(self.peaks))
+                positions = np.array([item[0] for item in self.peaks.values()]).reshape(-1, 2)
+                route_ids = np.fromiter(self.routes, dtype=np.int64, count=len(self.routes))
+                bounds = np.array([item.bounds for item in self.routes.values()]).reshape(-1, 4)
+                self._arrays = (peak_ids, positions, route_ids, bounds)
+            return self._arrays
+
+    def encode(self, z: int, x: int, y: int) -> bytes:
+        """
+        encode the tile with layers "peaks" and "routes"
+
+        Route lines are simplified by the levels of their vertices for
+        the zoom and clipped to the tile with buffer.
+        """
+        peak_ids, positions, route_ids, route_bounds = self.arrays()
+        minx, miny, maxx, maxy = tile_bounds(z, x, y)
+        layers = []
+
+        inside = (
+            (positions[:, 0] >= minx)
+            & (positions[:, 0] < maxx)
+            & (positions[:, 1] >= miny)
+            & (positions[:, 1] < maxy)
+        )
+        if inside.any():
+            layer = LayerEncoder("peaks")
+            points = np.round(_tile_units(positions[inside], z, x, y)).astype(np.int64)
+            for peak_id, point in zip(peak_ids[inside].tolist(), points.tolist()):
+                if peak_id in self.peaks:
+                    layer.add(peak_id, 1, [[point]], self.peaks[peak_id][1])
+            layers.append(layer)
+
+        minx, miny, maxx, maxy = tile_bounds(z, x, y, BUFFER)
+        crossing = (
+            (route_bounds[:, 0] <= maxx)
+            & (route_bounds[:, 2] >= minx)
+            & (route_bounds[:, 1] <= maxy)
+            & (route_bounds[:, 3] >= miny)
+        )
+        layer = LayerEncoder("routes")
+        for route_id in route_ids[crossing].tolist():
+            shape = self.routes.get(route_id)
+            if shape is None:
+                continue
+            tolerance = zoom_tolerance(z, shape.latitude, app_settings.GEOMETRY_TOLERANCE_PIXELS)
+            points = _tile_units(shape.points[shape.levels > tolerance], z, x, y)
+            lines = [_distinct(part) for part in clip_line(points, -BUFFER, EXTENT + BUFFER)]
+            lines = [line for line in lines if len(line) > 1]
+            if lines:
+                layer.add(route_id, 2, lines, shape.properties)
+        if layer.features:
+            layers.append(layer)
+        return b"".join(_field(3, layer.encode()) for layer in layers)
+
+
+class TileCache:
+    """
+    Encoded tiles in memory (LRU) and on disk (z/x/y.mvt).
+
+    Attributes:
+        directory (str): Directory of the disk cache, None for memory only.
+        max_entries (int): Tiles in memory.
+    """
+
+    def __init__(self, directory: str | None, max_entries: int):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.tiles = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, z: int, x: int, y: int) -> str:
+        """file of the tile"""
+        return os.path.join(self.directory, str(z), str(x), f"{y}.mvt")
+
+    def get(self, z: int, x: int, y: int) -> bytes | None:
+        """get tile from memory or disk"""
+        key = (z, x, y)
+        with self._lock:
+            data = self.tiles.get(key)
+            if data is not None:
+                self.tiles.move_to_end(key)
+                return data
+        if self.directory is None:
+            return None
+        try:
+            with open(self._path(z, x, y), "rb") as _file:
+                data = _file.read()
+        except OSError:
+            return None
+        self._remember(key, data)
+        return data
+
+    def set(self, z: int, x: int, y: int, data: bytes):
+        """store tile in memory and on disk"""
+        self._remember((z, x, y), data)
+        if self.directory is None:
+            return
+        path = self._path(z, x, y)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = f"{path}.{os.getpid()}.{threading.get_ident()}"
+        with open(temporary, "wb") as _file:
+            _file.write(data)
+        os.replace(temporary, path)
+
+    def _remember(self, key: tuple, data: bytes):
+        """put tile to memory"""
+        with self._lock:
+            self.tiles[key] = data
+            self.tiles.move_to_end(key)
+            while len(self.tiles) > self.max_entries:
+                self.tiles.popitem(last=False)
+
+    def clear(self):
+        """drop all tiles, also the ones stored on disk by other processes"""
+        with self._lock:
+            self.tiles.clear()
+        if self.directory is not None:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+    def invalidate(self, bounds: tuple, max_zoom: int):
+        """drop tiles of all zoom levels covering the bounds in mercator"""
+        ranges = [(z, *tile_range(z, bounds)) for z in range(max_zoom + 1)]
+        with self._lock:
+            for key in list(self.tiles):
+                z, x, y = key
+                if z <= max_zoom:
+                    _z, x0, y0, x1, y1 = ranges[z]
+                    if x0 <= x <= x1 and y0 <= y <= y1:
+                        del self.tiles[key]
+        if self.directory is None:
+            return
+        for z, x0, y0, x1, y1 in ranges:
+            zoom_dir = os.path.join(self.directory, str(z))
+            if not os.path.isdir(zoom_dir):
+                continue
+            for column in os.scandir(zoom_dir):
+                if not column.name.isdigit() or not x0 <= int(column.name) <= x1:
+                    continue
+                for tile in os.scandir(column.path):
+                    y = tile.name.split(".")[0]
+                    if y.isdigit() and y0 <= int(y) <= y1:
+                        try:
+                            os.remove(tile.path)
+                        except OSError:
+                            pass
+
+
+class TileService:
+    """
+    Vector tiles of peaks and routes.
+
+    Tiles are built from the index and cached; tiles covering changed
+    objects are dropped from the cache before the next tile is served,
+    all of them when the index is loaded (after start of the process
+    or changes of other processes).
+
+    Attributes:
+        index (TileIndex): Peaks and routes.
+        cache (TileCache): Encoded tiles.
+        max_zoom (int): Deepest zoom level.
+    """
+
+    def __init__(self, index: TileIndex, cache: TileCache, max_zoom: int):
+        self.index = index
+        self.cache = cache
+        self.max_zoom = max_zoom
+        self._lock = threading.Lock()
+
+    def tile(self, z: int, x: int, y: int) -> bytes:
+        """
+        encoded tile, runs in worker thread
+
+        Cached tiles are returned at once, missing ones are built one
+        at a time, so a tile is not stored after its invalidation.
+        """
+        if not self.index.pending and not self.index.outdated():
+            data = self.cache.get(z, x, y)
+            if data is not None:
+                return data
+        with self._lock:
+            changed = self.index.refresh()
+            if changed is None:
+                self.cache.clear()
+            for bounds in changed or ():
+                self.cache.invalidate(bounds, self.max_zoom)
+            data = self.cache.get(z, x, y)
+            if data is None:
+                data = self.index.encode(z, x, y)
+                self.cache.set(z, x, y, data)
+            return data
+
+
+def create_tile_service(engine: Engine) -> TileService:
+    """tile service with cache in memory, also on disk if TILE_CACHE_DIR is set"""
+    return TileService(
+        TileIndex(engine, app_settings.TILE_CHECK_INTERVAL),
+        TileCache(_CACHE_DIR or None, _CACHE_MAX_ENTRIES),
+        app_settings.TILE_MAX_ZOOM,
+    )
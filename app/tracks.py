@@ -0,0 +1,427 @@
+"""
+GPS tracks
+"""
+
+import math
+import os
+import re
+import xml.etree.ElementTree as ET
+from typing import BinaryIO, Iterable, Iterator, NamedTuple
+from xml.sax.saxutils import escape, quoteattr
+
+from pydantic_core import to_json
+from sqlalchemy import Engine, select
+from sqlalchemy.engine import Connection
+
+from app.geometry import geometry_points
+from app.models.mountains import GeoPoint, Peak, Route, RoutePoint
+
+TRACK_FORMATS = ("gpx", "kml", "geojson")
+# extensions of uploaded files
+TRACK_EXTENSIONS = {".gpx": "gpx", ".kml": "kml", ".geojson": "geojson", ".json": "geojson"}
+READ_SIZE = 64 * 1024
+CHUNK_SIZE = 64 * 1024
+YIELD_PER = 1000
+TRACK_MEDIA_TYPES = {
+    "gpx": "application/gpx+xml",
+    "kml": "application/vnd.google-earth.kml+xml",
+    "geojson": "application/geo+json",
+}
+EARTH_RADIUS = 6371008.8
+
+_JSON_TOKEN = re.compile(
+    rb'\s*("(?:[^"\\]|\\.)*"|[\[\]{}:,]|-?[0-9][0-9.eE+-]*|true|false|null)'
+)
+
+
+class TrackPoint(NamedTuple):
+    """point of exported track"""
+
+    latitude: float
+    longitude: float
+    description: str | None
+
+
+def track_format(filename: str | None, format: str | None = None) -> str | None:
+    """format of the track given explicitly or by extension of the file"""
+    if format:
+        return format if format in TRACK_FORMATS else None
+    _, ext = os.path.splitext(filename or "")
+    return TRACK_EXTENSIONS.get(ext.lower())
+
+
+def _local(tag: str) -> str:
+    """tag without namespace"""
+    return tag.rsplit("}", 1)[-1]
+
+
+def _elements(file: BinaryIO, names: tuple) -> Iterator[tuple[ET.Element, str | None]]:
+    """
+    complete elements with the names and names of their parents,
+    parsed incrementally
+
+    Every element is detached from its parent after it is handled,
+    so the tree does not grow with the document.
+    """
+    stack = []
+    for event, element in ET.iterparse(file, events=("start", "end")):
+        if event == "start":
+            stack.append(element)
+            continue
+        stack.pop()
+        if _local(element.tag) in names:
+            yield element, _local(stack[-1].tag) if stack else None
+        if stack:
+            stack[-1].remove(element)
+
+
+def _coordinate(value) -> float:
+    """coordinate of the track. Raise ValueError if it is missing"""
+    if value is None:
+        raise ValueError("Missing coordinate")
+    return float(value)
+
+
+def gpx_points(file: BinaryIO) -> Iterator[tuple[float, float]]:
+    """
+    latitude and longitude of GPX track points
+
+    Route points (rtept) are read if the file starts with a route,
+    points of the other kind are skipped.
+    """
+    kind = None
+    for element, _parent in _elements(file, ("trkpt", "rtept")):
+        name = _local(element.tag)
+        kind = kind or name
+        if name == kind:
+            yield _coordinate(element.get("lat")), _coordinate(element.get("lon"))
+
+
+def kml_points(file: BinaryIO) -> Iterator[tuple[float, float]]:
+    """
+    latitude and longitude of KML line strings and gx:Track
+
+    Coordinates of Point placemarks (waypoints) are skipped.
+    """
+    for element, parent in _elements(file, ("coordinates", "coord")):
+        if _local(element.tag) == "coord":
+            lon, lat = (element.text or "").split()[:2]
+            yield float(lat), float(lon)
+        elif parent == "LineString":
+            for position in (element.text or "").split():
+                lon, lat = position.split(",")[:2]
+                yield float(lat), float(lon)
+
+
+def _json_tokens(file: BinaryIO) -> Iterator[bytes]:
+    """tokens of json document read by chunks"""
+    buffer = b""
+    eof = False
+    while not eof:
+        chunk = file.read(READ_SIZE)
+        eof = not chunk
+        buffer += chunk
+        pos = 0
+        while True:
+            match = _JSON_TOKEN.match(buffer, pos)
+            # token touching the end of the buffer may be incomplete
+            if match is None or (match.end() == len(buffer) and not eof):
+                break
+            pos = match.end()
+            yield match.group(1)
+        buffer = buffer[pos:]
+    if buffer.strip():
+        raise ValueError("Invalid json")
+
+
+def geojson_points(file: BinaryIO) -> Iterator[tuple[float, float]]:
+    """
+    latitude and longitude of GeoJSON lines
+
+    The document is scanned by tokens: positions of "coordinates"
+    nested at least two levels deep (LineString, MultiLineString,
+    Polygon) are yielded, coordinates of Point features are skipped.
+    """
+    # nesting of arrays inside "coordinates", None outside of them
+    depth = None
+    key = None
+    position = []
+    for token in _json_tokens(file):
+        if depth is None:
+            if token == b"[" and key == b'"coordinates"':
+                depth = 1
+            elif token[:1] == b'"':
+                key = token
+            elif token in (b",", b"{", b"}"):
+                key = None
+            continue
+        if token == b"[":
+            depth += 1
+            position = []
+        elif token == b"]":
+            if position and depth >= 2:
+                if len(position) < 2:
+                    raise ValueError("Invalid position")
+                yield position[1], position[0]
+            position = []
+            depth -= 1
+            if depth == 0:
+                depth = key = None
+        elif token != b",":
+            position.append(float(token))
+    if depth is not None:
+        raise ValueError("Invalid json")
+
+
+def read_track(file: BinaryIO, format: str) -> Iterator[tuple[float, float]]:
+    """
+    points of the track in GPX, KML or GeoJSON
+
+    Raises:
+        ValueError: The track has no points (after all of them are read).
+    """
+    readers = {"gpx": gpx_points, "kml": kml_points, "geojson": geojson_points}
+    empty = True
+    for point in readers[format](file):
+        empty = False
+        yield point
+    if empty:
+        raise ValueError("No points in the track")
+
+
+def _meters(origin: tuple, point: tuple) -> tuple[float, float]:
+    """point projected to plane with origin, in meters"""
+    scale = math.radians(EARTH_RADIUS)
+    return (
+        (point[1] - origin[1]) * scale * math.cos(math.radians(origin[0])),
+        (point[0] - origin[0]) * scale,
+    )
+
+
+def _wrap(angle: float) -> float:
+    """angle in range -pi..pi"""
+    return (angle + math.pi) % (2 * math.pi) - math.pi
+
+
+def simplify(points: Iterable[tuple], tolerance: float) -> Iterator[tuple]:
+    """
+    Simplify the track on the fly (sleeve fitting).
+
+    From the last kept point the track goes in a sector of directions
+    which keeps every passed point within tolerance of the line. The
+    sector narrows with each point, the point outside of it starts
+    new line from the previous one. Every point is handled once and
+    nothing but the sector is held, so the time is linear and the
+    memory does not depend on the length of the track.
+
+    Args:
+        points: Latitude and longitude pairs.
+        tolerance (float): Allowed deviation in meters, 0 keeps all points.
+
+    Returns:
+        Iterator[tuple]: Kept points, the first and the last included.
+    """
+    anchor = previous = None
+    sector = None
+    for point in points:
+        if anchor is None or tolerance <= 0:
+            anchor = point
+            yield point
+            continue
+        x, y = _meters(anchor, point)
+        distance = math.hypot(x, y)
+        if distance > tolerance:
+            angle = math.atan2(y, x)
+            spread = math.asin(tolerance / distance)
+            if sector is None:
+                sector = (angle, -spread, spread)
+            else:
+                base, low, high = sector
+                offset = _wrap(angle - base)
+                if low <= offset <= high:
+                    sector = (base, max(low, offset - spread), min(high, offset + spread))
+                else:
+                    anchor = previous
+                    yield anchor
+                    x, y = _meters(anchor, point)
+                    distance = math.hypot(x, y)
+                    sector = None
+                    if distance > tolerance:
+                        spread = math.asin(tolerance / distance)
+                        sector = (math.atan2(y, x), -spread, spread)
+        previous = point
+    if previous is not None and previous is not anchor:
+        yield previous
+
+
+def _text(value) -> str:
+    """escaped text of xml element"""
+    return escape(str(value))
+
+
+def gpx_parts(name: str, peaks: Iterable, tracks: Iterable) -> Iterator[str]:
+    """GPX document: peaks as waypoints, routes as tracks"""
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield '<gpx version="1.1" creator="carpaty" xmlns="http://www.topografix.com/GPX/1/1">\n'
+    yield f"<metadata><name>{_text(name)}</name></metadata>\n"
+    for peak in peaks:
+        yield f"<wpt lat={quoteattr(str(peak.latitude))} lon={quoteattr(str(peak.longitude))}>"
+        if peak.height is not None:
+            yield f"<ele>{peak.height}</ele>"
+        yield f"<name>{_text(peak.name)}</name></wpt>\n"
+    for route, points in tracks:
+        yield f"<trk><name>{_text(route.name)}</name>"
+        if route.short_description:
+            yield f"<desc>{_text(route.short_description)}</desc>"
+        yield "<trkseg>\n"
+        for point in points:
+            yield f'<trkpt lat="{point.latitude}" lon="{point.longitude}">'
+            if point.description:
+                yield f"<name>{_text(point.description)}</name>"
+            yield "</trkpt>\n"
+        yield "</trkseg></trk>\n"
+    yield "</gpx>\n"
+
+
+def kml_parts(name: str, peaks: Iterable, tracks: Iterable) -> Iterator[str]:
+    """KML document: peaks as points, routes as line strings"""
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield '<kml xmlns="http://www.opengis.net/kml/2.2"><Document>\n'
+    yield f"<name>{_text(name)}</name>\n"
+    for peak in peaks:
+        yield f"<Placemark><name>{_text(peak.name)}</name><Point><coordinates>"
+        yield f"{peak.longitude},{peak.latitude},{peak.height or 0}"
+        yield "</coordinates></Point></Placemark>\n"
+    for route, points in tracks:
+        yield f"<Placemark><name>{_text(route.name)}</name>"
+        if route.short_description:
+            yield f"<description>{_text(route.short_description)}</description>"
+        yield "<LineString><coordinates>\n"
+        for point in points:
+            yield f"{point.longitude},{point.latitude}\n"
+        yield "</coordinates></LineString></Placemark>\n"
+    yield "</Document></kml>\n"
+
+
+def geojson_parts(name: str, peaks: Iterable, tracks: Iterable) -> Iterator[str]:
+    """GeoJSON feature collection: peaks as points, routes as line strings"""
+    yield f'{{"type":"FeatureCollection","name":{to_json(name).decode()},"features":['
+    separator = "\n"
+    for peak in peaks:
+        properties = {"kind": "peak", "slug": peak.slug, "name": peak.name, "height": peak.height}
+        yield (
+            f'{separator}{{"type":"Feature","properties":{to_json(properties).decode()},'
+            f'"geometry":{{"type":"Point","coordinates":[{peak.longitude},{peak.latitude}]}}}}'
+        )
+        separator = ",\n"
+    for route, points in tracks:
+        properties = {
+            "kind": "route",
+            "slug": route.slug,
+            "name": route.name,
+            "difficulty": route.difficulty,
+        }
+        yield (
+            f'{separator}{{"type":"Feature","properties":{to_json(properties).decode()},'
+            '"geometry":{"type":"LineString","coordinates":['
+        )
+        comma = ""
+        for point in points:
+            yield f"{comma}[{point.longitude},{point.latitude}]"
+            comma = ","
+        yield "]}}"
+        separator = ",\n"
+    yield "\n]}\n"
+
+
+TRACK_WRITERS = {"gpx": gpx_parts, "kml": kml_parts, "geojson": geojson_parts}
+
+
+def _chunks(parts: Iterable[str], chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """parts of the document joined into chunks of about chunk_size bytes"""
+    buffer = []
+    size = 0
+    for part in parts:
+        buffer.append(part)
+        size += len(part)
+        if size >= chunk_size:
+            yield "".join(buffer).encode()
+            buffer = []
+            size = 0
+    if buffer:
+        yield "".join(buffer).encode()
+
+
+def route_points(connection: Connection, route) -> Iterator[TrackPoint]:
+    """
+    points of the route: its packed geometry, or its route points
+    fetched by YIELD_PER if there is no geometry
+    """
+    if route.has_geometry:
+        geometry = connection.execute(select(Route.geometry).where(Route.id == route.id)).scalar()
+        for latitude, longitude in geometry_points(geometry):
+            yield TrackPoint(latitude, longitude, None)
+        return
+    rows = connection.execute(
+        select(GeoPoint.latitude, GeoPoint.longitude, RoutePoint.description)
+        .join(GeoPoint, RoutePoint.point_id == GeoPoint.id)
+        .where(RoutePoint.route_id == route.id)
+        .order_by(RoutePoint.id)
+        .execution_options(yield_per=YIELD_PER)
+    )
+    for row in rows:
+        yield TrackPoint(*row)
+
+
+def route_tracks(connection: Connection, where) -> Iterator[tuple]:
+    """
+    routes matching the condition with iterators of their points
+
+    Routes are selected at once (there are a few of them even for
+    a ridge), points of each route are read by its iterator, which
+    must be consumed before the next one.
+    """
+    routes = connection.execute(
+        select(
+            Route.id,
+            Route.slug,
+            Route.name,
+            Route.short_description,
+            Route.difficulty,
+            Route.geometry.is_not(None).label("has_geometry"),
+        )
+        .outerjoin(Peak, Route.peak_id == Peak.id)
+        .where(where)
+        .order_by(Route.id)
+    ).all()
+    for route in routes:
+        yield route, route_points(connection, route)
+
+
+def export_tracks(engine: Engine, format: str, name: str, routes_where, peaks_where):
+    """
+    Export routes with points and peaks in GPX, KML or GeoJSON.
+
+    The document is written while the points are fetched, so the
+    memory does not depend on the number of points.
+
+    Args:
+        engine (Engine): Database engine, the export has own connection
+            which lives as long as the generator.
+        format (str): gpx, kml or geojson.
+        name (str): Name of the document.
+        routes_where: Condition on Route and Peak for exported routes.
+        peaks_where: Condition on Peak for exported peaks (waypoints).
+
+    Returns:
+        Iterator[bytes]: Chunks of the document.
+    """
+    with engine.connect() as connection:
+        peaks = connection.execute(
+            select(Peak.slug, Peak.name, Peak.height, GeoPoint.latitude, GeoPoint.longitude)
+            .join(GeoPoint, Peak.point_id == GeoPoint.id)
+            .where(peaks_where)
+            .order_by(Peak.id)
+        ).all()
+        parts = TRACK_WRITERS[format](name, peaks, route_tracks(connection, routes_where))
+        yield from _chunks(parts)